@@ -0,0 +1,191 @@
+"""Асинхронное выполнение действий вне потоков ввода.
+
+Колбэк CGEventTap и колбэк кадров MultitouchSupport должны возвращаться
+мгновенно: macOS отключает медленный tap, а пока колбэк работает, все
+нажатия пользователя ждут. Поэтому слушатели только ставят действие
+в ограниченную очередь (O(1)), а выполняют его рабочие потоки.
+
+Переполнение очереди (overflow):
+  - 'drop_new'    — новое действие отбрасывается (по умолчанию);
+  - 'drop_oldest' — вытесняется самое старое ожидающее действие;
+  - 'block'       — ждать свободного места не дольше block_timeout.
+
+Лимиты параллельности по типу действия (limits) ограничивают число
+одновременно выполняемых действий одного типа. Лишние действия этого типа
+откладываются и запускаются по мере освобождения, не занимая рабочие
+потоки ожиданием; порядок внутри типа сохраняется.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import collections
+from typing import Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger("hotkeymaster.action_executor")
+
+OVERFLOW_POLICIES = ('drop_new', 'drop_oldest', 'block')
+
+# Яркость и эмуляция клавиш должны идти строго по порядку, модальное сообщение — одно за раз
+DEFAULT_LIMITS = {'brightness': 1, 'hotkey': 1, 'message': 1}
+
+
+def action_kind(action: str) -> str:
+    """Тип действия по префиксу строки (совпадает с ветками actions.run_action)."""
+    if action.startswith('brightness'):
+        return 'brightness'
+    if action.startswith('hotkey:'):
+        return 'hotkey'
+    if action.startswith('message:'):
+        return 'message'
+    if action.startswith('open_app '):
+        return 'open_app'
+    if action.startswith('open '):
+        return 'open'
+    if action.startswith('run '):
+        return 'run'
+    return 'other'
+
+
+class ActionExecutor:
+    def __init__(self, run_func: Callable[[str], None], *, workers: int = 2, maxsize: int = 64,
+                 overflow: str = 'drop_new', limits: Optional[Dict[str, int]] = None,
+                 block_timeout: float = 0.05):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {overflow}")
+        self._run_func = run_func
+        self._workers_count = max(1, int(workers))
+        self.maxsize = max(1, int(maxsize))
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self._queue: Deque[str] = collections.deque()
+        self._deferred: Dict[str, Deque[str]] = {}
+        self._running: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)    # есть что выполнять / остановка
+        self._space = threading.Condition(self._lock)   # освободилось место / очередь опустела
+        self._threads = []
+        self._stopping = False
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+
+    # ---------------- публичный API ----------------
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping = False
+            for i in range(self._workers_count):
+                t = threading.Thread(target=self._worker, name=f"ActionWorker-{i}", daemon=True)
+                self._threads.append(t)
+                t.start()
+
+    def stop(self, timeout: float = 1.0):
+        with self._lock:
+            self._stopping = True
+            self._work.notify_all()
+            self._space.notify_all()
+            threads, self._threads = self._threads, []
+        for t in threads:
+            t.join(timeout=timeout)
+
+    def drain(self) -> List[str]:
+        """Забирает ещё не начатые действия (отложенные, затем очередь) — для передачи
+        новому исполнителю при перенастройке. Выполняемые сейчас действия не затрагиваются."""
+        with self._lock:
+            pending = [a for q in self._deferred.values() for a in q]
+            pending.extend(self._queue)
+            self._deferred.clear()
+            self._queue.clear()
+            self._space.notify_all()
+        return pending
+
+    def submit(self, action: str) -> bool:
+        """Ставит действие в очередь. Возвращает False, если оно отброшено."""
+        if not action:
+            return False
+        with self._lock:
+            if len(self._queue) + self._deferred_count() >= self.maxsize:
+                if self.overflow == 'drop_oldest' and self._queue:
+                    old = self._queue.popleft()
+                    self.dropped += 1
+                    logger.warning(f"Очередь действий переполнена, вытеснено: {old}")
+                elif self.overflow == 'block' and self._space.wait_for(
+                        lambda: len(self._queue) + self._deferred_count() < self.maxsize or self._stopping,
+                        self.block_timeout) and not self._stopping:
+                    pass
+                else:
+                    self.dropped += 1
+                    logger.warning(f"Очередь действий переполнена, отброшено: {action}")
+                    return False
+            self._queue.append(action)
+            self.submitted += 1
+            self._work.notify()
+        return True
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._queue) + self._deferred_count()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Ждать, пока все поставленные действия выполнятся (для тестов и завершения)."""
+        with self._lock:
+            return self._space.wait_for(
+                lambda: not self._queue and not self._deferred_count() and not any(self._running.values()),
+                timeout)
+
+    # ---------------- внутреннее ----------------
+    def _deferred_count(self) -> int:
+        return sum(len(q) for q in self._deferred.values())
+
+    def _take_locked(self) -> Optional[str]:
+        """Следующее действие, которое можно выполнить с учётом лимитов типов."""
+        while self._queue:
+            action = self._queue.popleft()
+            kind = action_kind(action)
+            limit = self.limits.get(kind)
+            if limit is not None and self._running.get(kind, 0) >= limit:
+                self._deferred.setdefault(kind, collections.deque()).append(action)
+                continue
+            self._running[kind] = self._running.get(kind, 0) + 1
+            self._space.notify_all()
+            return action
+        return None
+
+    def _finish_locked(self, action: str) -> Optional[str]:
+        """Освобождает слот типа и сразу берёт отложенное действие того же типа."""
+        kind = action_kind(action)
+        self._running[kind] -= 1
+        self.completed += 1
+        deferred = self._deferred.get(kind)
+        if deferred:
+            self._running[kind] += 1
+            action = deferred.popleft()
+        else:
+            action = None
+        self._space.notify_all()
+        return action
+
+    def _worker(self):
+        action = None
+        while True:
+            if action is None:
+                with self._lock:
+                    while True:
+                        if self._stopping:
+                            return
+                        action = self._take_locked()
+                        if action is not None:
+                            break
+                        self._work.wait()
+            try:
+                self._run_func(action)
+            except Exception as e:
+                logger.error(f"Ошибка выполнения действия {action!r}: {e}")
+            with self._lock:
+                action = self._finish_locked(action)
+
+
+__all__ = ['ActionExecutor', 'action_kind', 'OVERFLOW_POLICIES', 'DEFAULT_LIMITS']
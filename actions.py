@@ -3,26 +3,27 @@
 Содержит единые реализации:
  - get_active_app_name
  - run_action (open / run / hotkey: / message: / brightness_*)
- - управление яркостью (helper бинарь / CoreDisplay / IOKit fallback / файл cache)
+ - управление яркостью (механизм выбирает brightness.BrightnessResolver / файл cache)
 
 Важно: модуль не должен тянуть PyQt5 на импорт, кроме случая message: (ленивая загрузка).
 """
 from __future__ import annotations
 
 import os
-import sys
 import json
 import logging
 import subprocess
-import ctypes
-import ctypes.util
+import threading
+
+from modifiers import parse_mods, mask_to_names, to_cg_flags
 
 logger = logging.getLogger("hotkeymaster.actions")
 
 # ---------------------------------------------------------------------------
 # Active app helper
 # ---------------------------------------------------------------------------
-def get_active_app_name():
+def query_active_app_name():
+    """Скан окон через CGWindowListCopyWindowInfo — дорого, только как запасной вариант."""
     try:
         import Quartz
         ws = Quartz.CGWindowListCopyWindowInfo(Quartz.kCGWindowListOptionOnScreenOnly, Quartz.kCGNullWindowID)
@@ -33,6 +34,12 @@ def get_active_app_name():
         logger.debug(f"Не удалось получить активное приложение: {e}")
     return None
 
+def get_active_app_name():
+    # Имя берётся из событийного кэша frontmost_app (без скана окон на каждый вызов)
+    from frontmost_app import get_tracker
+    info = get_tracker().current()
+    return info.name if info else None
+
 # ---------------------------------------------------------------------------
 # Brightness helpers
 # ---------------------------------------------------------------------------
@@ -40,99 +47,16 @@ _last_brightness_cache_path = os.path.join(
     os.path.expanduser('~'), 'Library', 'Application Support', 'HotkeyMaster', 'last_brightness.json'
 )
 
-def _get_helper_path():
-    # В дев-режиме helper ожидается рядом со скриптом, в frozen — рядом с binary
-    if getattr(sys, 'frozen', False):
-        base = os.path.dirname(sys.executable)
-    else:
-        base = os.path.dirname(__file__)
-    return os.path.join(base, 'coredisplay_helper')
-
-def _core_display_func():
-    """Попытка получить CoreDisplay_Display_SetUserBrightness функцию или None."""
-    try:
-        import CoreDisplay as _cd  # type: ignore
-        return _cd.CoreDisplay_Display_SetUserBrightness
-    except Exception:
-        pass
-    lib = ctypes.util.find_library('CoreDisplay')
-    if lib:
-        try:
-            cd = ctypes.cdll.LoadLibrary(lib)
-            fn = getattr(cd, 'CoreDisplay_Display_SetUserBrightness', None)
-            if fn:
-                fn.argtypes = [ctypes.c_uint32, ctypes.c_float]
-                fn.restype = ctypes.c_int
-                return fn
-        except Exception:
-            return None
-    # Явные пути
-    for p in [
-        '/System/Library/PrivateFrameworks/CoreDisplay.framework/CoreDisplay',
-        '/System/Library/PrivateFrameworks/CoreDisplay.framework/Versions/A/CoreDisplay'
-    ]:
-        if os.path.exists(p):
-            try:
-                cd = ctypes.cdll.LoadLibrary(p)
-                fn = getattr(cd, 'CoreDisplay_Display_SetUserBrightness', None)
-                if fn:
-                    fn.argtypes = [ctypes.c_uint32, ctypes.c_float]
-                    fn.restype = ctypes.c_int
-                    return fn
-            except Exception:
-                continue
-    return None
-
-_core_display_set = _core_display_func()
-
-def _io_kit_set(val: float) -> bool:
-    """Минимальный fallback через IOKit (Best effort). Возвращает успех."""
-    try:
-        # Используем DisplayServicesSetBrightness если доступна
-        handle_ds = ctypes.cdll.LoadLibrary('/System/Library/PrivateFrameworks/DisplayServices.framework/DisplayServices')
-        fn = getattr(handle_ds, 'DisplayServicesSetBrightness', None)
-        if not fn:
-            return False
-        fn.argtypes = [ctypes.c_uint32, ctypes.c_float]
-        fn.restype = ctypes.c_int
-        from Quartz import CGMainDisplayID  # type: ignore
-        disp = CGMainDisplayID()
-        res = fn(disp, ctypes.c_float(val))
-        return res == 0
-    except Exception:
-        return False
-
 def set_display_brightness(val: float) -> bool:
+    """Установить яркость механизмом, выбранным brightness.get_resolver() (helper /
+    CoreDisplay / DisplayServices). Значение запоминается в cache в любом случае."""
     val = max(0.0, min(1.0, float(val)))
-    helper = _get_helper_path()
-    # 1. Helper binary
-    if os.path.exists(helper) and os.access(helper, os.X_OK):
-        try:
-            r = subprocess.run([helper, str(val)], check=True, capture_output=True, text=True)
-            logger.debug(f"helper stdout={r.stdout.strip()} stderr={r.stderr.strip()}")
-            _persist_last_brightness(val)
-            return True
-        except Exception as e:
-            logger.warning(f"Helper brightness ошибка: {e}")
-    # 2. CoreDisplay
-    if _core_display_set:
-        try:
-            from Quartz import CGMainDisplayID  # type: ignore
-            disp = CGMainDisplayID()
-            res = _core_display_set(disp, ctypes.c_float(val))
-            if res == 0:
-                _persist_last_brightness(val)
-                return True
-            logger.warning(f"CoreDisplay возвратил код {res}")
-        except Exception as e:
-            logger.debug(f"CoreDisplay set fail: {e}")
-    # 3. IOKit / DisplayServices fallback
-    if _io_kit_set(val):
-        _persist_last_brightness(val)
-        return True
-    # 4. Cache only
+    from brightness import get_resolver
+    ok = get_resolver().set(val)
     _persist_last_brightness(val)
-    return False
+    if _brightness_controller is not None:
+        _brightness_controller.assume(val)
+    return ok
 
 def _persist_last_brightness(val: float):
     try:
@@ -142,7 +66,7 @@ def _persist_last_brightness(val: float):
     except Exception:
         pass
 
-def get_display_brightness() -> float:
+def _read_last_brightness() -> float:
     # Мы не имеем простой публичной API чтения; используем cache
     try:
         if os.path.exists(_last_brightness_cache_path):
@@ -154,6 +78,25 @@ def get_display_brightness() -> float:
         pass
     return 0.5
 
+def get_display_brightness() -> float:
+    # Пока работает контроллер яркости, значение берётся из памяти, а не из cache
+    if _brightness_controller is not None:
+        return _brightness_controller.target
+    return _read_last_brightness()
+
+# Контроллер плавной яркости для brightness_* действий: создаётся при первом из них
+_brightness_controller = None
+_brightness_controller_lock = threading.Lock()
+
+def get_brightness_controller():
+    global _brightness_controller
+    with _brightness_controller_lock:
+        if _brightness_controller is None:
+            from brightness import BrightnessController, get_resolver
+            _brightness_controller = BrightnessController(
+                lambda v: get_resolver().set(v), _read_last_brightness, on_settled=_persist_last_brightness)
+        return _brightness_controller
+
 # ---------------------------------------------------------------------------
 # run_action
 # ---------------------------------------------------------------------------
@@ -220,21 +163,14 @@ def run_action(action: str):
         if action.startswith('hotkey:'):
             try:
                 combo = json.loads(action[7:])
-                mods = set(combo.get('mods', []))
+                mask = parse_mods(combo.get('mods', []), ignore_unknown=True)
                 vk = combo.get('vk')
                 if vk is None:
                     logger.debug('Эмуляция хоткея: vk отсутствует')
                     return
-                logger.debug(f"Эмуляция хоткея mods={mods} vk={vk}")
-                from Quartz import (
-                    CGEventCreateKeyboardEvent, CGEventSetFlags, CGEventPost, kCGHIDEventTap,
-                    kCGEventFlagMaskCommand, kCGEventFlagMaskShift, kCGEventFlagMaskAlternate, kCGEventFlagMaskControl
-                )
-                flags = 0
-                if 'Cmd' in mods: flags |= kCGEventFlagMaskCommand
-                if 'Shift' in mods: flags |= kCGEventFlagMaskShift
-                if 'Alt' in mods: flags |= kCGEventFlagMaskAlternate
-                if 'Ctrl' in mods: flags |= kCGEventFlagMaskControl
+                logger.debug(f"Эмуляция хоткея mods={mask_to_names(mask)} vk={vk}")
+                from Quartz import CGEventCreateKeyboardEvent, CGEventSetFlags, CGEventPost, kCGHIDEventTap
+                flags = to_cg_flags(mask)
                 for down in (True, False):
                     ev = CGEventCreateKeyboardEvent(None, vk, down)
                     CGEventSetFlags(ev, flags)
@@ -242,23 +178,22 @@ def run_action(action: str):
             except Exception as e:
                 logger.error(f"Ошибка эмуляции хоткея: {e}")
             return
+        # Яркость меняется плавно контроллером: под автоповтором нажатия только двигают цель
         if action.startswith('brightness_set '):
             try:
                 percent = int(action.split()[1])
                 logger.debug(f"Установка яркости: {percent}%")
-                set_display_brightness(percent / 100.0)
+                get_brightness_controller().set_target(percent / 100.0)
             except Exception as e:
                 logger.error(f"Ошибка установки яркости: {e}")
             return
         if action == 'brightness_up':
-            cur = get_display_brightness()
             logger.debug("Повышение яркости на +10%")
-            set_display_brightness(min(1.0, cur + 0.1))
+            get_brightness_controller().step(0.1)
             return
         if action == 'brightness_down':
-            cur = get_display_brightness()
             logger.debug("Понижение яркости на -10%")
-            set_display_brightness(max(0.0, cur - 0.1))
+            get_brightness_controller().step(-0.1)
             return
         logger.warning(f"Неизвестное действие: {action}")
     except Exception as e:
@@ -266,7 +201,9 @@ def run_action(action: str):
 
 __all__ = [
     'get_active_app_name',
+    'query_active_app_name',
     'run_action',
     'get_display_brightness',
-    'set_display_brightness'
+    'set_display_brightness',
+    'get_brightness_controller',
 ]
@@ -0,0 +1,293 @@
+"""Профили правил по приложениям с ленивой загрузкой.
+
+hotkeys.json — глобальный профиль. Рядом может лежать каталог profiles/ с
+файлами <bundle id>.json или <имя приложения>.json: список правил в формате
+hotkeys.json, действующих только в этом приложении (scope/app проставляются
+по имени файла). Разбираются и компилируются только глобальный профиль и
+профиль активного приложения: файл читается при первой активации приложения,
+последние PROFILE_CACHE_SIZE профилей держатся в LRU, остальные вытесняются.
+Память и стоимость перезагрузки растут с числом используемых приложений,
+а не с размером всей библиотеки правил.
+
+Таблица приложения (RuleTable) — правила профиля вместе с его app-правилами
+из hotkeys.json поверх глобальных. Она пересобирается при публикации нового
+снимка и при изменении файла профиля (сигнатура сверяется при активации).
+Профиль ищется по точному bundle ID, затем по точному имени приложения.
+
+Правила профилей видны через hotkey_engine.get_rule_repository() (get, list —
+значит, в окне настроек и в проверке конфликтов) и правятся там же по id:
+изменение переписывает только файл своего профиля (edit_profile). Новые
+правила и транзакции относятся к hotkeys.json.
+
+Разделить существующий hotkeys.json на глобальный профиль и профили приложений:
+    python app_profiles.py split hotkeys.json profiles/
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from rules import Rule, RuleSnapshot, RuleTable
+from frontmost_app import AppInfo
+from config_watcher import Signature, file_signature
+
+logger = logging.getLogger("hotkeymaster.app_profiles")
+
+PROFILE_SUFFIX = '.json'
+PROFILE_CACHE_SIZE = 8
+_UNSET = object()
+
+
+def profiles_dir_for(json_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(json_path)), 'profiles')
+
+
+def profile_name_for(app: str) -> str:
+    """Имя файла профиля (без расширения) для bundle ID или имени приложения."""
+    name = app.strip().replace('/', '_').replace(os.sep, '_')
+    return name.lstrip('.')
+
+
+def _read_profile(path: str) -> List[Any]:
+    with open(path, 'rb') as f:
+        data = json.loads(f.read().decode('utf-8'))
+    if not isinstance(data, list):
+        raise ValueError(f'{path}: ожидается список правил')
+    return data
+
+
+def _with_id(path: str, i: int, hk: Dict[str, Any]) -> Dict[str, Any]:
+    if isinstance(hk.get('id'), str) and hk['id']:
+        return hk
+    return {**hk, 'id': f'{os.path.basename(path)[:-len(PROFILE_SUFFIX)]}#{i}'}
+
+
+def load_profile(path: str) -> Tuple[Rule, ...]:
+    """Правила файла профиля. Правила без id получают стабильный id «профиль#номер»."""
+    stem = os.path.basename(path)[:-len(PROFILE_SUFFIX)]
+    rules = []
+    for i, hk in enumerate(_read_profile(path)):
+        if not isinstance(hk, dict):
+            continue
+        hk = {**_with_id(path, i, hk), 'scope': 'app'}
+        if not hk.get('app') and not hk.get('bundle_id'):
+            hk['app'] = stem
+        rules.append(Rule.from_dict(hk))
+    return tuple(rules)
+
+
+def edit_profile(path: str, rule_id: str, change: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]) -> bool:
+    """Изменить правило файла профиля по id: change(запись) возвращает новую запись
+    или None (удалить). Id, назначенные при загрузке, записываются в файл — после
+    удаления соседнего правила они не сдвигаются. False — такого id в файле нет."""
+    data = _read_profile(path)
+    found = False
+    out = []
+    for i, hk in enumerate(data):
+        if isinstance(hk, dict):
+            hk = _with_id(path, i, hk)
+            if hk['id'] == rule_id and not found:
+                found = True
+                hk = change(hk)
+                if hk is None:
+                    continue
+        out.append(hk)
+    if found:
+        _write_json(path, out)
+    return found
+
+
+@dataclass(slots=True)
+class _Profile:
+    signature: Signature
+    rules: Tuple[Rule, ...]
+    # Скомпилированная таблица и ключ, для которого она собрана: (поколение снимка, id app-правил)
+    table_key: Optional[Tuple[int, Tuple[str, ...]]] = None
+    table: Optional[RuleTable] = None
+
+
+class AppProfiles:
+    """LRU разобранных профилей и их таблиц. Потокобезопасен (своя блокировка)."""
+
+    def __init__(self, directory: str, capacity: int = PROFILE_CACHE_SIZE):
+        self.directory = directory
+        self.capacity = max(1, int(capacity))
+        self._lock = threading.Lock()
+        self._dir_signature: Any = _UNSET
+        self._paths: Dict[str, str] = {}  # имя профиля -> путь
+        self._cache: 'OrderedDict[str, _Profile]' = OrderedDict()
+        self.loads = 0
+        self.evictions = 0
+
+    def _refresh_paths_locked(self):
+        """Список файлов каталога перечитывается, только если изменилась сигнатура каталога."""
+        sig = file_signature(self.directory)
+        if sig == self._dir_signature:
+            return
+        self._dir_signature = sig
+        try:
+            entries = os.listdir(self.directory) if sig is not None else []
+        except OSError:
+            entries = []
+        self._paths = {e[:-len(PROFILE_SUFFIX)]: os.path.join(self.directory, e) for e in entries
+                       if e.endswith(PROFILE_SUFFIX) and not e.startswith('.')}
+
+    def path_for(self, info: Union[AppInfo, str, None]) -> Optional[str]:
+        if info is None:
+            return None
+        if isinstance(info, str):
+            info = AppInfo(info)
+        with self._lock:
+            return self._path_for_locked(info)
+
+    def _path_for_locked(self, info: AppInfo) -> Optional[str]:
+        self._refresh_paths_locked()
+        if not self._paths:
+            return None
+        for key in (info.bundle_id, info.name):
+            if key:
+                path = self._paths.get(profile_name_for(key))
+                if path is not None:
+                    return path
+        return None
+
+    def _get_locked(self, path: str) -> Optional[_Profile]:
+        sig = file_signature(path)
+        prof = self._cache.get(path)
+        if prof is not None and prof.signature == sig:
+            self._cache.move_to_end(path)
+            return prof
+        try:
+            rules = load_profile(path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ошибка чтения профиля {path}: {e}")
+            self._cache.pop(path, None)
+            return None
+        prof = self._cache[path] = _Profile(sig, rules)
+        self._cache.move_to_end(path)
+        self.loads += 1
+        while len(self._cache) > self.capacity:
+            evicted, _ = self._cache.popitem(last=False)
+            self.evictions += 1
+            logger.debug(f"[profiles] вытеснен {evicted}")
+        return prof
+
+    def table_for(self, snap: RuleSnapshot, info: Union[AppInfo, str, None]) -> RuleTable:
+        """Таблица активного приложения: снимок плюс профиль приложения, если он есть."""
+        base = snap.table_for(info)
+        if info is None:
+            return base
+        if isinstance(info, str):
+            info = AppInfo(info)
+        with self._lock:
+            path = self._path_for_locked(info)
+            if path is None:
+                return base
+            prof = self._get_locked(path)
+            if prof is None or not prof.rules:
+                return base
+            key = (snap.generation, tuple(r.id for r in base.app_rules))
+            if prof.table is None or prof.table_key != key:
+                prof.table = snap.table_with(base.app_rules + prof.rules)
+                prof.table_key = key
+            return prof.table
+
+    def all_rules(self) -> List[Tuple[str, Tuple[Rule, ...]]]:
+        """(путь, правила) всех профилей каталога — для окна настроек и проверки
+        конфликтов. Профили вне LRU читаются с диска и в LRU не добавляются."""
+        with self._lock:
+            self._refresh_paths_locked()
+            res = []
+            for name in sorted(self._paths):
+                path = self._paths[name]
+                prof = self._cache.get(path)
+                if prof is not None and prof.signature == file_signature(path):
+                    res.append((path, prof.rules))
+                    continue
+                try:
+                    res.append((path, load_profile(path)))
+                except (OSError, ValueError) as e:
+                    logger.error(f"Ошибка чтения профиля {path}: {e}")
+            return res
+
+    def find(self, rule_id: str) -> Optional[Tuple[str, Rule]]:
+        """(путь профиля, правило) по id или None."""
+        for path, rules in self.all_rules():
+            for rule in rules:
+                if rule.id == rule_id:
+                    return path, rule
+        return None
+
+    def cached(self) -> List[str]:
+        """Пути загруженных профилей, от давно использованного к последнему."""
+        with self._lock:
+            return list(self._cache)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._dir_signature = _UNSET
+
+
+def split_hotkeys(hotkeys: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
+    """(глобальные правила, {имя профиля: правила приложения}) — app-правила уходят в профили."""
+    global_rules: List[Dict[str, Any]] = []
+    profiles: Dict[str, List[Dict[str, Any]]] = {}
+    for hk in hotkeys:
+        rule = Rule.from_dict(hk)
+        if rule.is_app_scoped:
+            profiles.setdefault(profile_name_for(rule.bundle_id or rule.app), []).append(hk)
+        else:
+            global_rules.append(hk)
+    return global_rules, profiles
+
+
+def _write_json(path: str, data: Any):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Разделение hotkeys.json на профили приложений HotkeyMaster')
+    parser.add_argument('command', choices=('split',))
+    parser.add_argument('source', help='hotkeys.json (останутся глобальные правила)')
+    parser.add_argument('target', help='каталог профилей')
+    args = parser.parse_args(argv)
+    try:
+        with open(args.source, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            raise ValueError(f'{args.source}: ожидается список правил')
+        global_rules, profiles = split_hotkeys([hk for hk in data if isinstance(hk, dict)])
+        os.makedirs(args.target, exist_ok=True)
+        for name, rules in profiles.items():
+            path = os.path.join(args.target, name + PROFILE_SUFFIX)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    rules = json.load(f) + rules
+            _write_json(path, rules)
+        _write_json(args.source, global_rules)
+    except Exception as e:
+        print(f'Ошибка: {e}', file=sys.stderr)
+        return 2
+    print(f'{len(global_rules)} глобальных правил, профилей: {len(profiles)}')
+    return 0
+
+
+__all__ = [
+    'AppProfiles', 'load_profile', 'edit_profile', 'split_hotkeys', 'profile_name_for', 'profiles_dir_for',
+    'PROFILE_CACHE_SIZE', 'main',
+]
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Время импорта модулей и проверка, что импорт не тянет GUI и системные фреймворки.
+
+Импорт hotkey_engine, actions и trackpad_engine не должен загружать PyQt5,
+PyObjC (Quartz, AppKit, Foundation, CoreDisplay) и окно настроек: они
+загружаются лениво — слушатель клавиатуры, установка яркости, первый запуск
+движка трекпада, открытие окна. hotkey_engine так же не загружает хранилища
+правил (кэш конфигурации, журнал, SQLite), профили приложений и анализатор
+конфликтов — они нужны при первой загрузке правил или первом обращении. Разбивка по модулям берётся из
+`python -X importtime` в отдельном процессе.
+
+Запуск из корня репозитория:
+    python benchmarks/import_time.py                 # разбивка для hotkey_engine
+    python benchmarks/import_time.py --module actions --top 10
+    python benchmarks/import_time.py --check         # ненулевой код при нарушении
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули, которые не должны загружаться при импорте (пакет или его подмодули)
+FORBIDDEN: Dict[str, Tuple[str, ...]] = {
+    'hotkey_engine': ('PyQt5', 'Quartz', 'AppKit', 'Foundation', 'CoreDisplay', 'objc', 'ui', 'trackpad_engine',
+                      # хранилища и анализ конфликтов — при загрузке правил, смене режима, первой активации
+                      'sqlite3', 'pickle', 'sqlite_rule_store', 'rule_journal', 'config_cache',
+                      'conflict_analyzer', 'app_profiles'),
+    'actions': ('PyQt5', 'Quartz', 'AppKit', 'Foundation', 'CoreDisplay', 'objc'),
+    'trackpad_engine': ('PyQt5', 'Quartz', 'AppKit', 'CoreDisplay', 'ui'),
+}
+
+
+@dataclass(frozen=True)
+class ImportRow:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(p for p in (ROOT, env.get('PYTHONPATH')) if p)
+    return env
+
+
+def parse_importtime(stderr: str) -> List[ImportRow]:
+    """Строки вида `import time:  self [us] | cumulative | imported package`."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append(ImportRow(name.strip(), int(parts[0]), int(parts[1]), depth))
+    return rows
+
+
+def measure(module: str, python: str = sys.executable) -> List[ImportRow]:
+    proc = subprocess.run([python, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT, env=_env(),
+                          capture_output=True, text=True, timeout=120)
+    if proc.returncode != 0:
+        raise RuntimeError(f'import {module} завершился с кодом {proc.returncode}:\n{proc.stderr[-2000:]}')
+    return parse_importtime(proc.stderr)
+
+
+def loaded_modules(module: str, python: str = sys.executable) -> List[str]:
+    code = f'import sys, json\nimport {module}\nprint(json.dumps(sorted(sys.modules)))'
+    proc = subprocess.run([python, '-c', code], cwd=ROOT, env=_env(), capture_output=True, text=True, timeout=120)
+    if proc.returncode != 0:
+        raise RuntimeError(f'import {module} завершился с кодом {proc.returncode}:\n{proc.stderr[-2000:]}')
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def check(modules: Optional[Sequence[str]] = None, python: str = sys.executable) -> List[str]:
+    """Нарушения: какой модуль при импорте загрузил запрещённый."""
+    problems = []
+    for module in modules or list(FORBIDDEN):
+        loaded = loaded_modules(module, python)
+        for name in FORBIDDEN.get(module, ()):
+            hits = [m for m in loaded if m == name or m.startswith(name + '.')]
+            if hits:
+                problems.append(f'import {module} загружает {hits[0]}')
+    return problems
+
+
+def format_breakdown(rows: Sequence[ImportRow], top: int = 15) -> str:
+    """Самые дорогие по cumulative импорты и суммарное время верхнего уровня."""
+    lines = [f"{'cumulative_ms':>13} {'self_ms':>8}  module"]
+    for r in sorted(rows, key=lambda r: -r.cumulative_us)[:top]:
+        lines.append(f"{r.cumulative_us / 1000:>13.1f} {r.self_us / 1000:>8.1f}  {'  ' * r.depth}{r.module}")
+    total = sum(r.cumulative_us for r in rows if r.depth == 0)
+    lines.append(f'всего: {total / 1000:.1f} мс')
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Время импорта модулей HotkeyMaster')
+    parser.add_argument('--module', default='hotkey_engine')
+    parser.add_argument('--top', type=int, default=15, help='строк в разбивке')
+    parser.add_argument('--check', action='store_true', help='проверить запрещённые при импорте модули')
+    args = parser.parse_args(argv)
+    try:
+        if args.check:
+            problems = check()
+            for p in problems:
+                print(p, file=sys.stderr)
+            print('OK' if not problems else f'нарушений: {len(problems)}')
+            return 1 if problems else 0
+        print(format_breakdown(measure(args.module), args.top))
+    except Exception as e:
+        print(f'Ошибка: {e}', file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,341 @@
+"""Синтетическая нагрузка и замер стоимости обработки нажатий.
+
+Гоняет настоящий колбэк event tap (hotkey_engine._run_hotkey_listener) на
+потоке синтетических событий (vk, флаги) через поддельный слой Quartz, поэтому
+работает на любой ОС, без macOS и прав Accessibility. Снимок правил, таблицы
+приложений, автомат последовательностей, подавление повторов, очередь действий
+и самописец — настоящие; действия не выполняются (исполнитель с пустой функцией).
+
+Перебираются число правил, доля app-правил и строгий/нестрогий режим
+модификаторов. Для каждой конфигурации — перцентили задержки одного события
+и пропускная способность; результаты сохраняются в JSON для сравнения прогонов.
+
+Запуск из корня репозитория:
+    python benchmarks/keystroke_bench.py
+    python benchmarks/keystroke_bench.py --rules 10 1000 --events 5000 --compare old.json
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import types
+import random
+import argparse
+import platform
+import tempfile
+import threading
+from array import array
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import frontmost_app
+import flight_recorder
+from frontmost_app import AppInfo, FrontmostAppTracker
+from flight_recorder import FlightRecorder
+from action_executor import ActionExecutor
+from modifiers import parse_mods
+
+DEFAULT_RULES = (10, 100, 1000, 10000)
+DEFAULT_APP_MIX = (0.0, 0.5)
+DEFAULT_EVENTS = 20000
+DEFAULT_HIT_RATIO = 0.3  # доля событий, для которых в активной таблице есть правило
+ACTIVE_APP = AppInfo('App0', 'com.example.app0', 100)
+APPS = 8
+MOD_NAMES = ('Cmd', 'Shift', 'Alt', 'Ctrl')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Событие — кортеж (vk, флаги, автоповтор); поля читаются по индексу без обёрток
+_KEYCODE, _FLAGS, _AUTOREPEAT = 0, 1, 2
+
+
+class _RunLoop:
+    def __init__(self):
+        self.wake = threading.Event()
+        self.stopped = False
+        self.blocks: List[Any] = []
+
+
+def fake_quartz() -> types.ModuleType:
+    """Минимальный Quartz: run loop на threading.Event, tap запоминает колбэк."""
+    q = types.ModuleType('Quartz')
+    q.taps = []
+    q.kCGEventKeyDown = 10
+    q.kCGHIDEventTap = q.kCGHeadInsertEventTap = q.kCGEventTapOptionDefault = 0
+    q.kCFRunLoopCommonModes = q.kCFRunLoopDefaultMode = 'mode'
+    q.kCFRunLoopRunFinished, q.kCFRunLoopRunStopped, q.kCFRunLoopRunTimedOut = 1, 2, 3
+    q.kCGEventTapDisabledByTimeout, q.kCGEventTapDisabledByUserInput = 0xFFFFFFFE, 0xFFFFFFFF
+    q.kCGKeyboardEventKeycode, q.kCGKeyboardEventAutorepeat = _KEYCODE, _AUTOREPEAT
+    q.kCGEventFlagMaskShift, q.kCGEventFlagMaskControl = 0x20000, 0x40000
+    q.kCGEventFlagMaskAlternate, q.kCGEventFlagMaskCommand = 0x80000, 0x100000
+    # Имена, которые hotkey_engine импортирует на уровне модуля
+    for name in ('CGMainDisplayID', 'CGEventPost', 'CGEventCreateKeyboardEvent', 'CGEventSetFlags'):
+        setattr(q, name, lambda *args: None)
+    q.CGEventGetIntegerValueField = lambda event, field: event[field]
+    q.CGEventGetFlags = itemgetter(_FLAGS)
+    q.CGEventMaskBit = lambda t: 1 << t
+
+    def tap_create(location, place, options, mask, callback, refcon):
+        tap = types.SimpleNamespace(enabled=False, callback=callback)
+        q.taps.append(tap)
+        return tap
+    q.CGEventTapCreate = tap_create
+    q.CGEventTapEnable = lambda tap, on: setattr(tap, 'enabled', on)
+    q.CGEventTapIsEnabled = lambda tap: tap.enabled
+    q.CFMachPortInvalidate = lambda tap: None
+    q.CFMachPortCreateRunLoopSource = lambda alloc, tap, order: ('source', id(tap))
+    local = threading.local()
+
+    def current():
+        if not hasattr(local, 'loop'):
+            local.loop = _RunLoop()
+        return local.loop
+    q.CFRunLoopGetCurrent = current
+    q.CFRunLoopAddSource = q.CFRunLoopRemoveSource = lambda loop, src, mode: None
+
+    def run_in_mode(mode, seconds, once):
+        loop = current()
+        while True:
+            loop.wake.wait()
+            loop.wake.clear()
+            while loop.blocks:
+                loop.blocks.pop(0)()
+            if loop.stopped:
+                loop.stopped = False
+                return q.kCFRunLoopRunStopped
+    q.CFRunLoopRunInMode = run_in_mode
+
+    def stop(loop):
+        loop.stopped = True
+        loop.wake.set()
+    q.CFRunLoopStop = stop
+    q.CFRunLoopPerformBlock = lambda loop, mode, block: loop.blocks.append(block)
+    q.CFRunLoopWakeUp = lambda loop: loop.wake.set()
+    return q
+
+
+class _StaticTracker(FrontmostAppTracker):
+    """Трекер «с подпиской»: колбэк идёт по быстрому пути, как в приложении."""
+
+    @property
+    def observing(self) -> bool:
+        return True
+
+    def current(self):
+        return self._current
+
+
+def generate_rules(rnd: random.Random, count: int, app_mix: float) -> List[Dict[str, Any]]:
+    """count клавиатурных правил; доля app_mix привязана к одному из APPS приложений."""
+    rules = []
+    for i in range(count):
+        mods = [m for m in MOD_NAMES if rnd.random() < 0.4] or ['Cmd']
+        hk = {'id': f'r{i}', 'type': 'keyboard', 'combo': {'mods': mods, 'vk': rnd.randrange(128)},
+              'action': f'noop {i}', 'scope': 'global', 'app': '', 'enabled': True}
+        if rnd.random() < app_mix:
+            app = rnd.randrange(APPS)
+            hk.update(scope='app', app=f'App{app}', bundle_id=f'com.example.app{app}')
+        rules.append(hk)
+    return rules
+
+
+def generate_events(rnd: random.Random, rules: Sequence[Dict[str, Any]], count: int,
+                    hit_ratio: float) -> List[Tuple[int, int, int]]:
+    """Поток нажатий: часть попадает в правила активной таблицы, остальное — случайные клавиши."""
+    active = [r for r in rules if r['scope'] == 'global' or r['app'] == ACTIVE_APP.name]
+    masks = [parse_mods(r['combo']['mods']) for r in active]
+    events = []
+    for _ in range(count):
+        if active and rnd.random() < hit_ratio:
+            k = rnd.randrange(len(active))
+            events.append((active[k]['combo']['vk'], masks[k], 0))
+        else:
+            mods = [m for m in MOD_NAMES if rnd.random() < 0.2]
+            events.append((rnd.randrange(128), parse_mods(mods), 0))
+    return events
+
+
+def percentile(sorted_values: Sequence[int], q: float) -> int:
+    """Перцентиль по ближайшему рангу (q в процентах)."""
+    if not sorted_values:
+        return 0
+    rank = max(1, min(len(sorted_values), int(round(q / 100.0 * len(sorted_values) + 0.5))))
+    return sorted_values[rank - 1]
+
+
+def _measure(callback, events: Sequence[Tuple[int, int, int]]) -> Tuple[array, float]:
+    key_down = 10
+    clock = time.perf_counter_ns
+    lat = array('q', bytes(8 * len(events)))
+    started = clock()
+    for i, ev in enumerate(events):
+        t0 = clock()
+        callback(None, key_down, ev, None)
+        lat[i] = clock() - t0
+    return lat, (clock() - started) / 1e9
+
+
+def run_benchmark(rule_counts: Iterable[int] = DEFAULT_RULES, app_mixes: Iterable[float] = DEFAULT_APP_MIX,
+                  strict_modes: Iterable[bool] = (False, True), events: int = DEFAULT_EVENTS,
+                  hit_ratio: float = DEFAULT_HIT_RATIO, seed: int = 1) -> Dict[str, Any]:
+    """Прогон всех сочетаний параметров. Quartz в sys.modules должен быть поддельным (fake_quartz)."""
+    quartz = sys.modules.get('Quartz')
+    if not hasattr(quartz, 'taps'):
+        raise RuntimeError('ожидается поддельный Quartz: sys.modules["Quartz"] = fake_quartz()')
+    results = []
+    saved_tracker = frontmost_app._tracker
+    with tempfile.TemporaryDirectory(prefix='hkm-bench-') as workdir:
+        hotkeys_path = os.path.join(workdir, 'hotkeys.json')
+        settings_path = os.path.join(workdir, 'settings.json')
+        _write_json(hotkeys_path, [])
+        _write_json(settings_path, {})
+        saved_env = os.environ.get('HOTKEYMASTER_HOTKEYS_FILE')
+        os.environ['HOTKEYMASTER_HOTKEYS_FILE'] = hotkeys_path
+        tracker = frontmost_app._tracker = _StaticTracker()
+        tracker.set_current(ACTIVE_APP)
+        sys.modules.pop('hotkey_engine', None)
+        import hotkey_engine as eng
+        eng.SETTINGS_PATH = settings_path
+        eng._flight_recorder = recorder = FlightRecorder(capacity=max(1, events))
+        eng._action_executor = ActionExecutor(lambda action: None, maxsize=max(64, events))
+        try:
+            if not eng.start_quartz_hotkey_listener():
+                raise RuntimeError('поддельный tap не создан')
+            callback = quartz.taps[-1].callback
+            for count in rule_counts:
+                for app_mix in app_mixes:
+                    rnd = random.Random(f'{seed}:{count}:{app_mix}')
+                    rules = generate_rules(rnd, count, app_mix)
+                    stream = generate_events(rnd, rules, events, hit_ratio)
+                    _write_json(hotkeys_path, rules)
+                    eng.refresh_hotkeys_cache(force=True)
+                    for strict in strict_modes:
+                        _write_json(settings_path, {'strict_mod_match': strict})
+                        eng._load_general_settings(force=True)
+                        eng._repeat_gate.clear()
+                        _measure(callback, stream[:min(1000, len(stream))])  # прогрев
+                        recorder.clear()
+                        lat, elapsed = _measure(callback, stream)
+                        results.append(_summarize(count, app_mix, strict, lat, elapsed, recorder))
+        finally:
+            eng.stop_quartz_hotkey_listener()
+            eng.stop_config_watcher()
+            eng._action_executor.stop()
+            frontmost_app._tracker = saved_tracker
+            if saved_env is None:
+                os.environ.pop('HOTKEYMASTER_HOTKEYS_FILE', None)
+            else:
+                os.environ['HOTKEYMASTER_HOTKEYS_FILE'] = saved_env
+            sys.modules.pop('hotkey_engine', None)
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'events': events,
+            'hit_ratio': hit_ratio,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def _summarize(count: int, app_mix: float, strict: bool, lat: array, elapsed: float,
+               recorder: FlightRecorder) -> Dict[str, Any]:
+    ordered = sorted(lat)
+    reasons: Dict[str, int] = {}
+    for rec in recorder.records():
+        name = flight_recorder.REASON_NAMES.get(rec.reason, str(rec.reason))
+        reasons[name] = reasons.get(name, 0) + 1
+    us = lambda ns: round(ns / 1000.0, 3)
+    return {
+        'rules': count,
+        'app_mix': app_mix,
+        'strict': strict,
+        'events': len(lat),
+        'p50_us': us(percentile(ordered, 50)),
+        'p90_us': us(percentile(ordered, 90)),
+        'p99_us': us(percentile(ordered, 99)),
+        'p999_us': us(percentile(ordered, 99.9)),
+        'max_us': us(ordered[-1] if ordered else 0),
+        'mean_us': us(sum(ordered) / len(ordered) if ordered else 0),
+        'throughput_eps': round(len(lat) / elapsed) if elapsed > 0 else 0,
+        'decisions': reasons,
+    }
+
+
+def _write_json(path: str, data: Any):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _config_key(row: Dict[str, Any]) -> Tuple[int, float, bool]:
+    return row['rules'], row['app_mix'], row['strict']
+
+
+def format_table(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> str:
+    """Текстовая таблица; с baseline — изменение p50/p99 в процентах."""
+    base = {_config_key(r): r for r in (baseline or {}).get('results', [])}
+    lines = [f"{'rules':>6} {'app':>5} {'strict':>6} {'p50us':>8} {'p90us':>8} {'p99us':>8} "
+             f"{'p99.9us':>8} {'max_us':>9} {'ev/s':>10}"]
+    for r in report['results']:
+        line = (f"{r['rules']:>6} {r['app_mix']:>5.2f} {str(r['strict']):>6} {r['p50_us']:>8.2f} "
+                f"{r['p90_us']:>8.2f} {r['p99_us']:>8.2f} {r['p999_us']:>8.2f} {r['max_us']:>9.1f} "
+                f"{r['throughput_eps']:>10}")
+        old = base.get(_config_key(r))
+        if old:
+            delta = lambda k: (r[k] - old[k]) / old[k] * 100 if old[k] else 0.0
+            line += f"  p50 {delta('p50_us'):+.0f}% p99 {delta('p99_us'):+.0f}%"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Синтетический бенчмарк обработки нажатий HotkeyMaster')
+    parser.add_argument('--rules', type=int, nargs='+', default=list(DEFAULT_RULES), help='число правил')
+    parser.add_argument('--app-mix', type=float, nargs='+', default=list(DEFAULT_APP_MIX),
+                        help='доля app-правил (0..1)')
+    parser.add_argument('--strict', choices=('both', 'on', 'off'), default='both',
+                        help='строгий режим модификаторов')
+    parser.add_argument('--events', type=int, default=DEFAULT_EVENTS, help='событий на конфигурацию')
+    parser.add_argument('--hit-ratio', type=float, default=DEFAULT_HIT_RATIO,
+                        help='доля событий, совпадающих с правилом')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default=None, help='файл результатов JSON (по умолчанию benchmarks/results/)')
+    parser.add_argument('--compare', default=None, help='JSON прошлого прогона для сравнения')
+    args = parser.parse_args(argv)
+    strict_modes = {'both': (False, True), 'on': (True,), 'off': (False,)}[args.strict]
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except Exception as e:
+            print(f'Не удалось прочитать {args.compare}: {e}', file=sys.stderr)
+            return 2
+    saved = sys.modules.get('Quartz')
+    sys.modules['Quartz'] = fake_quartz()
+    try:
+        report = run_benchmark(args.rules, args.app_mix, strict_modes, args.events, args.hit_ratio, args.seed)
+    finally:
+        if saved is None:
+            sys.modules.pop('Quartz', None)
+        else:
+            sys.modules['Quartz'] = saved
+    out = args.out or os.path.join(RESULTS_DIR, time.strftime('keystrokes-%Y%m%d-%H%M%S.json'))
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    _write_json(out, report)
+    print(format_table(report, baseline))
+    print(f'Результаты: {out}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""Сравнение хранилищ правил: hotkeys.json, журнал правок и SQLite (sqlite_rule_store).
+
+Для каждого числа правил замеряется:
+  - load   — холодная загрузка до готового снимка (JSON: чтение и разбор файла;
+             SQLite: открытие базы и выборка всех строк; в обоих случаях — RuleSnapshot.build);
+  - lookup — поиск клавиатурных правил по (vk, маска): DispatchIndex снимка против
+             индексированного запроса к базе;
+  - get    — правило по id: словарь by_id снимка против выборки по первичному ключу;
+  - update — изменение одного правила через hotkey_engine.get_rule_repository()
+             в каждом режиме hotkeys_storage (json, journal, sqlite): запись на диск
+             и публикация нового снимка — то, что ждёт окно настроек.
+
+Снимок в памяти остаётся путём колбэка клавиатуры в любом режиме; lookup/get для
+базы показывают цену запросов UI и утилит. Результаты сохраняются в JSON.
+
+Запуск из корня репозитория:
+    python benchmarks/storage_bench.py
+    python benchmarks/storage_bench.py --rules 1000 20000 --repeat 50 --compare old.json
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import contextlib
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rule_journal
+from rules import RuleSnapshot
+from modifiers import parse_mods
+from sqlite_rule_store import SqliteRuleStore
+from benchmarks.keystroke_bench import generate_rules, percentile, RESULTS_DIR, _write_json
+
+DEFAULT_RULES = (100, 1000, 10000)
+DEFAULT_REPEAT = 20
+DEFAULT_LOOKUPS = 2000
+OPS = ('load', 'lookup', 'get', 'update')
+BACKENDS = ('json', 'sqlite')
+# Режимы hotkey_engine для update
+STORAGE_MODES = ('json', 'journal', 'sqlite')
+
+
+def _time_each(fn: Callable[[int], Any], count: int) -> List[int]:
+    clock = time.perf_counter_ns
+    lat = []
+    for i in range(count):
+        t0 = clock()
+        fn(i)
+        lat.append(clock() - t0)
+    return lat
+
+
+def _write_hotkeys(path: str, hotkeys: List[Dict[str, Any]]):
+    """Запись как в hotkey_engine._atomic_write_json: indent=2, fsync, атомарная замена."""
+    blob = json.dumps(hotkeys, ensure_ascii=False, indent=2).encode('utf-8')
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(blob)
+        rule_journal.fsync_file(f)
+    os.replace(tmp, path)
+
+
+def _load_json(path: str) -> RuleSnapshot:
+    with open(path, 'rb') as f:
+        return RuleSnapshot.build(1, json.loads(f.read().decode('utf-8')))
+
+
+def _load_sqlite(path: str) -> RuleSnapshot:
+    store = SqliteRuleStore(path)
+    try:
+        return RuleSnapshot.build(1, store.load_all())
+    finally:
+        store.close()
+
+
+@contextlib.contextmanager
+def _engine(workdir: str) -> Iterator[Any]:
+    """hotkey_engine с hotkeys.json и settings.json во временном каталоге."""
+    hotkeys_path = os.path.join(workdir, 'engine', 'hotkeys.json')
+    os.makedirs(os.path.dirname(hotkeys_path), exist_ok=True)
+    _write_hotkeys(hotkeys_path, [])
+    saved_env = os.environ.get('HOTKEYMASTER_HOTKEYS_FILE')
+    os.environ['HOTKEYMASTER_HOTKEYS_FILE'] = hotkeys_path
+    sys.modules.pop('hotkey_engine', None)
+    import hotkey_engine as eng
+    eng.SETTINGS_PATH = os.path.join(workdir, 'engine', 'settings.json')
+    try:
+        yield eng
+    finally:
+        try:
+            _use_storage(eng, 'json')  # остановить поток журнала, закрыть базу
+        finally:
+            eng.stop_config_watcher()
+            if saved_env is None:
+                os.environ.pop('HOTKEYMASTER_HOTKEYS_FILE', None)
+            else:
+                os.environ['HOTKEYMASTER_HOTKEYS_FILE'] = saved_env
+            sys.modules.pop('hotkey_engine', None)
+
+
+def _use_storage(eng, mode: str):
+    with open(eng.SETTINGS_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'hotkeys_storage': mode}, f)
+    eng._load_general_settings(force=True)
+
+
+def _engine_update(eng, mode: str, rules: List[Dict[str, Any]], edits: List[int]) -> Callable[[int], Any]:
+    """Правка одного правила через репозиторий в режиме mode (набор правил — rules)."""
+    _use_storage(eng, 'json')
+    _write_hotkeys(eng.HOTKEYS_FILE, rules)
+    eng.refresh_hotkeys_cache(force=True)
+    _use_storage(eng, mode)
+    repo = eng.get_rule_repository()
+
+    def update(i):
+        repo.update(rules[edits[i]]['id'], action=f'{mode} {i}')
+    return update
+
+
+def _bench_count(eng, workdir: str, rnd: random.Random, count: int, repeat: int,
+                 lookups: int) -> List[Dict[str, Any]]:
+    rules = generate_rules(rnd, count, 0.5)
+    json_path = os.path.join(workdir, f'hotkeys-{count}.json')
+    db_path = os.path.join(workdir, f'hotkeys-{count}.sqlite')
+    _write_hotkeys(json_path, rules)
+    store = SqliteRuleStore(db_path)
+    store.replace_all(rules)
+    snap = _load_json(json_path)
+    keys = [(r['combo']['vk'], parse_mods(r['combo']['mods'])) for r in
+            (rules[rnd.randrange(count)] for _ in range(lookups))]
+    ids = [rules[rnd.randrange(count)]['id'] for _ in range(lookups)]
+    edits = [rnd.randrange(count) for _ in range(repeat)]
+
+    index = snap.keyboard
+    runs = {
+        ('json', 'load'): (lambda i: _load_json(json_path), repeat),
+        ('sqlite', 'load'): (lambda i: _load_sqlite(db_path), repeat),
+        ('json', 'lookup'): (lambda i: index.lookup(keys[i][0], keys[i][1], True), lookups),
+        ('sqlite', 'lookup'): (lambda i: store.find_keyboard(keys[i][0], keys[i][1]), lookups),
+        ('json', 'get'): (lambda i: snap.by_id.get(ids[i]), lookups),
+        ('sqlite', 'get'): (lambda i: store.get(ids[i]), lookups),
+    }
+    results = []
+    try:
+        for op in OPS:
+            for backend in (STORAGE_MODES if op == 'update' else BACKENDS):
+                if op == 'update':
+                    fn, n = _engine_update(eng, backend, rules, edits), repeat
+                else:
+                    fn, n = runs[(backend, op)]
+                fn(0)  # прогрев
+                ordered = sorted(_time_each(fn, n))
+                us = lambda ns: round(ns / 1000.0, 3)
+                results.append({
+                    'rules': count,
+                    'op': op,
+                    'backend': backend,
+                    'samples': n,
+                    'p50_us': us(percentile(ordered, 50)),
+                    'p90_us': us(percentile(ordered, 90)),
+                    'max_us': us(ordered[-1]),
+                    'mean_us': us(sum(ordered) / len(ordered)),
+                })
+    finally:
+        store.close()
+    return results
+
+
+def run_benchmark(rule_counts: Iterable[int] = DEFAULT_RULES, repeat: int = DEFAULT_REPEAT,
+                  lookups: int = DEFAULT_LOOKUPS, seed: int = 1) -> Dict[str, Any]:
+    results = []
+    repeat, lookups = max(1, repeat), max(1, lookups)
+    with tempfile.TemporaryDirectory(prefix='hkm-storage-bench-') as workdir, _engine(workdir) as eng:
+        for count in rule_counts:
+            rnd = random.Random(f'{seed}:{count}')
+            results.extend(_bench_count(eng, workdir, rnd, max(1, count), repeat, lookups))
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'lookups': lookups,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def _config_key(row: Dict[str, Any]) -> Tuple[int, str, str]:
+    return row['rules'], row['op'], row['backend']
+
+
+def format_table(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> str:
+    """Текстовая таблица; с baseline — изменение p50 в процентах."""
+    base = {_config_key(r): r for r in (baseline or {}).get('results', [])}
+    lines = [f"{'rules':>6} {'op':>7} {'backend':>7} {'p50us':>10} {'p90us':>10} {'max_us':>10}"]
+    for r in report['results']:
+        line = (f"{r['rules']:>6} {r['op']:>7} {r['backend']:>7} {r['p50_us']:>10.2f} "
+                f"{r['p90_us']:>10.2f} {r['max_us']:>10.1f}")
+        old = base.get(_config_key(r))
+        if old and old['p50_us']:
+            line += f"  p50 {(r['p50_us'] - old['p50_us']) / old['p50_us'] * 100:+.0f}%"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Бенчмарк хранилищ правил HotkeyMaster: JSON, журнал и SQLite')
+    parser.add_argument('--rules', type=int, nargs='+', default=list(DEFAULT_RULES), help='число правил')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='повторов load и update')
+    parser.add_argument('--lookups', type=int, default=DEFAULT_LOOKUPS, help='запросов lookup и get')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default=None, help='файл результатов JSON (по умолчанию benchmarks/results/)')
+    parser.add_argument('--compare', default=None, help='JSON прошлого прогона для сравнения')
+    args = parser.parse_args(argv)
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except Exception as e:
+            print(f'Не удалось прочитать {args.compare}: {e}', file=sys.stderr)
+            return 2
+    report = run_benchmark(args.rules, args.repeat, args.lookups, args.seed)
+    out = args.out or os.path.join(RESULTS_DIR, time.strftime('storage-%Y%m%d-%H%M%S.json'))
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    _write_json(out, report)
+    print(format_table(report, baseline))
+    print(f'Результаты: {out}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,647 @@
+"""Выбор механизма установки яркости: проверка один раз, дальше — только выбранный.
+
+Раньше каждая установка яркости по очереди пробовала helper-бинарь, CoreDisplay
+и DisplayServices (с LoadLibrary на каждый вызов). Теперь BrightnessResolver при
+первой установке пробует все доступные механизмы с одним и тем же значением
+(повторная установка того же значения безвредна), замеряет их и запоминает
+самый быстрый из сработавших. Следующие вызовы идут только в него; повторная
+проверка — лишь после его отказа (или, если не сработал ни один, не чаще
+REPROBE_INTERVAL). Выбор можно сохранять между запусками (cache_path): при
+старте сохранённый механизм используется сразу, пока не откажет.
+
+Библиотеки фреймворков загружаются один раз — при первой проверке механизма.
+
+BrightnessController сглаживает частые изменения (автоповтор клавиши яркости):
+запросы только меняют целевое значение в памяти (побеждает последний), а свой
+поток плавно ведёт яркость к цели — не больше RAMP_STEP и не больше одного
+вызова механизма за FRAME_INTERVAL, сколько бы нажатий ни пришло.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import atexit
+import time
+import ctypes
+import ctypes.util
+import logging
+import platform
+import subprocess
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger("hotkeymaster.brightness")
+
+APP_SUPPORT_DIR = os.path.join(os.path.expanduser('~'), 'Library', 'Application Support', 'HotkeyMaster')
+BACKEND_CACHE_PATH = os.path.join(APP_SUPPORT_DIR, 'brightness_backend.json')
+REPROBE_INTERVAL = 30.0  # с; пауза между проверками, если не сработал ни один механизм
+HELPER_TIMEOUT = 2.0  # с; ожидание ответа helper
+LATENCY_ALPHA = 0.2  # вес нового замера в скользящем среднем задержки
+FRAME_INTERVAL = 1 / 30  # с; не чаще одной установки яркости за кадр
+RAMP_STEP = 0.025  # наибольшее изменение яркости за кадр (шаг +10% — за 4 кадра)
+
+DISPLAY_SERVICES_PATH = '/System/Library/PrivateFrameworks/DisplayServices.framework/DisplayServices'
+CORE_DISPLAY_PATHS = (
+    '/System/Library/PrivateFrameworks/CoreDisplay.framework/CoreDisplay',
+    '/System/Library/PrivateFrameworks/CoreDisplay.framework/Versions/A/CoreDisplay',
+)
+
+
+def helper_path() -> str:
+    # В дев-режиме helper ожидается рядом со скриптом, в frozen — рядом с binary
+    if getattr(sys, 'frozen', False):
+        base = os.path.dirname(sys.executable)
+    else:
+        base = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base, 'coredisplay_helper')
+
+
+def _main_display() -> int:
+    from Quartz import CGMainDisplayID  # type: ignore
+    return CGMainDisplayID()
+
+
+def _bind_setter(lib, symbol: str):
+    fn = getattr(lib, symbol, None)
+    if fn:
+        fn.argtypes = [ctypes.c_uint32, ctypes.c_float]
+        fn.restype = ctypes.c_int
+    return fn
+
+
+class Backend:
+    """Механизм установки яркости. load() — один раз, set() — на каждый вызов."""
+    name = ''
+
+    def load(self) -> bool:
+        """Подготовить механизм (загрузить библиотеку и т.п.). False — недоступен."""
+        return True
+
+    def set(self, val: float) -> bool:
+        raise NotImplementedError
+
+    def get(self) -> Optional[float]:
+        """Текущая яркость, если механизм умеет её читать."""
+        return None
+
+    def close(self):
+        pass
+
+    def cache_key(self) -> Any:
+        """Часть ключа кэша между запусками (например, сигнатура бинаря)."""
+        return None
+
+
+class _Reply:
+    __slots__ = ('event', 'line')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.line: Optional[str] = None
+
+
+class HelperServer:
+    """Долгоживущий coredisplay_helper в режиме сервера (запуск без аргументов).
+
+    Команды пишутся в stdin построчно, не дожидаясь ответов на предыдущие
+    (ответы приходят по порядку, их разбирает поток чтения). Умерший или
+    зависший процесс перезапускается при следующем запросе. Старый helper без
+    режима сервера (завершился с ошибкой использования или ответил не "ready")
+    помечается unsupported; не успевший ответить "ready" за timeout — нет.
+    """
+
+    def __init__(self, command: Sequence[str], timeout: float = HELPER_TIMEOUT,
+                 env: Optional[Dict[str, str]] = None):
+        self.command = list(command)
+        self.timeout = timeout
+        self.env = env
+        self._lock = threading.Lock()
+        self._proc: Optional[subprocess.Popen] = None
+        self._pending: 'deque[_Reply]' = deque()
+        self._closed = threading.Event()  # stdout процесса закрыт (процесс завершается)
+        self.unsupported = False
+        self.starts = 0
+
+    @property
+    def running(self) -> bool:
+        proc = self._proc
+        return proc is not None and not self._closed.is_set() and proc.poll() is None
+
+    def start(self) -> bool:
+        with self._lock:
+            return self._ensure_locked()
+
+    def _ensure_locked(self) -> bool:
+        if self.running:
+            return True
+        if self.unsupported:
+            return False
+        try:
+            proc = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL, text=True, bufsize=1, env=self.env)
+        except OSError as e:
+            logger.warning(f"[brightness] не удалось запустить helper: {e}")
+            self.unsupported = True
+            return False
+        pending: 'deque[_Reply]' = deque()
+        closed = threading.Event()
+        ready = _Reply()
+        pending.append(ready)
+        threading.Thread(target=self._read, args=(proc, pending, closed), name='BrightnessHelperReader', daemon=True).start()
+        if not ready.event.wait(self.timeout):
+            # Медленный запуск (нагрузка, холодный диск) — не признак старого helper'а:
+            # процесс снимается, следующий запрос попробует снова
+            logger.warning(f"[brightness] helper не ответил ready за {self.timeout} с, повтор при следующем запросе")
+            self._kill(proc)
+            return False
+        if ready.line is None:
+            # stdout закрыт до "ready": старый helper завершается с ошибкой использования
+            try:
+                code = proc.wait(self.timeout)
+            except subprocess.TimeoutExpired:
+                code = None
+            if code is None or code <= 0:
+                logger.warning(f"[brightness] helper завершился при запуске (код {code}), повтор при следующем запросе")
+                self._kill(proc)
+                return False
+        if ready.line != 'ready':
+            logger.info("[brightness] helper без режима сервера — запуск на каждую установку")
+            self._kill(proc)
+            self.unsupported = True
+            return False
+        self._proc, self._pending, self._closed = proc, pending, closed
+        self.starts += 1
+        logger.debug(f"[brightness] helper запущен (pid {proc.pid})")
+        return True
+
+    @staticmethod
+    def _read(proc: subprocess.Popen, pending: 'deque[_Reply]', closed: threading.Event):
+        # Без блокировки: append/popleft у deque атомарны, а _ensure_locked ждёт "ready" под блокировкой
+        try:
+            for line in proc.stdout:
+                try:
+                    reply = pending.popleft()
+                except IndexError:
+                    continue
+                reply.line = line.strip()
+                reply.event.set()
+        except (OSError, ValueError):
+            pass
+        # Процесс завершился: ожидающие запросы получают None
+        closed.set()
+        while pending:
+            try:
+                pending.popleft().event.set()
+            except IndexError:
+                break
+
+    @staticmethod
+    def _kill(proc: subprocess.Popen):
+        try:
+            proc.kill()
+            proc.wait(1.0)
+        except Exception:
+            pass
+
+    def request(self, line: str, wait: bool = True) -> Optional[str]:
+        """Отправить команду. wait=False — не ждать ответа (конвейер); иначе ответ
+        или None, если helper недоступен, умер или не ответил за timeout."""
+        reply = _Reply()
+        with self._lock:
+            if not self._ensure_locked():
+                return None
+            proc = self._proc
+            self._pending.append(reply)
+            try:
+                proc.stdin.write(line + '\n')
+                proc.stdin.flush()
+            except (OSError, ValueError) as e:
+                logger.warning(f"[brightness] helper недоступен: {e}")
+                self._kill(proc)
+                return None
+        if not wait:
+            return None
+        if not reply.event.wait(self.timeout):
+            logger.warning(f"[brightness] helper не ответил за {self.timeout} с, перезапуск")
+            self._kill(proc)
+            return None
+        return reply.line
+
+    def close(self):
+        with self._lock:
+            proc, self._proc = self._proc, None
+        if proc is None or proc.poll() is not None:
+            return
+        try:
+            proc.stdin.write('quit\n')
+            proc.stdin.close()
+            proc.wait(1.0)
+        except Exception:
+            self._kill(proc)
+
+
+class HelperBackend(Backend):
+    """coredisplay_helper: один долгоживущий процесс (HelperServer); старый helper
+    без режима сервера запускается на каждую установку."""
+    name = 'helper'
+
+    def __init__(self, path: Optional[str] = None, command: Optional[Sequence[str]] = None,
+                 env: Optional[Dict[str, str]] = None):
+        self.path = path or helper_path()
+        self.command = list(command) if command else [self.path]
+        self.env = env
+        self.server = HelperServer(self.command, env=env)
+
+    def load(self) -> bool:
+        if not (os.path.exists(self.command[0]) and os.access(self.command[0], os.X_OK)):
+            return False
+        self.server.start()
+        return True
+
+    def set(self, val: float, display: Optional[int] = None) -> bool:
+        if not self.server.unsupported:
+            line = f'set {val:.4f}' + (f' {int(display)}' if display is not None else '')
+            reply = self.server.request(line)
+            if reply is not None and reply != 'ok':
+                logger.warning(f"Helper brightness ошибка: {reply}")
+            if reply is not None or not self.server.unsupported:
+                return reply == 'ok'
+        try:
+            r = subprocess.run(self.command + [str(val)], check=True, capture_output=True, text=True,
+                               timeout=HELPER_TIMEOUT, env=self.env)
+            logger.debug(f"helper stdout={r.stdout.strip()} stderr={r.stderr.strip()}")
+            return True
+        except Exception as e:
+            logger.warning(f"Helper brightness ошибка: {e}")
+            return False
+
+    def get(self, display: Optional[int] = None) -> Optional[float]:
+        reply = self.server.request('get' + (f' {int(display)}' if display is not None else ''))
+        if reply and reply.startswith('ok '):
+            try:
+                return float(reply[3:])
+            except ValueError:
+                pass
+        return None
+
+    def close(self):
+        self.server.close()
+
+    def cache_key(self) -> Any:
+        try:
+            st = os.stat(self.path)
+            return [self.path, st.st_size, st.st_mtime_ns]
+        except OSError:
+            return None
+
+
+class CoreDisplayBackend(Backend):
+    """CoreDisplay_Display_SetUserBrightness в процессе (PyObjC, find_library, явные пути)."""
+    name = 'coredisplay'
+
+    def __init__(self):
+        self._fn: Optional[Callable] = None
+
+    def load(self) -> bool:
+        if self._fn is None:
+            self._fn = self._resolve()
+        return self._fn is not None
+
+    @staticmethod
+    def _resolve():
+        try:
+            import CoreDisplay as _cd  # type: ignore
+            return _cd.CoreDisplay_Display_SetUserBrightness
+        except Exception:
+            pass
+        lib = ctypes.util.find_library('CoreDisplay')
+        for path in ((lib,) if lib else ()) + CORE_DISPLAY_PATHS:
+            if path != lib and not os.path.exists(path):
+                continue
+            try:
+                fn = _bind_setter(ctypes.cdll.LoadLibrary(path), 'CoreDisplay_Display_SetUserBrightness')
+                if fn:
+                    return fn
+            except Exception:
+                continue
+        return None
+
+    def set(self, val: float) -> bool:
+        try:
+            res = self._fn(_main_display(), ctypes.c_float(val))
+        except Exception as e:
+            logger.debug(f"CoreDisplay set fail: {e}")
+            return False
+        if res != 0:
+            logger.warning(f"CoreDisplay возвратил код {res}")
+        return res == 0
+
+
+class DisplayServicesBackend(Backend):
+    """DisplayServicesSetBrightness в процессе (Apple Silicon)."""
+    name = 'displayservices'
+
+    def __init__(self):
+        self._fn: Optional[Callable] = None
+
+    def load(self) -> bool:
+        if self._fn is None:
+            try:
+                self._fn = _bind_setter(ctypes.cdll.LoadLibrary(DISPLAY_SERVICES_PATH), 'DisplayServicesSetBrightness')
+            except Exception:
+                return False
+        return self._fn is not None
+
+    def set(self, val: float) -> bool:
+        try:
+            return self._fn(_main_display(), ctypes.c_float(val)) == 0
+        except Exception as e:
+            logger.debug(f"DisplayServices set fail: {e}")
+            return False
+
+
+def default_backends() -> List[Backend]:
+    return [HelperBackend(), CoreDisplayBackend(), DisplayServicesBackend()]
+
+
+class BrightnessResolver:
+    """Выбранный механизм яркости и его статистика. Потокобезопасен."""
+
+    def __init__(self, backends: Optional[Sequence[Backend]] = None, cache_path: Optional[str] = None,
+                 reprobe_interval: float = REPROBE_INTERVAL, clock: Callable[[], float] = time.monotonic):
+        self.backends = list(backends) if backends is not None else default_backends()
+        self.cache_path = cache_path
+        self.reprobe_interval = reprobe_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._loaded: Dict[str, bool] = {}
+        self._active: Optional[Backend] = None
+        self._cache_checked = False
+        self._next_probe = 0.0
+        self.probes = 0
+        self.calls = 0
+        self.failures = 0
+        self.last_latency_ms: Optional[float] = None
+        self.avg_latency_ms: Optional[float] = None
+        self.probe_latency_ms: Dict[str, float] = {}
+
+    @property
+    def active(self) -> Optional[str]:
+        """Имя выбранного механизма (None — ещё не выбран или не сработал ни один)."""
+        backend = self._active
+        return backend.name if backend else None
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'backend': self.active,
+                'last_ms': self.last_latency_ms,
+                'avg_ms': self.avg_latency_ms,
+                'calls': self.calls,
+                'failures': self.failures,
+                'probes': self.probes,
+                'probe_ms': dict(self.probe_latency_ms),
+            }
+
+    def set(self, val: float) -> bool:
+        """Установить яркость выбранным механизмом; при его отказе — выбрать заново."""
+        with self._lock:
+            if self._active is None and not self._cache_checked:
+                self._cache_checked = True
+                self._active = self._load_cached_locked()
+            backend = self._active
+            if backend is not None:
+                ok, ms = self._timed(backend, val)
+                if ok:
+                    self._record_locked(ms)
+                    return True
+                self.failures += 1
+                logger.warning(f"[brightness] механизм {backend.name} отказал, повторная проверка")
+                self._active = None
+            elif self._clock() < self._next_probe:
+                return False
+            return self._probe_locked(val)
+
+    def close(self):
+        """Освободить механизмы (остановить helper)."""
+        for backend in self.backends:
+            try:
+                backend.close()
+            except Exception:
+                pass
+
+    def reset(self):
+        """Забыть выбор (следующий set проверит механизмы заново)."""
+        with self._lock:
+            self._active = None
+            self._next_probe = 0.0
+
+    # ---------- выбор ----------
+    def _timed(self, backend: Backend, val: float):
+        start = time.perf_counter()
+        ok = backend.set(val)
+        return ok, (time.perf_counter() - start) * 1000.0
+
+    def _record_locked(self, ms: float):
+        self.calls += 1
+        self.last_latency_ms = ms
+        self.avg_latency_ms = ms if self.avg_latency_ms is None else (
+            self.avg_latency_ms + LATENCY_ALPHA * (ms - self.avg_latency_ms))
+
+    def _available_locked(self, backend: Backend) -> bool:
+        if backend.name not in self._loaded:
+            try:
+                self._loaded[backend.name] = bool(backend.load())
+            except Exception as e:
+                logger.debug(f"[brightness] {backend.name} недоступен: {e}")
+                self._loaded[backend.name] = False
+        return self._loaded[backend.name]
+
+    def _probe_locked(self, val: float) -> bool:
+        self.probes += 1
+        self.probe_latency_ms = {}
+        for backend in self.backends:
+            if not self._available_locked(backend):
+                continue
+            ok, ms = self._timed(backend, val)
+            if ok:
+                self.probe_latency_ms[backend.name] = ms
+        if not self.probe_latency_ms:
+            self._next_probe = self._clock() + self.reprobe_interval
+            self.failures += 1
+            logger.warning("[brightness] ни один механизм установки яркости не сработал")
+            return False
+        best = min(self.probe_latency_ms, key=self.probe_latency_ms.get)
+        self._active = next(b for b in self.backends if b.name == best)
+        self._record_locked(self.probe_latency_ms[best])
+        logger.info(f"[brightness] выбран механизм {best} ({self.probe_latency_ms[best]:.2f} мс)")
+        self._save_cached_locked()
+        return True
+
+    # ---------- кэш между запусками ----------
+    def _cache_key_locked(self, backend: Backend) -> List[Any]:
+        return [platform.system(), platform.release(), backend.name, backend.cache_key()]
+
+    def _load_cached_locked(self) -> Optional[Backend]:
+        if not self.cache_path:
+            return None
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        for backend in self.backends:
+            if isinstance(data, dict) and data.get('key') == self._cache_key_locked(backend):
+                if self._available_locked(backend):
+                    logger.debug(f"[brightness] механизм {backend.name} из кэша")
+                    return backend
+        return None
+
+    def _save_cached_locked(self):
+        if not self.cache_path or self._active is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            tmp_path = self.cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'key': self._cache_key_locked(self._active), 'probe_ms': self.probe_latency_ms}, f)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            logger.debug(f"[brightness] не удалось сохранить выбор механизма: {e}")
+
+
+class BrightnessController:
+    """Плавное изменение яркости к целевому значению на отдельном потоке.
+
+    apply(значение) — установка (обычно BrightnessResolver.set); initial() —
+    начальная яркость, читается один раз; on_settled(значение) — яркость дошла
+    до цели (например, сохранить её в cache).
+    """
+
+    def __init__(self, apply: Callable[[float], bool], initial: Callable[[], float],
+                 on_settled: Optional[Callable[[float], None]] = None,
+                 frame_interval: float = FRAME_INTERVAL, max_step: float = RAMP_STEP,
+                 clock: Callable[[], float] = time.monotonic):
+        self._apply = apply
+        self._initial = initial
+        self._on_settled = on_settled
+        self.frame_interval = frame_interval
+        self.max_step = max_step
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._current: Optional[float] = None
+        self._target: Optional[float] = None
+        self._busy = False
+        self._next_frame = 0.0
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.requests = 0
+        self.frames = 0
+
+    def _ensure_current_locked(self):
+        if self._current is None:
+            self._current = self._target = max(0.0, min(1.0, float(self._initial())))
+
+    @property
+    def target(self) -> float:
+        """Яркость, к которой идёт (или на которой остановилась) рампа."""
+        with self._cond:
+            self._ensure_current_locked()
+            return self._target
+
+    def set_target(self, value: float):
+        with self._cond:
+            self._ensure_current_locked()
+            self._request_locked(value)
+
+    def step(self, delta: float):
+        """Изменить цель на delta относительно текущей цели (а не от cache)."""
+        with self._cond:
+            self._ensure_current_locked()
+            self._request_locked(self._target + delta)
+
+    def assume(self, value: float):
+        """Яркость установлена в обход контроллера: принять её без вызова apply."""
+        value = max(0.0, min(1.0, float(value)))
+        with self._cond:
+            self._current = self._target = value
+            self._cond.notify_all()
+
+    def _request_locked(self, value: float):
+        self._target = max(0.0, min(1.0, float(value)))
+        self.requests += 1
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='BrightnessRamp', daemon=True)
+            self._thread.start()
+        self._cond.notify_all()
+
+    def wait_settled(self, timeout: Optional[float] = None) -> bool:
+        """Дождаться, пока яркость дойдёт до цели. False — не дошла за timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._current == self._target and not self._busy, timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if self._current != self._target:
+                        left = self._next_frame - self._clock()
+                        if left <= 0:
+                            break
+                        self._cond.wait(left)
+                    else:
+                        self._cond.wait()
+                if self._stopping:
+                    return
+                diff = self._target - self._current
+                value = self._target if abs(diff) <= self.max_step else self._current + (
+                    self.max_step if diff > 0 else -self.max_step)
+                self._current = value
+                self._busy = True
+            try:
+                self._apply(value)
+            except Exception as e:
+                logger.error(f"[brightness] ошибка установки яркости: {e}")
+            with self._cond:
+                self.frames += 1
+                self._next_frame = self._clock() + self.frame_interval
+                self._busy = False
+                settled = self._current == self._target
+                self._cond.notify_all()
+            if settled and self._on_settled is not None:
+                try:
+                    self._on_settled(value)
+                except Exception as e:
+                    logger.debug(f"[brightness] on_settled: {e}")
+
+    def stop(self):
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(1.0)
+
+
+_resolver: Optional[BrightnessResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver() -> BrightnessResolver:
+    """Общий resolver процесса (с кэшем выбора между запусками)."""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = BrightnessResolver(cache_path=BACKEND_CACHE_PATH)
+            atexit.register(_resolver.close)
+        return _resolver
+
+
+__all__ = [
+    'Backend', 'HelperServer', 'HelperBackend', 'CoreDisplayBackend', 'DisplayServicesBackend', 'BrightnessResolver',
+    'BrightnessController', 'default_backends', 'get_resolver', 'helper_path', 'BACKEND_CACHE_PATH',
+    'REPROBE_INTERVAL', 'FRAME_INTERVAL', 'RAMP_STEP',
+]
@@ -0,0 +1,98 @@
+"""Скомпилированный кэш hotkeys.json для быстрого холодного старта.
+
+Рядом с hotkeys.json лежит hotkeys.json.cache: заголовок (сигнатура, версия
+схемы, SHA-256 содержимого JSON) и сериализованный RuleSnapshot — уже
+проверенные правила вместе с индексами (DispatchIndex, trie последовательностей,
+таблицы приложений из правил). Загрузка — одно чтение файла и pickle.loads,
+без разбора JSON, _ensure_ids и сборки индексов.
+
+Источник истины — JSON. Кэш используется, только если хэш текущего содержимого
+JSON и версия схемы совпадают с записанными; иначе снимок строится из JSON
+и кэш перезаписывается. Правки отдельных правил в режиме json кэш только
+сбрасывают — новый пишется при выходе из процесса или при следующем запуске.
+Любая ошибка чтения кэша — просто промах.
+CACHE_SCHEMA нужно увеличивать при изменении Rule, RuleTable, DispatchIndex
+или SequenceTrie.
+
+Кэш пишет и читает только сам HotkeyMaster в своём каталоге настроек (pickle).
+"""
+from __future__ import annotations
+
+import os
+import pickle
+import struct
+import hashlib
+import logging
+import dataclasses
+from typing import Optional
+
+from rules import RuleSnapshot
+
+logger = logging.getLogger("hotkeymaster.config_cache")
+
+MAGIC = b'HKCC'
+CACHE_SCHEMA = 2
+CACHE_SUFFIX = '.cache'
+# сигнатура, версия схемы, версия pickle, SHA-256 содержимого JSON
+_HEADER = struct.Struct('<4sHH32s')
+
+
+def cache_path_for(json_path: str) -> str:
+    return json_path + CACHE_SUFFIX
+
+
+def content_digest(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+def load_snapshot(json_path: str, data: bytes, generation: int) -> Optional[RuleSnapshot]:
+    """Снимок из кэша для содержимого JSON data или None (промах/устаревший кэш)."""
+    try:
+        with open(cache_path_for(json_path), 'rb') as f:
+            blob = f.read()
+    except OSError:
+        return None
+    if len(blob) < _HEADER.size:
+        return None
+    magic, schema, _protocol, digest = _HEADER.unpack_from(blob, 0)
+    if magic != MAGIC or schema != CACHE_SCHEMA or digest != content_digest(data):
+        return None
+    try:
+        snap = pickle.loads(memoryview(blob)[_HEADER.size:])
+    except Exception as e:
+        logger.warning(f"Кэш конфигурации повреждён, будет пересобран: {e}")
+        return None
+    if not isinstance(snap, RuleSnapshot):
+        return None
+    return dataclasses.replace(snap, generation=generation)
+
+
+def store_snapshot(json_path: str, data: bytes, snap: RuleSnapshot) -> bool:
+    """Записать кэш для содержимого JSON data (атомарно). Ошибка записи не фатальна."""
+    path = cache_path_for(json_path)
+    tmp_path = path + '.tmp'
+    try:
+        payload = pickle.dumps(snap, protocol=pickle.HIGHEST_PROTOCOL)
+        header = _HEADER.pack(MAGIC, CACHE_SCHEMA, pickle.HIGHEST_PROTOCOL, content_digest(data))
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(payload)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        logger.warning(f"Не удалось записать кэш конфигурации {path}: {e}")
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        return False
+
+
+def invalidate(json_path: str):
+    try:
+        os.unlink(cache_path_for(json_path))
+    except OSError:
+        pass
+
+
+__all__ = ['CACHE_SCHEMA', 'cache_path_for', 'content_digest', 'load_snapshot', 'store_snapshot', 'invalidate']
@@ -0,0 +1,231 @@
+"""Фоновое отслеживание изменений конфигурационных файлов HotkeyMaster.
+
+Вместо stat() на каждое нажатие клавиши изменения hotkeys.json/settings.json
+обнаруживает отдельный поток, который перечитывает конфиг и публикует новое
+поколение. Слушатели клавиатуры/трекпада только читают уже готовые данные.
+
+Бэкенды:
+  - KqueueBackend — macOS/BSD: EVFILT_VNODE на каталоге и самих файлах;
+    поток спит, пока ядро не сообщит об изменении.
+  - PollingBackend — переносимый опрос с заданным интервалом (Linux, тесты).
+
+Изменение определяется по сигнатуре (inode, размер, mtime в наносекундах),
+поэтому атомарная замена через os.replace (_atomic_write_json) видна даже
+при записи в ту же секунду и с тем же размером — меняется inode.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import select
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("hotkeymaster.config_watcher")
+
+Signature = Optional[Tuple[int, int, int]]
+
+
+def file_signature(path: str) -> Signature:
+    """(inode, размер, mtime_ns) файла или None, если файла нет."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class PollingBackend:
+    """Опрос с фиксированным интервалом. Работает везде."""
+    name = 'poll'
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._wake = threading.Event()
+
+    def set_paths(self, paths: List[str]):
+        pass
+
+    def wait(self, timeout: Optional[float] = None):
+        self._wake.wait(self.interval if timeout is None else min(timeout, self.interval))
+        self._wake.clear()
+
+    def wake(self):
+        self._wake.set()
+
+    def close(self):
+        self._wake.set()
+
+
+class KqueueBackend:
+    """Ожидание через kqueue: каталоги (атомарные замены) + сами файлы (запись на месте)."""
+    name = 'kqueue'
+    # O_EVTONLY на macOS: дескриптор только для событий, не мешает размонтированию тома
+    _OPEN_FLAGS = 0x8000 if sys.platform == 'darwin' else os.O_RDONLY
+    _FFLAGS = (select.KQ_NOTE_WRITE | select.KQ_NOTE_DELETE | select.KQ_NOTE_RENAME |
+               select.KQ_NOTE_EXTEND | select.KQ_NOTE_ATTRIB) if hasattr(select, 'kqueue') else 0
+
+    def __init__(self):
+        self._kq = select.kqueue()
+        self._pipe_r, self._pipe_w = os.pipe()
+        self._fds: Dict[str, int] = {}
+        self._paths: List[str] = []
+        self._kq.control([select.kevent(self._pipe_r, select.KQ_FILTER_READ, select.KQ_EV_ADD)], 0, 0)
+
+    def _register(self, path: str):
+        try:
+            fd = os.open(path, self._OPEN_FLAGS)
+        except OSError:
+            return
+        self._fds[path] = fd
+        ev = select.kevent(fd, select.KQ_FILTER_VNODE, select.KQ_EV_ADD | select.KQ_EV_CLEAR, self._FFLAGS)
+        self._kq.control([ev], 0, 0)
+
+    def _close_fds(self):
+        for fd in self._fds.values():
+            try:
+                os.close(fd)  # закрытие дескриптора снимает его события из kqueue
+            except OSError:
+                pass
+        self._fds = {}
+
+    def set_paths(self, paths: List[str]):
+        self._paths = list(paths)
+        self._close_fds()
+        dirs = sorted({os.path.dirname(p) or '.' for p in self._paths})
+        for p in dirs + self._paths:
+            self._register(p)
+
+    def wait(self, timeout: Optional[float] = None):
+        events = self._kq.control(None, 8, timeout)
+        if any(ev.ident == self._pipe_r for ev in events):
+            try:
+                os.read(self._pipe_r, 512)
+            except OSError:
+                pass
+        if any(ev.ident != self._pipe_r for ev in events):
+            # После замены файла старый дескриптор указывает на удалённый inode — переоткрываем
+            self.set_paths(self._paths)
+
+    def wake(self):
+        try:
+            os.write(self._pipe_w, b'x')
+        except OSError:
+            pass
+
+    def close(self):
+        self._close_fds()
+        for fd in (self._pipe_r, self._pipe_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._kq.close()
+
+
+def create_backend(kind: Optional[str] = None):
+    """Лучший доступный бэкенд; HOTKEYMASTER_WATCHER=poll принудительно включает опрос."""
+    kind = kind or os.environ.get('HOTKEYMASTER_WATCHER', '')
+    if kind != 'poll' and hasattr(select, 'kqueue'):
+        try:
+            return KqueueBackend()
+        except Exception as e:
+            logger.warning(f"kqueue недоступен, используем опрос: {e}")
+    return PollingBackend()
+
+
+class ConfigWatcher:
+    """Следит за набором файлов и вызывает колбэки в своём потоке при их изменении.
+
+    generation увеличивается на каждое обнаруженное изменение; колбэки
+    выполняются вне потока ввода, поэтому могут читать и разбирать файлы.
+    """
+
+    # Страховочный таймаут ожидания kqueue: пропущенное событие не «потеряет» конфиг навсегда
+    SAFETY_TIMEOUT = 30.0
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._callbacks: Dict[str, List[Callable[[str], None]]] = {}
+        self._signatures: Dict[str, Signature] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.generation = 0
+
+    def watch(self, path: str, callback: Callable[[str], None]):
+        path = os.path.abspath(path)
+        with self._lock:
+            self._callbacks.setdefault(path, []).append(callback)
+            self._signatures.setdefault(path, file_signature(path))
+            paths = list(self._callbacks)
+        if self._backend is not None:
+            self._backend.set_paths(paths)
+            self._backend.wake()
+
+    def note_written(self, path: str):
+        """Запоминает текущую сигнатуру после собственной записи — без повторной перезагрузки."""
+        path = os.path.abspath(path)
+        with self._lock:
+            if path in self._signatures:
+                self._signatures[path] = file_signature(path)
+
+    def check_now(self) -> List[str]:
+        """Сверяет сигнатуры и вызывает колбэки изменившихся файлов. Возвращает их пути."""
+        changed = []
+        with self._lock:
+            for path in self._callbacks:
+                sig = file_signature(path)
+                if sig != self._signatures.get(path):
+                    self._signatures[path] = sig
+                    changed.append(path)
+            if changed:
+                self.generation += 1
+            callbacks = [(p, list(self._callbacks[p])) for p in changed]
+        for path, cbs in callbacks:
+            logger.debug(f"[watcher] изменён {path}, поколение {self.generation}")
+            for cb in cbs:
+                try:
+                    cb(path)
+                except Exception as e:
+                    logger.error(f"Ошибка обработчика изменения {path}: {e}")
+        return changed
+
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def start(self):
+        if self.is_running():
+            return
+        if self._backend is None:
+            self._backend = create_backend()
+        with self._lock:
+            paths = list(self._callbacks)
+        self._backend.set_paths(paths)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ConfigWatcherThread", daemon=True)
+        self._thread.start()
+        logger.info(f"Config watcher запущен (backend={self._backend.name})")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._backend is not None:
+            self._backend.wake()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._backend.wait(self.SAFETY_TIMEOUT)
+                if self._stop_event.is_set():
+                    break
+                self.check_now()
+            except Exception as e:
+                logger.error(f"Ошибка в config watcher: {e}")
+                self._stop_event.wait(1.0)
+
+
+__all__ = ['ConfigWatcher', 'PollingBackend', 'KqueueBackend', 'create_backend', 'file_signature']
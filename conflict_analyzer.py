@@ -0,0 +1,297 @@
+"""Анализ конфликтов всей конфигурации хоткеев.
+
+hotkey_engine.hotkey_conflicts проверяет один хоткей против списка — проверка
+всего набора через неё стоит O(N²). Здесь правила раскладываются по корзинам
+(тип + vk для клавиатуры, жест для трекпада), внутри корзины — по маске
+модификаторов и области действия, так что сравниваются только группы, которые
+действительно могут пересечься. Время — почти линейное по числу правил плюс
+размер ответа (сами конфликтующие пары).
+
+Семантика конфликтов в точности совпадает с hotkey_conflicts (эталон):
+  - сравниваются только правила одного типа;
+  - клавиатура: одинаковый vk (не None) и пересекающиеся маски (modifiers.overlaps:
+    strict — равные основные модификаторы, иначе одна маска — подмножество
+    другой); неизвестные имена модификаторов
+    игнорируются; последовательности (sequence) — удар за ударом, конфликт,
+    если более короткая совпадает с началом более длинной;
+  - трекпад: одинаковый gesture;
+  - области: global пересекается со всем, app — только с тем же app.
+Отключённые правила участвуют, как и в эталоне.
+
+Запуск без приложения (работает на любой ОС, Quartz/PyQt5 не нужны):
+    python conflict_analyzer.py [hotkeys.json] [--strict] [--json]
+Код возврата: 0 — конфликтов нет, 1 — есть конфликты, 2 — ошибка чтения.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import argparse
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from modifiers import parse_mods, mask_to_names, overlaps
+from hotkey_sequences import Stroke, rule_strokes, strokes_conflict
+
+Pair = Tuple[int, int]
+
+
+def _scope_key(hk: Dict[str, Any]) -> Optional[str]:
+    """None — глобальное правило, иначе имя приложения (как в scopes_overlap эталона)."""
+    if hk.get('scope', 'global') == 'global':
+        return None
+    return hk.get('app', '') or ''
+
+
+class _DisjointSet:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union_all(self, items: List[int]):
+        if len(items) < 2:
+            return
+        root = self.find(items[0])
+        for i in items[1:]:
+            r = self.find(i)
+            if r != root:
+                self.parent[r] = root
+
+
+class _ScopeGroup:
+    """Правила одной маски (или одного жеста), разложенные по областям действия."""
+    __slots__ = ('all', 'globals', 'apps')
+
+    def __init__(self):
+        self.all: List[int] = []
+        self.globals: List[int] = []
+        self.apps: Dict[str, List[int]] = {}
+
+    def add(self, idx: int, scope: Optional[str]):
+        self.all.append(idx)
+        if scope is None:
+            self.globals.append(idx)
+        else:
+            self.apps.setdefault(scope, []).append(idx)
+
+
+def _pairs_within(g: _ScopeGroup) -> Iterator[Pair]:
+    """Конфликтующие пары внутри одной группы: с участием global либо в одном app."""
+    glob = set(g.globals)
+    for i in g.globals:
+        for j in g.all:
+            if j != i and (j not in glob or i < j):
+                yield (i, j)
+    for members in g.apps.values():
+        for pos, i in enumerate(members):
+            for j in members[pos + 1:]:
+                yield (i, j)
+
+
+def _pairs_between(a: _ScopeGroup, b: _ScopeGroup) -> Iterator[Pair]:
+    for i in a.globals:
+        for j in b.all:
+            yield (i, j)
+    for app, members in a.apps.items():
+        for i in members:
+            for j in b.globals:
+                yield (i, j)
+            for j in b.apps.get(app, ()):
+                yield (i, j)
+
+
+def _union_within(ds: _DisjointSet, g: _ScopeGroup):
+    if g.globals:
+        ds.union_all(g.all)  # global конфликтует со всеми в группе
+        return
+    for members in g.apps.values():
+        ds.union_all(members)
+
+
+def _union_between(ds: _DisjointSet, a: _ScopeGroup, b: _ScopeGroup):
+    if a.globals:
+        ds.union_all(a.globals + b.all)
+    if b.globals:
+        ds.union_all(b.globals + a.all)
+    for app, members in a.apps.items():
+        other = b.apps.get(app)
+        if other:
+            ds.union_all(members + other)
+
+
+@dataclass(frozen=True, slots=True)
+class ConflictGroup:
+    """Связная группа конфликтующих правил с общим триггером."""
+    kind: str                    # 'keyboard' | 'trackpad' (тип правил)
+    trigger: Hashable            # vk или имя жеста
+    members: Tuple[int, ...]     # индексы правил в исходном списке
+
+
+@dataclass(frozen=True, slots=True)
+class ConflictReport:
+    strict: bool
+    rules_count: int
+    groups: Tuple[ConflictGroup, ...]
+    pairs: Tuple[Pair, ...] = field(repr=False)
+
+    @property
+    def has_conflicts(self) -> bool:
+        return bool(self.pairs)
+
+    def to_dict(self, hotkeys: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Машиночитаемый отчёт (для --json и внешних проверок)."""
+        def describe(idx: int) -> Dict[str, Any]:
+            hk = hotkeys[idx]
+            d = {'index': idx, 'id': hk.get('id'), 'type': hk.get('type', 'keyboard'),
+                 'scope': hk.get('scope', 'global'), 'app': hk.get('app', '') or '',
+                 'enabled': hk.get('enabled', True), 'action': hk.get('action', '')}
+            if d['type'] == 'trackpad':
+                d['gesture'] = hk.get('gesture')
+            elif hk.get('sequence'):
+                d['sequence'] = [c.get('disp', '') for c in hk['sequence'] if isinstance(c, dict)]
+                d['disp'] = ' → '.join(d['sequence'])
+            else:
+                combo = hk.get('combo') or {}
+                d['vk'] = combo.get('vk')
+                d['mods'] = mask_to_names(parse_mods(combo.get('mods', []), ignore_unknown=True))
+                d['disp'] = combo.get('disp', '')
+            return d
+        return {
+            'strict': self.strict,
+            'rules': self.rules_count,
+            'conflicts': len(self.pairs),
+            'groups': [
+                {'kind': g.kind, 'trigger': g.trigger, 'rules': [describe(i) for i in g.members]}
+                for g in self.groups
+            ],
+            'pairs': [[i, j] for i, j in self.pairs],
+        }
+
+
+def analyze_conflicts(hotkeys: List[Dict[str, Any]], strict: bool = False,
+                      collect_pairs: bool = True) -> ConflictReport:
+    """Все конфликты набора правил. collect_pairs=False — только группы
+    (строго линейно, без перечисления пар)."""
+    # (тип, триггер) -> маска -> группа по областям; у трекпада маска всегда 0
+    buckets: Dict[Tuple[str, Hashable], Dict[int, _ScopeGroup]] = {}
+    sequences: Dict[Tuple[str, Hashable], List[Tuple[int, Tuple[Stroke, ...]]]] = {}
+    for idx, hk in enumerate(hotkeys):
+        hk_type = hk.get('type', 'keyboard')
+        if hk_type == 'trackpad':
+            trigger, mask = hk.get('gesture'), 0
+        else:
+            strokes = rule_strokes(hk)
+            if strokes is None:
+                continue
+            if len(strokes) > 1:
+                # Последовательности сравниваются отдельно — с правилами корзины их первого удара
+                sequences.setdefault((hk_type, strokes[0][0]), []).append((idx, strokes))
+                continue
+            trigger, mask = strokes[0]
+        buckets.setdefault((hk_type, trigger), {}).setdefault(mask, _ScopeGroup()).add(idx, _scope_key(hk))
+
+    ds = _DisjointSet(len(hotkeys))
+    pairs: List[Pair] = []
+    for (hk_type, _trigger), by_mask in buckets.items():
+        masks = list(by_mask)
+        for m in masks:
+            g = by_mask[m]
+            _union_within(ds, g)
+            if collect_pairs:
+                pairs.extend(_pairs_within(g))
+        if hk_type == 'trackpad':
+            continue
+        # Различных масок у одной клавиши единицы — попарный перебор масок дёшев.
+        # Разные маски пересекаются и в строгом режиме (LCmd и Cmd, Cmd и Cmd+Fn)
+        for pos, a in enumerate(masks):
+            for b in masks[pos + 1:]:
+                if overlaps(a, b, strict):
+                    _union_between(ds, by_mask[a], by_mask[b])
+                    if collect_pairs:
+                        pairs.extend(_pairs_between(by_mask[a], by_mask[b]))
+
+    # Конфликты префикса: последовательность против одиночных и других последовательностей
+    # с тем же первым ударом (число последовательностей обычно невелико)
+    for key, seqs in sequences.items():
+        singles = [(i, rule_strokes(hotkeys[i])) for g in buckets.get(key, {}).values() for i in g.all]
+        for pos, (i, strokes) in enumerate(seqs):
+            scope_i = _scope_key(hotkeys[i])
+            for j, other in singles + seqs[pos + 1:]:
+                scope_j = _scope_key(hotkeys[j])
+                if scope_i is not None and scope_j is not None and scope_i != scope_j:
+                    continue
+                if strokes_conflict(strokes, other, strict):
+                    ds.union_all([i, j])
+                    if collect_pairs:
+                        pairs.append((i, j))
+        buckets.setdefault(key, {})  # чтобы корзина из одних последовательностей попала в отчёт
+
+    components: Dict[int, List[int]] = {}
+    triggers: Dict[int, Tuple[str, Hashable]] = {}
+    for key, by_mask in buckets.items():
+        members = [i for g in by_mask.values() for i in g.all] + [i for i, _ in sequences.get(key, ())]
+        for i in members:
+            root = ds.find(i)
+            components.setdefault(root, []).append(i)
+            triggers[root] = key
+    groups = [
+        ConflictGroup(triggers[root][0], triggers[root][1], tuple(sorted(members)))
+        for root, members in components.items() if len(members) > 1
+    ]
+    groups.sort(key=lambda g: g.members[0])
+    return ConflictReport(
+        strict=strict,
+        rules_count=len(hotkeys),
+        groups=tuple(groups),
+        pairs=tuple(sorted((min(i, j), max(i, j)) for i, j in pairs)),
+    )
+
+
+def _default_hotkeys_path() -> str:
+    return os.environ.get('HOTKEYMASTER_HOTKEYS_FILE', os.path.join(
+        os.path.expanduser('~'), 'Library', 'Application Support', 'HotkeyMaster', 'hotkeys.json'))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Проверка конфликтов в hotkeys.json')
+    parser.add_argument('path', nargs='?', default=None, help='путь к hotkeys.json')
+    parser.add_argument('--strict', action='store_true', help='строгое сравнение модификаторов')
+    parser.add_argument('--json', action='store_true', help='вывести отчёт в JSON')
+    args = parser.parse_args(argv)
+    path = args.path or _default_hotkeys_path()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            hotkeys = json.load(f)
+        if not isinstance(hotkeys, list):
+            raise ValueError('ожидается список хоткеев')
+    except Exception as e:
+        print(f'Не удалось прочитать {path}: {e}', file=sys.stderr)
+        return 2
+    report = analyze_conflicts(hotkeys, strict=args.strict)
+    if args.json:
+        json.dump(report.to_dict(hotkeys), sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write('\n')
+    else:
+        print(f'{path}: правил {report.rules_count}, конфликтующих пар {len(report.pairs)}, '
+              f'групп {len(report.groups)} (strict={report.strict})')
+        for n, group in enumerate(report.to_dict(hotkeys)['groups'], 1):
+            print(f'[{n}] {group["kind"]} {group["trigger"]}:')
+            for r in group['rules']:
+                what = r.get('disp') or r.get('gesture') or '+'.join(r.get('mods') or [])
+                where = r['app'] if r['scope'] != 'global' else 'global'
+                print(f'    #{r["index"]} id={r["id"]} {what} [{where}] -> {r["action"]}')
+    return 1 if report.has_conflicts else 0
+
+
+__all__ = ['ConflictGroup', 'ConflictReport', 'analyze_conflicts', 'main']
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,41 +1,116 @@
 // coredisplay_helper.c
 // Лёгкий C‑бинарь для управления яркостью через приватный CoreDisplay.framework
+//
+// coredisplay_helper <value>   — установить яркость главного дисплея и выйти
+// coredisplay_helper           — режим сервера: команды построчно из stdin,
+//                                фреймворки загружаются один раз на весь процесс:
+//   set <value> [display]  ->  ok | err <code>
+//   get [display]          ->  ok <value> | err <code>
+//   quit
+// После запуска сервер печатает "ready"; на каждую команду — ровно одна строка ответа.
 #include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
 #include <dlfcn.h>
 #include <CoreGraphics/CoreGraphics.h>
 
-int main(int argc, char *argv[]) {
-    if (argc != 2) {
-        fprintf(stderr, "Usage: coredisplay_helper <value>\n");
-        return 1;
-    }
-    float val = strtof(argv[1], NULL);
-    uint32_t disp = CGMainDisplayID();
-    // Попытка через DisplayServices.framework (Apple Silicon)
+typedef int (*DSSetBr)(uint32_t, float);
+typedef int (*DSGetBr)(uint32_t, float *);
+typedef int (*CDSetBr)(uint32_t, float);
+typedef double (*CDGetBr)(uint32_t);
+
+static DSSetBr ds_set = NULL;
+static DSGetBr ds_get = NULL;
+static CDSetBr cd_set = NULL;
+static CDGetBr cd_get = NULL;
+
+static void load_frameworks(void) {
+    // DisplayServices.framework (Apple Silicon), затем CoreDisplay.framework
     void *handle_ds = dlopen("/System/Library/PrivateFrameworks/DisplayServices.framework/DisplayServices", RTLD_LAZY);
     if (handle_ds) {
-        typedef int (*DSSetBr)(uint32_t, float);
-        DSSetBr ds_fn = (DSSetBr)dlsym(handle_ds, "DisplayServicesSetBrightness");
-        if (ds_fn) {
-            int res = ds_fn(disp, val);
-            dlclose(handle_ds);
-            return (res == 0) ? 0 : res;
-        }
-        dlclose(handle_ds);
+        ds_set = (DSSetBr)dlsym(handle_ds, "DisplayServicesSetBrightness");
+        ds_get = (DSGetBr)dlsym(handle_ds, "DisplayServicesGetBrightness");
     }
-    // Fallback: через CoreDisplay.framework, если доступен
     void *handle_cd = dlopen("/System/Library/PrivateFrameworks/CoreDisplay.framework/CoreDisplay", RTLD_LAZY);
     if (handle_cd) {
-        typedef int (*CDSetBr)(uint32_t, float);
-        CDSetBr cd_fn = (CDSetBr)dlsym(handle_cd, "CoreDisplay_Display_SetUserBrightness");
-        if (cd_fn) {
-            int res = cd_fn(disp, val);
-            dlclose(handle_cd);
-            return (res == 0) ? 0 : res;
+        cd_set = (CDSetBr)dlsym(handle_cd, "CoreDisplay_Display_SetUserBrightness");
+        cd_get = (CDGetBr)dlsym(handle_cd, "CoreDisplay_Display_GetUserBrightness");
+    }
+}
+
+static int set_brightness(uint32_t disp, float val) {
+    if (ds_set) {
+        return ds_set(disp, val);
+    }
+    if (cd_set) {
+        return cd_set(disp, val);
+    }
+    return -1;
+}
+
+static int get_brightness(uint32_t disp, float *val) {
+    if (ds_get) {
+        return ds_get(disp, val);
+    }
+    if (cd_get) {
+        *val = (float)cd_get(disp);
+        return 0;
+    }
+    return -1;
+}
+
+static int serve(void) {
+    char line[256];
+    printf("ready\n");
+    fflush(stdout);
+    while (fgets(line, sizeof(line), stdin)) {
+        char cmd[16] = {0};
+        char arg1[64] = {0};
+        char arg2[64] = {0};
+        int n = sscanf(line, "%15s %63s %63s", cmd, arg1, arg2);
+        if (n < 1) {
+            printf("err empty\n");
+        } else if (strcmp(cmd, "set") == 0 && n >= 2) {
+            uint32_t disp = (n == 3) ? (uint32_t)strtoul(arg2, NULL, 10) : CGMainDisplayID();
+            int res = set_brightness(disp, strtof(arg1, NULL));
+            if (res == 0) {
+                printf("ok\n");
+            } else {
+                printf("err %d\n", res);
+            }
+        } else if (strcmp(cmd, "get") == 0) {
+            uint32_t disp = (n >= 2) ? (uint32_t)strtoul(arg1, NULL, 10) : CGMainDisplayID();
+            float val = 0;
+            int res = get_brightness(disp, &val);
+            if (res == 0) {
+                printf("ok %.4f\n", val);
+            } else {
+                printf("err %d\n", res);
+            }
+        } else if (strcmp(cmd, "quit") == 0) {
+            break;
+        } else {
+            printf("err unknown\n");
         }
-        dlclose(handle_cd);
+        fflush(stdout);
     }
-    fprintf(stderr, "Failed to load brightness API\n");
-    return 1;
-}
\ No newline at end of file
+    return 0;
+}
+
+int main(int argc, char *argv[]) {
+    if (argc > 2) {
+        fprintf(stderr, "Usage: coredisplay_helper [<value>]\n");
+        return 1;
+    }
+    load_frameworks();
+    if (argc == 1) {
+        return serve();
+    }
+    if (!ds_set && !cd_set) {
+        fprintf(stderr, "Failed to load brightness API\n");
+        return 1;
+    }
+    float val = strtof(argv[1], NULL);
+    int res = set_brightness(CGMainDisplayID(), val);
+    return (res == 0) ? 0 : res;
+}
@@ -0,0 +1,214 @@
+"""Бортовой самописец клавиатурных событий.
+
+Кольцевой буфер фиксированного размера, выделенный один раз: каждая запись —
+24 байта, упакованных struct.pack_into прямо в bytearray (без создания строк
+и объектов на нажатие). Хранит время, vk, флаги модификаторов, число
+кандидатов, сработавшее/отклонённое правило, причину решения и время обработки.
+Заменяет logger.debug на каждое нажатие: в проде уровень ERROR, а строки
+всё равно форматировались, и при этом понять, почему хоткей не сработал, было нельзя.
+
+Буфер пишет только поток event tap. Дамп делается по запросу (меню трея,
+hotkey_engine.dump_flight_recorder) и при падении; последняя запись дампа
+может оказаться «разорванной», если поток ввода писал её в этот момент.
+
+Расшифровка дампа:
+    python flight_recorder.py HotkeyMaster-flight-....bin
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from modifiers import MODIFIER_MASK, mask_to_names
+
+# Причины решения по событию
+FIRED = 0            # действие поставлено в очередь
+NO_MATCH = 1         # нет правил для (vk, модификаторы) в таблице активного приложения
+DEBOUNCED = 2        # подавлено окном повторов (throttle или событие без признака автоповтора)
+QUEUE_FULL = 3       # очередь действий переполнена, действие отброшено
+TAP_REENABLED = 4    # macOS отключил tap, включили обратно
+REPEAT_SUPPRESSED = 5  # автоповтор удержания отброшен политикой правила
+SEQUENCE_PREFIX = 6  # нажатие продолжило многоударную последовательность, ждём следующий удар
+
+REASON_NAMES = {
+    FIRED: 'FIRED',
+    NO_MATCH: 'NO_MATCH',
+    DEBOUNCED: 'DEBOUNCED',
+    QUEUE_FULL: 'QUEUE_FULL',
+    TAP_REENABLED: 'TAP_REENABLED',
+    REPEAT_SUPPRESSED: 'REPEAT_SUPPRESSED',
+    SEQUENCE_PREFIX: 'SEQUENCE_PREFIX',
+}
+
+# t_ns, flags, слот id правила (0 — нет), длительность нс, vk, причина, число кандидатов
+_RECORD = struct.Struct('<QIIIHBB')
+RECORD_SIZE = _RECORD.size
+# Поле слота id правила внутри записи (после t_ns и flags) — для перенумерации
+_SLOT = struct.Struct('<I')
+_SLOT_OFFSET = 12
+_HEADER = struct.Struct('<4sHHIQqI')
+MAGIC = b'HKFR'
+VERSION = 1
+DEFAULT_CAPACITY = 4096
+_U32 = 0xFFFFFFFF
+
+
+class FlightRecord(NamedTuple):
+    t_ns: int           # time.monotonic_ns() начала обработки
+    vk: int
+    flags: int
+    reason: int
+    rule_id: Optional[str]
+    candidates: int
+    duration_ns: int
+
+
+class FlightRecorder:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = max(1, int(capacity))
+        self._buf = bytearray(self.capacity * RECORD_SIZE)
+        self._count = 0  # всего записей с момента создания (позиция = count % capacity)
+        # Интернирование id правил: в запись попадает номер, строка хранится один раз.
+        # Таблица ограничена: при переполнении в ней остаются только id, на которые
+        # ещё ссылается кольцо (их не больше capacity), — см. _compact_ids
+        self._slots: Dict[str, int] = {}
+        self._ids: List[str] = ['']
+        self._max_ids = 2 * self.capacity + 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def record(self, t_ns: int, vk: int, flags: int, reason: int, rule_id: Optional[str] = None,
+               candidates: int = 0, duration_ns: int = 0):
+        """Одна запись: pack_into в заранее выделенный буфер. Вызывать из одного потока."""
+        slot = 0
+        if rule_id is not None:
+            slot = self._slots.get(rule_id, 0)
+            if not slot:
+                if len(self._ids) >= self._max_ids:
+                    self._compact_ids()
+                slot = len(self._ids)
+                self._ids.append(rule_id)
+                self._slots[rule_id] = slot
+        n = self._count
+        _RECORD.pack_into(self._buf, (n % self.capacity) * RECORD_SIZE, t_ns, flags & _U32, slot,
+                          min(duration_ns, _U32), vk & 0xFFFF, reason, min(candidates, 255))
+        self._count = n + 1
+
+    def clear(self):
+        self._count = 0
+        self._slots = {}
+        self._ids = ['']
+
+    def _compact_ids(self):
+        """Оставить в таблице id только те, что есть в кольце, и перенумеровать слоты в записях.
+
+        Между заменой таблицы и переписыванием записей дамп из другого потока может
+        показать неверные id — как и «разорванная» последняя запись, это допустимо."""
+        buf, capacity = self._buf, self.capacity
+        n = min(self._count, capacity)
+        ids: List[str] = ['']
+        slots: Dict[str, int] = {}
+        remap = {0: 0}
+        for k in range(self._count - n, self._count):
+            offset = (k % capacity) * RECORD_SIZE + _SLOT_OFFSET
+            old = _SLOT.unpack_from(buf, offset)[0]
+            new = remap.get(old)
+            if new is None:
+                rule_id = self._ids[old] if old < len(self._ids) else ''
+                new = slots.get(rule_id, 0) if rule_id else 0
+                if rule_id and not new:
+                    new = len(ids)
+                    ids.append(rule_id)
+                    slots[rule_id] = new
+                remap[old] = new
+            if new != old:
+                _SLOT.pack_into(buf, offset, new)
+        self._slots, self._ids = slots, ids
+
+    def records(self) -> List[FlightRecord]:
+        """Записи в хронологическом порядке (не больше capacity последних)."""
+        return _decode(bytes(self._buf), self._count, self.capacity, list(self._ids))
+
+    def dumps(self) -> bytes:
+        buf, count, ids = bytes(self._buf), self._count, list(self._ids)
+        # Смещение монотонных часов относительно настенных — для читаемых дат при расшифровке
+        wall_offset = time.time_ns() - time.monotonic_ns()
+        ids_blob = json.dumps(ids, ensure_ascii=False).encode('utf-8')
+        header = _HEADER.pack(MAGIC, VERSION, RECORD_SIZE, self.capacity, count, wall_offset, len(ids_blob))
+        return header + ids_blob + buf
+
+    def dump(self, path: str) -> str:
+        data = self.dumps()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+
+def _decode(buf: bytes, count: int, capacity: int, ids: List[str]) -> List[FlightRecord]:
+    n = min(count, capacity)
+    start = count - n
+    res = []
+    for k in range(start, count):
+        t_ns, flags, slot, dur, vk, reason, cand = _RECORD.unpack_from(buf, (k % capacity) * RECORD_SIZE)
+        rule_id = ids[slot] if 0 < slot < len(ids) else None
+        res.append(FlightRecord(t_ns, vk, flags, reason, rule_id, cand, dur))
+    return res
+
+
+def load_dump(data: bytes) -> Tuple[int, List[FlightRecord]]:
+    """Разбор дампа. Возвращает (смещение настенных часов в нс, записи)."""
+    magic, version, rec_size, capacity, count, wall_offset, ids_len = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError('не дамп HotkeyMaster (неверная сигнатура)')
+    if version != VERSION or rec_size != RECORD_SIZE:
+        raise ValueError(f'неподдерживаемая версия дампа: {version}/{rec_size}')
+    pos = _HEADER.size
+    ids = json.loads(data[pos:pos + ids_len].decode('utf-8'))
+    pos += ids_len
+    return wall_offset, _decode(data[pos:pos + capacity * RECORD_SIZE], count, capacity, ids)
+
+
+def format_record(rec: FlightRecord, wall_offset: int = 0) -> str:
+    wall = (rec.t_ns + wall_offset) / 1e9
+    stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(wall)) + f'.{int(wall * 1000) % 1000:03d}'
+    reason = REASON_NAMES.get(rec.reason, str(rec.reason))
+    if rec.reason == TAP_REENABLED:
+        return f'{stamp} {reason}'
+    mods = '+'.join(mask_to_names(rec.flags & MODIFIER_MASK)) or '-'
+    rule = f' rule={rec.rule_id}' if rec.rule_id else ''
+    return (f'{stamp} vk={rec.vk} mods={mods} {reason}{rule} '
+            f'candidates={rec.candidates} {rec.duration_ns / 1000:.1f}us')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Расшифровка дампа бортового самописца HotkeyMaster')
+    parser.add_argument('path', help='файл дампа')
+    args = parser.parse_args(argv)
+    try:
+        with open(args.path, 'rb') as f:
+            wall_offset, records = load_dump(f.read())
+    except Exception as e:
+        print(f'Не удалось прочитать {args.path}: {e}', file=sys.stderr)
+        return 2
+    for rec in records:
+        print(format_record(rec, wall_offset))
+    return 0
+
+
+__all__ = [
+    'FlightRecorder', 'FlightRecord', 'load_dump', 'format_record', 'main',
+    'FIRED', 'NO_MATCH', 'DEBOUNCED', 'QUEUE_FULL', 'TAP_REENABLED', 'REPEAT_SUPPRESSED',
+    'SEQUENCE_PREFIX', 'REASON_NAMES',
+]
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""Кэш активного (frontmost) приложения, обновляемый по событиям.
+
+Раньше на каждое сработавшее app-правило вызывался CGWindowListCopyWindowInfo
+со сканом всех окон — прямо в потоке ввода. Теперь FrontmostAppTracker
+подписывается на NSWorkspaceDidActivateApplicationNotification и хранит
+готовый AppInfo(name, bundle_id, pid): чтение — O(1) без системных вызовов.
+Если подписка недоступна (нет AppKit, трекер не запущен), используется
+запрос NSWorkspace.frontmostApplication() / CGWindowList с TTL-кэшем.
+
+App-правила сопоставляются по bundle ID (точно), а для старых конфигов,
+где записано только имя приложения, — прежней проверкой вхождения имени.
+"""
+from __future__ import annotations
+
+import os
+import time
+import logging
+import plistlib
+import threading
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Union
+
+logger = logging.getLogger("hotkeymaster.frontmost_app")
+
+ACTIVATE_NOTIFICATION = 'NSWorkspaceDidActivateApplicationNotification'
+
+
+@dataclass(frozen=True, slots=True)
+class AppInfo:
+    name: str
+    bundle_id: str = ''
+    pid: int = 0
+
+
+def _info_from_running_app(app) -> Optional[AppInfo]:
+    if app is None:
+        return None
+    try:
+        return AppInfo(str(app.localizedName() or ''), str(app.bundleIdentifier() or ''),
+                       int(app.processIdentifier()))
+    except Exception:
+        return None
+
+
+def query_frontmost_app() -> Optional[AppInfo]:
+    """Прямой (дорогой) запрос активного приложения."""
+    try:
+        import AppKit
+        info = _info_from_running_app(AppKit.NSWorkspace.sharedWorkspace().frontmostApplication())
+        if info is not None:
+            return info
+    except Exception as e:
+        logger.debug(f"NSWorkspace.frontmostApplication недоступен: {e}")
+    # Последний вариант — скан окон (только имя)
+    from actions import query_active_app_name
+    name = query_active_app_name()
+    return AppInfo(name) if name else None
+
+
+def looks_like_bundle_id(value: str) -> bool:
+    return '.' in value and ' ' not in value
+
+
+def app_matches(rule_app: str, info: Union[AppInfo, str, None], rule_bundle_id: str = '') -> bool:
+    """Подходит ли активное приложение под область действия правила.
+    rule_bundle_id (или app, записанный как bundle ID) сравнивается точно,
+    имя приложения — вхождением, как в старых версиях."""
+    if info is None:
+        return False
+    if isinstance(info, str):
+        info = AppInfo(info)
+    if rule_bundle_id:
+        return info.bundle_id == rule_bundle_id
+    if not rule_app:
+        return True
+    if info.bundle_id and looks_like_bundle_id(rule_app):
+        return info.bundle_id == rule_app
+    return bool(info.name) and rule_app in info.name
+
+
+def bundle_id_for_app_name(name: str) -> str:
+    """Bundle ID приложения по имени .app (для сохранения в правило из UI)."""
+    if not name:
+        return ''
+    bundle = name if name.endswith('.app') else name + '.app'
+    for base in ('/Applications', '/System/Applications', '/Applications/Utilities'):
+        path = os.path.join(base, bundle, 'Contents', 'Info.plist')
+        try:
+            with open(path, 'rb') as f:
+                return str(plistlib.load(f).get('CFBundleIdentifier', '') or '')
+        except Exception:
+            continue
+    return ''
+
+
+class FrontmostAppTracker:
+    def __init__(self, ttl: float = 1.0, query: Callable[[], Optional[AppInfo]] = query_frontmost_app):
+        self.ttl = ttl
+        self._query = query
+        self._current: Optional[AppInfo] = None
+        self._queried_at: Optional[float] = None
+        self._observer = None
+        self._center = None
+        self._listeners: List[Callable[[Optional[AppInfo]], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def observing(self) -> bool:
+        return self._observer is not None
+
+    def current(self) -> Optional[AppInfo]:
+        """Активное приложение. При работающей подписке — O(1) без системных вызовов."""
+        if self._observer is not None:
+            return self._current
+        now = time.monotonic()
+        if self._queried_at is None or now - self._queried_at >= self.ttl:
+            with self._lock:
+                if self._queried_at is None or now - self._queried_at >= self.ttl:
+                    self._current = self._query()
+                    self._queried_at = now
+        return self._current
+
+    def add_listener(self, callback: Callable[[Optional[AppInfo]], None]):
+        """callback(AppInfo) вызывается при каждой смене активного приложения."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        try:
+            self._listeners.remove(callback)
+        except ValueError:
+            pass
+
+    def set_current(self, info: Optional[AppInfo]):
+        """Публикует новое активное приложение (из уведомления или вручную в тестах)."""
+        if info == self._current and self._queried_at is not None:
+            return
+        self._current = info
+        self._queried_at = time.monotonic()
+        for cb in list(self._listeners):
+            try:
+                cb(info)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика смены приложения: {e}")
+
+    def start(self) -> bool:
+        """Подписаться на активацию приложений (вызывать из главного потока)."""
+        if self._observer is not None:
+            return True
+        try:
+            import AppKit
+            workspace = AppKit.NSWorkspace.sharedWorkspace()
+            center = workspace.notificationCenter()
+
+            def on_activate(notification):
+                try:
+                    app = notification.userInfo().get('NSWorkspaceApplicationKey')
+                    self.set_current(_info_from_running_app(app))
+                except Exception as e:
+                    logger.error(f"Ошибка обработки активации приложения: {e}")
+
+            self._observer = center.addObserverForName_object_queue_usingBlock_(
+                ACTIVATE_NOTIFICATION, None, None, on_activate)
+            self._center = center
+            self.set_current(_info_from_running_app(workspace.frontmostApplication()))
+            logger.info("Отслеживание активного приложения запущено")
+            return True
+        except Exception as e:
+            logger.warning(f"Подписка на активацию приложений недоступна, используем TTL-опрос: {e}")
+            self._observer = None
+            return False
+
+    def stop(self):
+        if self._observer is not None and self._center is not None:
+            try:
+                self._center.removeObserver_(self._observer)
+            except Exception as e:
+                logger.error(f"Ошибка отписки от активации приложений: {e}")
+        self._observer = None
+        self._center = None
+        self._queried_at = None
+
+
+_tracker: Optional[FrontmostAppTracker] = None
+
+
+def get_tracker() -> FrontmostAppTracker:
+    """Общий для процесса трекер активного приложения."""
+    global _tracker
+    if _tracker is None:
+        _tracker = FrontmostAppTracker()
+    return _tracker
+
+
+__all__ = [
+    'AppInfo', 'FrontmostAppTracker', 'get_tracker', 'app_matches',
+    'query_frontmost_app', 'bundle_id_for_app_name', 'looks_like_bundle_id',
+]
@@ -3,6 +3,7 @@ import json
 import threading
 import Quartz
 import logging
+import modifiers
 
 logger = logging.getLogger('hotkeymaster.capture_helper')
 
@@ -10,17 +11,9 @@ def main():
     result = {}
     captured = threading.Event()
     def get_mods(flags):
-        MODS_MAP = {
-            Quartz.kCGEventFlagMaskCommand: 'Cmd',
-            Quartz.kCGEventFlagMaskShift: 'Shift',
-            Quartz.kCGEventFlagMaskAlternate: 'Alt',
-            Quartz.kCGEventFlagMaskControl: 'Ctrl',
-        }
-        mods = set()
-        for mask, name in MODS_MAP.items():
-            if flags & mask:
-                mods.add(name)
-        return sorted(mods)
+        # Записываем только основные модификаторы: Fn macOS выставляет сам
+        # для стрелок/F-клавиш, а левый/правый вариант пользователь задаёт явно
+        return modifiers.mask_to_names(flags & modifiers.CORE_MASK)
     def event_callback(proxy, type_, event, refcon):
         if type_ != Quartz.kCGEventKeyDown:
             return event
@@ -0,0 +1,126 @@
+"""Скомпилированный индекс диспетчеризации клавиатурных хоткеев.
+
+Индекс строится один раз на каждую версию конфигурации и отвечает на вопрос
+«какие правила подходят под (vk, модификаторы)» одним обращением к словарю —
+независимо от количества правил. Порядок кандидатов совпадает с порядком
+правил в hotkeys.json, поэтому приоритет «первое подходящее правило» сохраняется.
+
+Модуль не зависит от Quartz/PyQt5 и может использоваться в тестах на любой ОС.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Tuple
+
+from modifiers import CORE_MASK
+
+if TYPE_CHECKING:
+    from rules import Rule
+
+
+def _supersets(mask: int) -> List[int]:
+    """Все основные маски событий, содержащие mask (для нестрогого сравнения)."""
+    free = CORE_MASK & ~mask
+    res = []
+    sub = free
+    while True:
+        res.append(mask | sub)
+        if sub == 0:
+            break
+        sub = (sub - 1) & free
+    return res
+
+
+def _indexed(rule: 'Rule') -> bool:
+    return rule.type == 'keyboard' and rule.enabled and rule.vk is not None and rule.mods is not None
+
+
+def _drop(table: Dict[Tuple[int, int], Tuple['Rule', ...]], key: Tuple[int, int], rule_id: str) -> bool:
+    bucket = table.get(key, ())
+    kept = tuple(r for r in bucket if r.id != rule_id)
+    if len(kept) == len(bucket):
+        return False
+    if kept:
+        table[key] = kept
+    else:
+        del table[key]
+    return True
+
+
+def _insert(table: Dict[Tuple[int, int], Tuple['Rule', ...]], key: Tuple[int, int], rule: 'Rule',
+            rank: Callable[['Rule'], Any]):
+    table[key] = tuple(sorted(table.get(key, ()) + (rule,), key=rank))
+
+
+class DispatchIndex:
+    """Таблицы (vk, основная маска события) -> кортеж правил для строгого и нестрогого режимов.
+
+    Нестрогий режим (правило ⊆ событие) раскладывается при компиляции:
+    правило попадает во все корзины масок-надмножеств, поэтому поиск
+    в обоих режимах — одно обращение к dict. Правила с Fn/CapsLock/левыми-правыми
+    модификаторами дополнительно проверяются одним AND, только в своих корзинах.
+    """
+    __slots__ = ('_strict', '_loose', '_extra', 'size')
+
+    def __init__(self, rules: Iterable['Rule']):
+        strict: Dict[Tuple[int, int], List['Rule']] = {}
+        loose: Dict[Tuple[int, int], List['Rule']] = {}
+        extra: Dict[str, int] = {}  # rule.id -> требуемые дополнительные биты
+        size = 0
+        for rule in rules:
+            if not _indexed(rule):
+                continue
+            core = rule.mods & CORE_MASK
+            if rule.mods != core:
+                extra[rule.id] = rule.mods & ~CORE_MASK
+            strict.setdefault((rule.vk, core), []).append(rule)
+            for ev_mask in _supersets(core):
+                loose.setdefault((rule.vk, ev_mask), []).append(rule)
+            size += 1
+        self._strict = {k: tuple(v) for k, v in strict.items()}
+        self._loose = {k: tuple(v) for k, v in loose.items()}
+        self._extra = extra
+        self.size = size
+
+    def patched(self, removed: Iterable['Rule'], added: Iterable['Rule'],
+                rank: Callable[['Rule'], Any]) -> 'DispatchIndex':
+        """Новый индекс без правил removed (по id) и с правилами added. Пересобираются
+        только корзины этих правил; словари корзин копируются, остальные кортежи общие.
+        rank(правило) — место правила в порядке приоритета новой таблицы."""
+        strict, loose, extra = dict(self._strict), dict(self._loose), self._extra
+        size = self.size
+        for rule in removed:
+            if not _indexed(rule):
+                continue
+            core = rule.mods & CORE_MASK
+            if _drop(strict, (rule.vk, core), rule.id):
+                size -= 1
+            for ev_mask in _supersets(core):
+                _drop(loose, (rule.vk, ev_mask), rule.id)
+            if rule.id in extra:
+                extra = {k: v for k, v in extra.items() if k != rule.id}
+        for rule in added:
+            if not _indexed(rule):
+                continue
+            core = rule.mods & CORE_MASK
+            if rule.mods != core:
+                extra = {**extra, rule.id: rule.mods & ~CORE_MASK}
+            _insert(strict, (rule.vk, core), rule, rank)
+            for ev_mask in _supersets(core):
+                _insert(loose, (rule.vk, ev_mask), rule, rank)
+            size += 1
+        index = DispatchIndex.__new__(DispatchIndex)
+        index._strict, index._loose, index._extra, index.size = strict, loose, extra, size
+        return index
+
+    def lookup(self, vk: int, mask: int, strict: bool) -> Tuple['Rule', ...]:
+        """Кандидаты для события в порядке приоритета (пустой кортеж — правил нет).
+        mask — маска модификаторов события (modifiers.from_cg_flags)."""
+        table = self._strict if strict else self._loose
+        hit = table.get((vk, mask & CORE_MASK), ())
+        if hit and self._extra:
+            extra = self._extra
+            return tuple(r for r in hit if mask & extra.get(r.id, 0) == extra.get(r.id, 0))
+        return hit
+
+
+EMPTY_INDEX = DispatchIndex(())
@@ -1,78 +1,31 @@
-import sys # Добавляем импорт sys
 import os # Убедимся, что os импортирован
-import subprocess # Убедимся, что subprocess импортирован
 import logging # Убедимся, что logging импортирован
-import ctypes # Убедимся, что ctypes импортирован
-import ctypes.util
 import threading # Добавляем импорт threading
 import json # Добавляем импорт json
 import uuid
-from typing import List, Dict, Any, Optional
+import atexit
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple
 import time # Добавляем импорт time
-import Quartz
-from PyQt5 import QtWidgets
-from Quartz import CGMainDisplayID, CGEventPost, kCGHIDEventTap, CGEventCreateKeyboardEvent, CGEventSetFlags, kCGEventFlagMaskShift, kCGEventFlagMaskControl, kCGEventFlagMaskAlternate, kCGEventFlagMaskCommand
-from actions import run_action as unified_run_action, get_active_app_name as unified_get_active_app_name, set_display_brightness, get_display_brightness
+from actions import run_action as unified_run_action, get_active_app_name as unified_get_active_app_name
+from hotkey_dispatch import DispatchIndex
+import hotkey_sequences
+from hotkey_sequences import SequenceMatcher
+import frontmost_app
+from rules import Rule, RuleSnapshot, RuleTable, EMPTY_SNAPSHOT, _float
+import modifiers
+from config_watcher import ConfigWatcher, Signature, file_signature
+from action_executor import ActionExecutor
+import settings_service
+import flight_recorder
+from flight_recorder import FlightRecorder
+from repeat_gate import RepeatGate, REPEAT_ONCE, normalize_policy
 
-logger = logging.getLogger(__name__)
+if TYPE_CHECKING:
+    # Сами модули загружаются при первом использовании (см. _journal, _sqlite_store)
+    import rule_journal
+    import sqlite_rule_store
 
-# --- Определяем путь к хелперу ---
-if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
-    # Запущено как собранное приложение (.app)
-    # Хелпер ожидается рядом с исполняемым файлом в Contents/MacOS
-    helper_base_path = os.path.dirname(sys.executable)
-else:
-    # Запущено как обычный скрипт
-    # Хелпер ожидается рядом с этим скриптом (.py)
-    helper_base_path = os.path.dirname(__file__)
-
-helper_path = os.path.join(helper_base_path, 'coredisplay_helper')
-logger.info(f"Путь к coredisplay_helper: {helper_path}") # Добавим лог для отладки
-
-
-# --- Старая логика загрузки CoreDisplay (оставляем как fallback, если хелпер не найден) ---
-_core_display = None
-CoreDisplay_Display_SetUserBrightness = None
-try:
-    # Попыток через PyObjC
-    import CoreDisplay as _cd
-    CoreDisplay_Display_SetUserBrightness = _cd.CoreDisplay_Display_SetUserBrightness
-    logger.info('Loaded CoreDisplay via PyObjC')
-except ImportError:
-    # Fallback: поиск через ctypes.util
-    _lib = ctypes.util.find_library('CoreDisplay')
-    if _lib:
-        try:
-            _core_display = ctypes.cdll.LoadLibrary(_lib)
-            CoreDisplay_Display_SetUserBrightness = getattr(_core_display, 'CoreDisplay_Display_SetUserBrightness', None)
-            if CoreDisplay_Display_SetUserBrightness:
-                CoreDisplay_Display_SetUserBrightness.argtypes = [ctypes.c_uint32, ctypes.c_float]
-                CoreDisplay_Display_SetUserBrightness.restype = ctypes.c_int
-                logger.info(f'Loaded CoreDisplay via ctypes.util.find_library: {_lib}')
-        except Exception as e:
-            logger.warning(f'Ошибка загрузки CoreDisplay из {_lib}: {e}')
-    # Fallback явные пути
-    possible_paths = [
-        '/System/Library/PrivateFrameworks/CoreDisplay.framework/CoreDisplay',
-        '/System/Library/PrivateFrameworks/CoreDisplay.framework/Versions/A/CoreDisplay',
-    ]
-    for pd in possible_paths:
-        if os.path.exists(pd):
-            try:
-                _core_display = ctypes.cdll.LoadLibrary(pd)
-                CoreDisplay_Display_SetUserBrightness = getattr(_core_display, 'CoreDisplay_Display_SetUserBrightness', None)
-                if CoreDisplay_Display_SetUserBrightness:
-                    CoreDisplay_Display_SetUserBrightness.argtypes = [ctypes.c_uint32, ctypes.c_float]
-                    CoreDisplay_Display_SetUserBrightness.restype = ctypes.c_int
-                    logger.info(f'Loaded CoreDisplay from {pd}')
-                    break
-            except Exception as e:
-                logger.warning(f'Ошибка загрузки CoreDisplay из {pd}: {e}')
-    else:
-        if CoreDisplay_Display_SetUserBrightness is None:
-            logger.warning('CoreDisplay framework not found in expected locations')
-except Exception as e:
-    logger.warning(f'Ошибка загрузки CoreDisplay framework: {e}')
+logger = logging.getLogger(__name__)
 
 # Используем Application Support для хранения настроек
 APP_SUPPORT_DIR = os.path.join(os.path.expanduser('~'), 'Library', 'Application Support', 'HotkeyMaster')
@@ -80,14 +33,40 @@ os.makedirs(APP_SUPPORT_DIR, exist_ok=True)
 
 # Позволяем тестам переопределять путь к файлу хоткеев
 HOTKEYS_FILE = os.environ.get('HOTKEYMASTER_HOTKEYS_FILE', os.path.join(APP_SUPPORT_DIR, 'hotkeys.json'))
+# Профили приложений (profiles/<bundle id или имя>.json) — загружаются при активации приложения, LRU.
+# Каталог — как app_profiles.profiles_dir_for; сам модуль импортируется при первой активации
+PROFILES_DIR = os.environ.get('HOTKEYMASTER_PROFILES_DIR',
+                              os.path.join(os.path.dirname(os.path.abspath(HOTKEYS_FILE)), 'profiles'))
+_app_profiles = None  # app_profiles.AppProfiles (_get_app_profiles)
 
-# Кэш хоткеев
-_hotkeys_cache: List[Dict[str, Any]] = []
-_hotkeys_mtime: Optional[float] = None
-_hotkeys_lock = threading.Lock()
+# Текущий снимок хоткеев. Читатели берут его одним чтением атрибута, без блокировки;
+# писатели (под _hotkeys_lock) строят новый снимок и публикуют заменой ссылки.
+_snapshot: RuleSnapshot = EMPTY_SNAPSHOT
+# Таблица правил активного приложения из текущего снимка; переключается при активации
+# приложения и при публикации снимка (обе операции — под _hotkeys_lock)
+_active_table: RuleTable = EMPTY_SNAPSHOT.global_table
+_active_app: Optional[frontmost_app.AppInfo] = None
+_hotkeys_signature: Signature = None  # (inode, размер, mtime_ns) прочитанного файла
+_hotkeys_loaded = False
+_hotkeys_lock = threading.Lock()  # сериализует только писателей
 _strict_mods = False
-_settings_mtime = None
-SETTINGS_PATH = os.path.join(APP_SUPPORT_DIR, 'settings.json')
+SETTINGS_PATH = settings_service.SETTINGS_PATH
+# Общий сервис settings.json (см. settings_service) и отписка от его изменений
+_settings: Optional[settings_service.SettingsService] = None
+_settings_unsubscribe = None
+# Фоновый наблюдатель за hotkeys.json/settings.json (запускается вместе со слушателем)
+_config_watcher = ConfigWatcher()
+# Журнал правок правил (settings.json: "hotkeys_storage": "journal"); None — правки пишутся в JSON целиком
+HOTKEYS_STORAGE_MODES = ('json', 'journal', 'sqlite')
+_journal: Optional['rule_journal.RuleJournal'] = None
+# База правил ("hotkeys_storage": "sqlite"); пока она открыта, источник истины — она, а не hotkeys.json
+_sqlite_store: Optional['sqlite_rule_store.SqliteRuleStore'] = None
+_sqlite_store_watched = False
+_config_watcher_started = False
+# Фрагменты hotkeys.json по правилам (_snapshot_json): id -> (правило, текст)
+_rule_json_fragments: Dict[str, Tuple[Rule, str]] = {}
+# Кэш конфигурации отстал от hotkeys.json (правки в режиме json); пишется при выходе
+_config_cache_stale = False
 
 def _ensure_ids(hotkeys: List[Dict[str, Any]]):
     """Гарантирует наличие уникального поля id у каждого хоткея."""
@@ -103,88 +82,733 @@ def _ensure_ids(hotkeys: List[Dict[str, Any]]):
         seen.add(hk['id'])
     return changed
 
-def _atomic_write_json(path: str, data: Any):
+def _atomic_write_json(path: str, data: Any) -> bytes:
+    """Атомарная запись JSON; возвращает записанные байты (ключ кэша конфигурации)."""
+    return _atomic_write_bytes(path, json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
+
+def _snapshot_json(snap: RuleSnapshot) -> bytes:
+    """hotkeys.json из снимка — те же байты, что json.dumps(правила, indent=2), но
+    заново сериализуются только правила, изменившиеся с прошлой записи (Rule
+    неизменяемы, сверка по объекту)."""
+    global _rule_json_fragments
+    if not snap.rules:
+        return b'[]'
+    old = _rule_json_fragments
+    fragments: Dict[str, Tuple[Rule, str]] = {}
+    parts = []
+    for r in snap.rules:
+        entry = old.get(r.id)
+        if entry is None or entry[0] is not r:
+            entry = (r, '  ' + json.dumps(r.raw, ensure_ascii=False, indent=2).replace('\n', '\n  '))
+        fragments[r.id] = entry
+        parts.append(entry[1])
+    _rule_json_fragments = fragments
+    return ('[\n' + ',\n'.join(parts) + '\n]').encode('utf-8')
+
+def _atomic_write_bytes(path: str, blob: bytes) -> bytes:
+    import rule_journal
     tmp_path = path + '.tmp'
-    with open(tmp_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    with open(tmp_path, 'wb') as f:
+        f.write(blob)
+        rule_journal.fsync_file(f)
     os.replace(tmp_path, path)
+    # Собственная запись не должна вызывать повторную перезагрузку в наблюдателе
+    _config_watcher.note_written(path)
+    return blob
 
-def _load_hotkeys_raw() -> List[Dict[str, Any]]:
+def _read_hotkeys_file() -> bytes:
     try:
-        with open(HOTKEYS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        if not isinstance(data, list):
-            return []
-        # Обеспечиваем ID
-        if _ensure_ids(data):
-            try:
-                _atomic_write_json(HOTKEYS_FILE, data)
-            except Exception:
-                pass
-        return data
+        with open(HOTKEYS_FILE, 'rb') as f:
+            return f.read()
     except FileNotFoundError:
         try:
-            _atomic_write_json(HOTKEYS_FILE, [])
+            return _atomic_write_json(HOTKEYS_FILE, [])
+        except Exception:
+            return b'[]'
+
+def _parse_hotkeys(blob: bytes) -> Tuple[List[Dict[str, Any]], bytes]:
+    """Разбор hotkeys.json. Возвращает (хоткеи, байты файла после возможной дозаписи id)."""
+    try:
+        data = json.loads(blob.decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return [], blob
+    if not isinstance(data, list):
+        return [], blob
+    # Обеспечиваем ID
+    if _ensure_ids(data):
+        try:
+            blob = _atomic_write_json(HOTKEYS_FILE, data)
         except Exception:
             pass
-        return []
-    except json.JSONDecodeError:
-        return []
-    except Exception as e:
-        logger.error(f"Ошибка чтения hotkeys.json: {e}")
-        return []
+    return data, blob
+
+def _set_snapshot_locked(snap: RuleSnapshot) -> RuleSnapshot:
+    global _snapshot, _hotkeys_loaded, _active_table
+    _snapshot = snap  # атомарная замена ссылки — читатели видят старый или новый снимок целиком
+    _active_table = _table_for_app(snap, _active_app)
+    _hotkeys_loaded = True
+    return snap
+
+def _get_app_profiles():
+    """LRU профилей приложений (app_profiles.AppProfiles), создаётся при первом обращении."""
+    global _app_profiles
+    profiles = _app_profiles
+    if profiles is None:
+        import app_profiles
+        profiles = _app_profiles = app_profiles.AppProfiles(PROFILES_DIR)
+    return profiles
+
+def _table_for_app(snap: RuleSnapshot, info) -> RuleTable:
+    """Таблица приложения с его профилем; пока приложение не известно, профили не загружаются."""
+    if info is None:
+        return snap.table_for(None)
+    return _get_app_profiles().table_for(snap, info)
+
+def _publish_hotkeys_locked(hotkeys: List[Dict[str, Any]]) -> RuleSnapshot:
+    """Строит и публикует новый снимок (вызывать под _hotkeys_lock)."""
+    return _set_snapshot_locked(RuleSnapshot.build(_snapshot.generation + 1, hotkeys))
+
+def _hotkeys_source() -> str:
+    """Файл, из которого загружаются правила (его сигнатура сверяется при обновлении)."""
+    store = _sqlite_store
+    return store.path if store is not None else HOTKEYS_FILE
+
+def _load_and_publish_locked() -> RuleSnapshot:
+    """Читает hotkeys.json и публикует снимок: из скомпилированного кэша, если он
+    соответствует содержимому файла, иначе — разбором JSON с пересборкой кэша.
+    В режиме sqlite снимок строится из базы."""
+    import config_cache
+    import rule_journal
+    if _sqlite_store is not None:
+        return _set_snapshot_locked(RuleSnapshot.build(_snapshot.generation + 1, _sqlite_store.load_all()))
+    blob = _read_hotkeys_file()
+    generation = _snapshot.generation + 1
+    snap = config_cache.load_snapshot(HOTKEYS_FILE, blob, generation)
+    if snap is None:
+        hotkeys, blob = _parse_hotkeys(blob)
+        snap = RuleSnapshot.build(generation, hotkeys)
+        config_cache.store_snapshot(HOTKEYS_FILE, blob, snap)
+    # Правки из журнала, не успевшие свернуться (падение, выход), применяются и сразу сворачиваются
+    records = rule_journal.read_journal(HOTKEYS_FILE, blob)
+    if records:
+        logger.info(f"Восстановление {len(records)} записей из журнала правил")
+        hotkeys = rule_journal.apply_records(snap.to_dicts(), records)
+        blob = _atomic_write_json(HOTKEYS_FILE, hotkeys)
+        snap = RuleSnapshot.build(generation, hotkeys)
+        config_cache.store_snapshot(HOTKEYS_FILE, blob, snap)
+    if _journal is not None:
+        _journal.reset(blob)
+    else:
+        rule_journal.discard(HOTKEYS_FILE)
+    return _set_snapshot_locked(snap)
+
+def _compact_journal():
+    """Сворачивание журнала: текущий снимок пишется в JSON, журнал начинается заново
+    (фоновый поток RuleJournal). Падение между шагами безопасно — см. rule_journal."""
+    import config_cache
+    global _hotkeys_signature
+    with _hotkeys_lock:
+        journal = _journal
+        if journal is None or not journal.pending:
+            return
+        blob = _atomic_write_bytes(HOTKEYS_FILE, _snapshot_json(_snapshot))
+        config_cache.store_snapshot(HOTKEYS_FILE, blob, _snapshot)
+        journal.reset(blob)
+        _hotkeys_signature = file_signature(HOTKEYS_FILE)
+
+def _open_sqlite_store_locked():
+    """Переход на базу: непустая база — источник истины (в том числе после
+    `sqlite_rule_store.py import`), пустая заполняется текущими правилами из JSON."""
+    import sqlite_rule_store
+    global _sqlite_store, _hotkeys_signature, _sqlite_store_watched
+    if not _hotkeys_loaded:
+        _load_and_publish_locked()
+    store = sqlite_rule_store.SqliteRuleStore(sqlite_rule_store.sqlite_path_for(HOTKEYS_FILE))
+    if not len(store):
+        store.replace_all(_snapshot.to_dicts())
+    _sqlite_store = store
+    if not _sqlite_store_watched:
+        # Внешний импорт в базу (sqlite_rule_store.py import) перечитывается наблюдателем
+        _config_watcher.watch(store.path, lambda _p: _sqlite_store is not None and refresh_hotkeys_cache(force=True))
+        _sqlite_store_watched = True
+    _load_and_publish_locked()
+    _hotkeys_signature = file_signature(store.path)
+
+def _close_sqlite_store_locked():
+    """Выход из режима sqlite: правила экспортируются в hotkeys.json, база удаляется —
+    источником истины снова становится JSON."""
+    global _sqlite_store, _hotkeys_signature
+    store = _sqlite_store
+    _atomic_write_json(HOTKEYS_FILE, store.load_all())
+    _sqlite_store = None
+    store.close()
+    try:
+        os.unlink(store.path)
+    except OSError:
+        pass
+    _load_and_publish_locked()
+    _hotkeys_signature = file_signature(HOTKEYS_FILE)
+
+def _set_hotkeys_storage(mode: str):
+    """Переключение хранилища: 'json' — каждая правка переписывает hotkeys.json,
+    'journal' — правки дописываются в журнал и сворачиваются в фоне,
+    'sqlite' — правила хранятся в базе, правка одного правила — одна строка."""
+    import rule_journal
+    global _journal
+    if mode not in HOTKEYS_STORAGE_MODES:
+        mode = 'json'
+    journal = _journal
+    current = 'sqlite' if _sqlite_store is not None else ('journal' if journal is not None else 'json')
+    if mode == current:
+        return
+    if journal is not None:
+        # Сначала свернуть несохранённые в JSON правки, потом убрать журнал
+        journal.stop()
+        _compact_journal()
+    with _hotkeys_lock:
+        if journal is not None:
+            _journal = None
+            rule_journal.discard(HOTKEYS_FILE)
+        if current == 'sqlite':
+            _close_sqlite_store_locked()
+        if mode == 'journal':
+            journal = rule_journal.RuleJournal(HOTKEYS_FILE, _compact_journal)
+            journal.reset(_read_hotkeys_file())
+            journal.start()
+            _journal = journal
+        elif mode == 'sqlite':
+            try:
+                _open_sqlite_store_locked()
+            except Exception as e:
+                logger.error(f"Не удалось открыть базу правил, остаётся JSON: {e}")
+                return
+    logger.info(f"Хранилище хоткеев: {mode}")
 
 def refresh_hotkeys_cache(force: bool = False):
-    global _hotkeys_cache, _hotkeys_mtime
+    global _hotkeys_signature
     with _hotkeys_lock:
         try:
-            mtime = os.path.getmtime(HOTKEYS_FILE) if os.path.exists(HOTKEYS_FILE) else None
-            if force:
-                logger.debug(f"[refresh_hotkeys_cache] FORCE reload path={HOTKEYS_FILE} exists={os.path.exists(HOTKEYS_FILE)} size={(os.path.getsize(HOTKEYS_FILE) if os.path.exists(HOTKEYS_FILE) else 'NA')}")
-                _hotkeys_cache = _load_hotkeys_raw()
-                _hotkeys_mtime = mtime
-            elif (_hotkeys_mtime is None) or (mtime and _hotkeys_mtime != mtime):
-                logger.debug(f"[refresh_hotkeys_cache] mtime change reload old={_hotkeys_mtime} new={mtime}")
-                _hotkeys_cache = _load_hotkeys_raw()
-                _hotkeys_mtime = mtime
+            sig = file_signature(_hotkeys_source())
+            if force or not _hotkeys_loaded or sig != _hotkeys_signature:
+                logger.debug(f"[refresh_hotkeys_cache] reload force={force} old={_hotkeys_signature} new={sig}")
+                _load_and_publish_locked()
+                # Файл мог быть создан/дополнен id при чтении — берём актуальную сигнатуру
+                _hotkeys_signature = file_signature(_hotkeys_source())
         except Exception as e:
             logger.error(f"Ошибка обновления кэша хоткеев: {e}")
 
-def load_hotkeys():
-    """Возвращает список хоткеев (кэшируемый)."""
-    refresh_hotkeys_cache()
-    # Возвращаем копию чтобы внешние изменения не ломали кэш
+def _ensure_config_fresh():
+    """Без работающего наблюдателя (тесты, утилиты) проверяем файлы лениво."""
+    if not _config_watcher.is_running():
+        refresh_hotkeys_cache()
+        _load_general_settings()
+
+def get_snapshot() -> RuleSnapshot:
+    """Текущий неизменяемый снимок хоткеев (без блокировок и копирования)."""
+    _ensure_config_fresh()
+    return _snapshot
+
+def _on_frontmost_app_changed(info):
+    """Переключает таблицу правил на активированное приложение (поток уведомлений)."""
+    global _active_app, _active_table
     with _hotkeys_lock:
-        return [dict(hk) for hk in _hotkeys_cache]
+        _active_app = info
+        _active_table = _table_for_app(_snapshot, info)
+
+def _on_app_profiles_changed():
+    """Каталог профилей изменился — пересобрать таблицу активного приложения."""
+    global _active_table
+    with _hotkeys_lock:
+        _active_table = _table_for_app(_snapshot, _active_app)
+
+def _profile_hotkeys(type_: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Записи правил всех профилей приложений (profiles/*.json)."""
+    return [r.to_dict() for _path, rules in _get_app_profiles().all_rules() for r in rules
+            if type_ is None or r.type == type_]
+
+def _edit_profile_rule(hk_id: str, change) -> bool:
+    """Правка правила профиля (app_profiles.edit_profile). False — в профилях такого id нет."""
+    import app_profiles
+    hit = _get_app_profiles().find(hk_id)
+    if hit is None or not app_profiles.edit_profile(hit[0], hk_id, change):
+        return False
+    _on_app_profiles_changed()
+    return True
+
+def get_active_table() -> RuleTable:
+    """Таблица правил активного приложения. Без подписки на активацию (тесты, утилиты)
+    приложение опрашивается с TTL и таблица переключается здесь же."""
+    _ensure_config_fresh()
+    tracker = frontmost_app.get_tracker()
+    if not tracker.observing:
+        info = tracker.current()
+        if info != _active_app:
+            _on_frontmost_app_changed(info)
+    return _active_table
+
+def load_hotkeys():
+    """Возвращает список хоткеев в виде изменяемых dict (для UI и внешних утилит)."""
+    return get_snapshot().to_dicts()
+
+def get_dispatch_index() -> DispatchIndex:
+    """Возвращает индекс диспетчеризации клавиатурных хоткеев текущего снимка."""
+    return get_snapshot().keyboard
 
 def save_hotkeys(hotkeys):
-    """Сохраняет хоткеи атомарно и обновляет кэш."""
+    """Сохраняет хоткеи атомарно и обновляет кэш (в режиме журнала — дописывает изменения)."""
     with _hotkeys_lock:
         # гарантируем id перед записью
         _ensure_ids(hotkeys)
-        _atomic_write_json(HOTKEYS_FILE, hotkeys)
-        _hotkeys_cache = [dict(hk) for hk in hotkeys]
+        _save_locked(hotkeys)
+
+def _save_locked(hotkeys: List[Dict[str, Any]]) -> RuleSnapshot:
+    """Сохранение всего набора (окно настроек, импорт; вызывать под _hotkeys_lock).
+    Изменения находятся сравнением со снимком и применяются как правки отдельных
+    правил; изменился порядок — набор записывается и компилируется целиком."""
+    import config_cache
+    import rule_journal
+    global _hotkeys_signature
+    records = rule_journal.diff_hotkeys([r.raw for r in _snapshot.rules], hotkeys)
+    if records is not None:
+        return _commit_records_locked(records)
+    store = _sqlite_store
+    if store is not None:
+        store.replace_all(hotkeys)
+        snap = _publish_hotkeys_locked(hotkeys)
+        _config_watcher.note_written(store.path)
+        _hotkeys_signature = file_signature(store.path)
+        return snap
+    journal = _journal
+    blob = _atomic_write_json(HOTKEYS_FILE, hotkeys)
+    snap = _publish_hotkeys_locked(hotkeys)
+    config_cache.store_snapshot(HOTKEYS_FILE, blob, snap)
+    if journal is not None:
+        journal.reset(blob)
+    _hotkeys_signature = file_signature(HOTKEYS_FILE)
+    return snap
+
+def _commit_records_locked(records: List[Dict[str, Any]]) -> RuleSnapshot:
+    """Правки отдельных правил (записи rule_journal: upsert/enable/delete) — вызывать
+    под _hotkeys_lock. Снимок правится по id (RuleSnapshot.patched), на диск уходят
+    только сами записи: строки базы в режиме sqlite, кадры журнала в режиме journal;
+    в режиме json файл переписывается из снимка. Нет записей — нет нового поколения."""
+    import config_cache
+    import rule_journal
+    global _hotkeys_signature, _config_cache_stale
+    if not records:
+        return _snapshot
+    upserts: List[Rule] = []
+    deletes: List[str] = []
+    for rec in records:
+        if rec['op'] == rule_journal.OP_DELETE:
+            deletes.append(rec['id'])
+        elif rec['op'] == rule_journal.OP_ENABLE:
+            upserts.append(Rule.from_dict({**_snapshot.by_id[rec['id']].raw, 'enabled': rec['enabled']}))
+        else:
+            upserts.append(Rule.from_dict(rec['rule']))
+    snap = _snapshot.patched(_snapshot.generation + 1, upserts, deletes)
+    store = _sqlite_store
+    if store is not None:
+        store.apply_records(records)
+        _config_watcher.note_written(store.path)
+        _hotkeys_signature = file_signature(store.path)
+    elif _journal is not None:
+        _journal.append(records)
+    else:
+        # Кэш (pickle всего снимка) не пересобирается на каждую правку: он сбрасывается
+        # и пишется при выходе (_store_stale_config_cache) или при следующем запуске
+        _atomic_write_bytes(HOTKEYS_FILE, _snapshot_json(snap))
+        config_cache.invalidate(HOTKEYS_FILE)
+        _config_cache_stale = True
+        _hotkeys_signature = file_signature(HOTKEYS_FILE)
+    return _set_snapshot_locked(snap)
+
+def _store_stale_config_cache():
+    """Запись отложенного кэша конфигурации (atexit), если файл с тех пор не менялся извне."""
+    global _config_cache_stale
+    with _hotkeys_lock:
+        if not _config_cache_stale or _sqlite_store is not None:
+            return
+        import config_cache
+        _config_cache_stale = False
+        if file_signature(HOTKEYS_FILE) != _hotkeys_signature:
+            return
         try:
-            _hotkeys_mtime = os.path.getmtime(HOTKEYS_FILE)
-        except Exception:
-            pass
+            with open(HOTKEYS_FILE, 'rb') as f:
+                blob = f.read()
+        except OSError:
+            return
+        config_cache.store_snapshot(HOTKEYS_FILE, blob, _snapshot)
+
+atexit.register(_store_stale_config_cache)
+
+HOTKEY_TYPES = ('keyboard', 'trackpad')
+
+def _validate_hotkeys(hotkeys: List[Dict[str, Any]]):
+    """Проверка перед записью: ValueError — ничего не записано."""
+    seen = set()
+    for i, hk in enumerate(hotkeys):
+        if not isinstance(hk, dict):
+            raise ValueError(f"хоткей #{i}: ожидается объект, получено {type(hk).__name__}")
+        if hk.get('type', 'keyboard') not in HOTKEY_TYPES:
+            raise ValueError(f"хоткей #{i}: неизвестный тип {hk.get('type')!r}")
+        hk_id = hk.get('id')
+        if not isinstance(hk_id, str) or not hk_id or hk_id in seen:
+            raise ValueError(f"хоткей #{i}: пустой или повторяющийся id {hk_id!r}")
+        seen.add(hk_id)
+
+class _RuleOverlay:
+    """Правки транзакции поверх снимка (copy-on-write): в памяти только затронутые
+    правила, остальные читаются из снимка. replace_all помечает все правила снимка
+    удалёнными, новый набор целиком становится добавленным."""
+
+    def __init__(self, base: RuleSnapshot):
+        self.base = base
+        self.changed: Dict[str, Dict[str, Any]] = {}  # правила снимка, изменённые на месте
+        self.deleted: set = set()                     # id удалённых правил снимка
+        self.added: Dict[str, Dict[str, Any]] = {}    # новые правила — в конец, по порядку
+        self.replaced = False                         # был replace_all
+
+    def __contains__(self, hk_id) -> bool:
+        return hk_id in self.added or (hk_id in self.base.by_id and hk_id not in self.deleted)
+
+    def __len__(self) -> int:
+        return len(self.base.rules) - len(self.deleted) + len(self.added)
+
+    def get(self, hk_id: str) -> Optional[Dict[str, Any]]:
+        """Запись правила; правило снимка при первом обращении копируется в changed,
+        поэтому правка возвращённого dict попадёт в commit, как и раньше."""
+        hk = self.added.get(hk_id)
+        if hk is not None or hk_id in self.deleted:
+            return hk
+        hk = self.changed.get(hk_id)
+        if hk is None:
+            rule = self.base.by_id.get(hk_id)
+            if rule is None:
+                return None
+            hk = self.changed[hk_id] = rule.to_dict()
+        return hk
+
+    def hotkeys(self) -> List[Dict[str, Any]]:
+        res = [self.get(r.id) for r in self.base.rules if r.id not in self.deleted]
+        return res + list(self.added.values())
+
+    def apply(self, op: str, args: tuple, strict: bool):
+        if op == 'add':
+            hk = args[0]
+            self.added[hk['id']] = hk
+            return hk['id']
+        if op == 'replace_all':
+            self.deleted = set(self.base.by_id)
+            self.changed.clear()
+            self.added = {}
+            hotkeys = [dict(hk) for hk in args[0]]
+            _ensure_ids(hotkeys)
+            for hk in hotkeys:
+                self.added[hk['id']] = hk
+            self.replaced = True
+            return None
+        hk_id = args[0]
+        cur = self.get(hk_id)
+        if cur is None:
+            if strict:
+                raise KeyError(hk_id)
+            logger.warning(f"Транзакция: хоткей {hk_id} уже удалён, операция {op} пропущена")
+            return None
+        if op == 'delete':
+            if self.added.pop(hk_id, None) is None:
+                self.deleted.add(hk_id)
+                self.changed.pop(hk_id, None)
+            return None
+        if op == 'update':
+            new = {**cur, **args[1], 'id': hk_id}
+        elif op == 'replace':
+            new = {**args[1], 'id': hk_id}
+        else:  # set_enabled
+            new = {**cur, 'enabled': bool(args[1])}
+        (self.added if hk_id in self.added else self.changed)[hk_id] = new
+        return None
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Записи rule_journal, превращающие снимок в результат транзакции."""
+        import rule_journal
+        records: List[Dict[str, Any]] = [{'op': rule_journal.OP_DELETE, 'id': i} for i in self.deleted]
+        for hk_id, hk in self.changed.items():
+            raw = self.base.by_id[hk_id].raw
+            if hk == raw:
+                continue
+            if {**raw, 'enabled': hk.get('enabled', True)} == hk:
+                records.append({'op': rule_journal.OP_ENABLE, 'id': hk_id, 'enabled': bool(hk.get('enabled', True))})
+            else:
+                records.append({'op': rule_journal.OP_UPSERT, 'rule': hk})
+        records.extend({'op': rule_journal.OP_UPSERT, 'rule': hk} for hk in self.added.values())
+        return records
+
+class HotkeyTransaction:
+    """Пакет изменений хоткеев: правки копятся в памяти, commit() — одна проверка,
+    одна запись на диск и одно новое поколение снимка для слушателей.
+
+        with hotkey_engine.transaction() as tx:
+            tx.set_enabled(hk_id, False)
+            tx.add({...})
+        # выход без исключения — commit, с исключением — rollback
+
+    Правила адресуются по id. Транзакция хранит только затронутые правила
+    (_RuleOverlay поверх снимка), commit проверяет их же и правит снимок по id,
+    поэтому цена правки не зависит от числа правил (кроме записи JSON в режиме
+    json). Если пока транзакция открыта конфиг сменился (перезагрузка файла,
+    другой писатель), при commit операции применяются заново к свежему снимку;
+    правки отсутствующих уже правил пропускаются.
+    """
+
+    def __init__(self):
+        self._overlay = _RuleOverlay(get_snapshot())
+        self._ops: List[tuple] = []
+        self._closed = False
+        self.snapshot: Optional[RuleSnapshot] = None  # результат commit()
+
+    # ---------- чтение ----------
+    def __len__(self):
+        return len(self._overlay)
+
+    def __iter__(self):
+        return iter(self._overlay.hotkeys())
+
+    def __contains__(self, hk_id):
+        return hk_id in self._overlay
+
+    def get(self, hk_id: str) -> Optional[Dict[str, Any]]:
+        return self._overlay.get(hk_id)
 
-def _load_general_settings():
-    global _strict_mods, _settings_mtime
+    @property
+    def hotkeys(self) -> List[Dict[str, Any]]:
+        return self._overlay.hotkeys()
+
+    # ---------- изменения ----------
+    def _do(self, op: str, *args, strict: bool = True):
+        self._check_open()
+        res = self._overlay.apply(op, args, strict)
+        self._ops.append((op, args))
+        return res
+
+    def add(self, hk: Dict[str, Any]) -> str:
+        """Добавить правило в конец; возвращает его id (новый, если id нет или он занят)."""
+        hk = dict(hk)
+        if not isinstance(hk.get('id'), str) or not hk['id'] or hk['id'] in self._overlay:
+            hk['id'] = uuid.uuid4().hex
+        return self._do('add', hk)
+
+    def update(self, hk_id: str, changes: Optional[Dict[str, Any]] = None, **fields):
+        """Изменить поля правила (остальные поля и позиция сохраняются)."""
+        self._do('update', hk_id, {**(changes or {}), **fields})
+
+    def replace(self, hk_id: str, hk: Dict[str, Any]):
+        """Заменить правило целиком, сохранив id и позицию."""
+        self._do('replace', hk_id, dict(hk))
+
+    def set_enabled(self, hk_id: str, enabled: bool):
+        self._do('set_enabled', hk_id, bool(enabled))
+
+    def delete(self, hk_id: str):
+        self._do('delete', hk_id)
+
+    def replace_all(self, hotkeys: List[Dict[str, Any]]):
+        """Заменить весь набор (импорт)."""
+        hotkeys = list(hotkeys)
+        for i, hk in enumerate(hotkeys):
+            if not isinstance(hk, dict):
+                raise ValueError(f"хоткей #{i}: ожидается объект, получено {type(hk).__name__}")
+        self._do('replace_all', hotkeys)
+
+    # ---------- завершение ----------
+    def _check_open(self):
+        if self._closed:
+            raise RuntimeError('транзакция уже завершена')
+
+    def commit(self) -> RuleSnapshot:
+        """Применить изменения. Без изменений — ничего не пишется, возвращается текущий снимок."""
+        self._check_open()
+        self._closed = True
+        if not self._ops:
+            self.snapshot = _snapshot
+            return self.snapshot
+        with _hotkeys_lock:
+            overlay = self._overlay
+            if _snapshot is not overlay.base:
+                # Конфиг сменился — повторяем операции поверх актуального снимка
+                overlay = _RuleOverlay(_snapshot)
+                for op, args in self._ops:
+                    overlay.apply(op, args, strict=False)
+            if overlay.replaced:
+                hotkeys = overlay.hotkeys()
+                _validate_hotkeys(hotkeys)
+                self.snapshot = _save_locked(hotkeys)
+            else:
+                # Проверяются только затронутые правила: остальные уже в снимке
+                _validate_hotkeys(list(overlay.changed.values()) + list(overlay.added.values()))
+                self.snapshot = _commit_records_locked(overlay.records())
+        return self.snapshot
+
+    def rollback(self):
+        self._closed = True
+        self._ops.clear()
+
+    def __enter__(self) -> 'HotkeyTransaction':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._closed:
+            return False
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+def transaction() -> HotkeyTransaction:
+    """Открыть транзакцию изменений хоткеев (см. HotkeyTransaction)."""
+    return HotkeyTransaction()
+
+class RuleRepository:
+    """Хранилище правил с доступом по id — для UI и внешних утилит вместо поиска по списку.
+
+    Чтение идёт из текущего снимка: get — словарь by_id (O(1)), обход — в порядке
+    приоритета; возвращаются копии записей. В режиме sqlite get и list выбираются
+    из базы по индексам — без разворачивания всего набора правил в dict. Каждое изменение — транзакция из одной
+    операции (одна запись, одно поколение); несколько правок подряд лучше
+    объединять в transaction().
+
+    Правила профилей приложений (profiles/*.json) входят в get и list (после
+    правил hotkeys.json), а update/replace/set_enabled/delete по их id переписывают
+    файл профиля. В len, ids, __contains__ и транзакции они не входят.
+    """
+
+    def get(self, hk_id: str) -> Optional[Dict[str, Any]]:
+        _ensure_config_fresh()
+        store = _sqlite_store
+        if store is not None:
+            hk = store.get(hk_id)
+        else:
+            rule = get_snapshot().by_id.get(hk_id)
+            hk = rule.to_dict() if rule is not None else None
+        if hk is None:
+            hit = _get_app_profiles().find(hk_id)
+            hk = hit[1].to_dict() if hit is not None else None
+        return hk
+
+    def __contains__(self, hk_id) -> bool:
+        return hk_id in get_snapshot().by_id
+
+    def __len__(self) -> int:
+        return len(get_snapshot().rules)
+
+    def __iter__(self):
+        return iter(self.list())
+
+    def ids(self) -> List[str]:
+        return [r.id for r in get_snapshot().rules]
+
+    def list(self, type_: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Записи в порядке приоритета; type_ — только 'keyboard' или 'trackpad'."""
+        _ensure_config_fresh()
+        store = _sqlite_store
+        if store is not None:
+            res = store.list(type_)
+        else:
+            res = [r.to_dict() for r in get_snapshot().rules if type_ is None or r.type == type_]
+        return res + _profile_hotkeys(type_)
+
+    def add(self, hk: Dict[str, Any]) -> str:
+        with transaction() as tx:
+            return tx.add(hk)
+
+    def update(self, hk_id: str, changes: Optional[Dict[str, Any]] = None, **fields) -> bool:
+        """Изменить поля правила. False — изменять нечего (запись не делается)."""
+        changes = {**(changes or {}), **fields}
+        current = self.get(hk_id)
+        if current is None:
+            raise KeyError(hk_id)
+        if {**current, **changes} == current:
+            return False
+        if hk_id not in get_snapshot().by_id and _edit_profile_rule(hk_id, lambda hk: {**hk, **changes, 'id': hk_id}):
+            return True
+        with transaction() as tx:
+            tx.update(hk_id, changes)
+        return True
+
+    def replace(self, hk_id: str, hk: Dict[str, Any]):
+        if hk_id not in get_snapshot().by_id and _edit_profile_rule(hk_id, lambda _old: {**hk, 'id': hk_id}):
+            return
+        with transaction() as tx:
+            tx.replace(hk_id, hk)
+
+    def set_enabled(self, hk_id: str, enabled: bool) -> bool:
+        return self.update(hk_id, enabled=bool(enabled))
+
+    def delete(self, hk_id: str):
+        if hk_id not in get_snapshot().by_id and _edit_profile_rule(hk_id, lambda _old: None):
+            return
+        with transaction() as tx:
+            tx.delete(hk_id)
+
+    def transaction(self) -> HotkeyTransaction:
+        return transaction()
+
+_rule_repository = RuleRepository()
+
+def get_rule_repository() -> RuleRepository:
+    return _rule_repository
+
+def _general_settings() -> settings_service.SettingsService:
+    """Сервис настроек для SETTINGS_PATH; при первом обращении движок подписывается
+    на свои ключи — изменения из окна настроек применяются сразу, без чтения файла."""
+    global _settings, _settings_unsubscribe
+    settings = _settings
+    if settings is None or settings.path != os.path.abspath(SETTINGS_PATH):
+        if _settings_unsubscribe is not None:
+            _settings_unsubscribe()
+        settings = settings_service.get_settings(SETTINGS_PATH)
+        settings.reload()
+        _settings_unsubscribe = settings.subscribe(_apply_general_settings,
+                                                   keys=('strict_mod_match', 'hotkeys_storage'))
+        _settings = settings
+        _apply_general_settings()
+    return settings
+
+def _apply_general_settings(_changes=None):
+    global _strict_mods
+    settings = _settings
+    _strict_mods = settings.get_bool('strict_mod_match')
+    _set_hotkeys_storage(settings.get_str('hotkeys_storage', choices=HOTKEYS_STORAGE_MODES))
+
+def _load_general_settings(force: bool = False):
+    """Сверка settings.json (force — перечитать без сверки сигнатуры); изменившиеся
+    значения применяются подпиской _apply_general_settings."""
     try:
-        if os.path.exists(SETTINGS_PATH):
-            mtime = os.path.getmtime(SETTINGS_PATH)
-            if _settings_mtime is None or mtime != _settings_mtime:
-                with open(SETTINGS_PATH, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                _strict_mods = bool(data.get('strict_mod_match', False))
-                _settings_mtime = mtime
-    except Exception:
-        pass
+        _general_settings().reload(force=force)
+    except Exception as e:
+        logger.error(f"Ошибка загрузки настроек: {e}")
+
+def start_config_watcher():
+    """Загружает конфиг и запускает фоновое отслеживание изменений (идемпотентно).
+    После запуска поток ввода больше не обращается к файловой системе."""
+    global _config_watcher_started
+    refresh_hotkeys_cache(force=True)
+    _load_general_settings(force=True)
+    if not _config_watcher_started:
+        _config_watcher.watch(HOTKEYS_FILE, lambda _p: refresh_hotkeys_cache(force=True))
+        _config_watcher.watch(PROFILES_DIR, lambda _p: _on_app_profiles_changed())
+        _config_watcher.watch(SETTINGS_PATH, lambda _p: _load_general_settings())
+        _config_watcher_started = True
+    _config_watcher.start()
+
+def stop_config_watcher():
+    _config_watcher.stop()
 
 def get_strict_mods() -> bool:
     """Публичный геттер режима строгих модификаторов (обновляет при необходимости)."""
-    _load_general_settings()
+    if not _config_watcher.is_running():
+        _load_general_settings()
     return _strict_mods
 
 def hotkey_conflicts(new_hk: Dict[str, Any], existing: List[Dict[str, Any]], *, strict: Optional[bool]=None, ignore_id: Optional[str]=None) -> Optional[Dict[str, Any]]:
@@ -192,9 +816,12 @@ def hotkey_conflicts(new_hk: Dict[str, Any], existing: List[Dict[str, Any]], *,
     Возвращает конфликтующий хоткей или None.
     Правила:
       - trackpad: конфликт если совпадает gesture и (scope совпадает) либо один глобальный и другой app-специфичный той же app? Глобальный конфликтует со всеми жестами того же типа.
-      - keyboard: конфликт если vk совпадает и множества модификаторов совпадают (строгий режим) либо
+      - keyboard: конфликт если vk совпадает и основные модификаторы совпадают (строгий режим: Fn и сторона
+                  не разделяют правила, см. modifiers.overlaps) либо
                   при нестрогом режиме один набор модификаторов является подмножеством другого (перекрытие) —
                   и области действия пересекаются (оба global или один global, другой app совпадает по app, либо оба app с одинаковым app).
+                  Последовательности (sequence) сравниваются удар за ударом: конфликт, если более короткая
+                  (или одиночный combo) совпадает с началом более длинной — конфликт префикса.
     ignore_id: id хоткея, который редактируется (чтобы не детектить конфликт с самим собой).
     """
     if strict is None:
@@ -202,6 +829,7 @@ def hotkey_conflicts(new_hk: Dict[str, Any], existing: List[Dict[str, Any]], *,
     new_type = new_hk.get('type', 'keyboard')
     new_scope = new_hk.get('scope', 'global')
     new_app = new_hk.get('app', '') or ''
+    new_strokes = hotkey_sequences.rule_strokes(new_hk) if new_type != 'trackpad' else None
     def scopes_overlap(s1, a1, s2, a2):
         if s1 == 'global' or s2 == 'global':
             # global конфликтует со всем
@@ -221,42 +849,44 @@ def hotkey_conflicts(new_hk: Dict[str, Any], existing: List[Dict[str, Any]], *,
             if hk.get('gesture') == new_hk.get('gesture') and scopes_overlap(hk.get('scope','global'), hk.get('app',''), new_scope, new_app):
                 return hk
         else:  # keyboard
-            combo_a = hk.get('combo') or {}
-            combo_b = new_hk.get('combo') or {}
-            vk_a = combo_a.get('vk')
-            vk_b = combo_b.get('vk')
-            if vk_a is None or vk_b is None or vk_a != vk_b:
+            # Одиночный combo — последовательность из одного удара
+            strokes_a = hotkey_sequences.rule_strokes(hk)
+            if strokes_a is None or new_strokes is None:
                 continue
-            mods_a = set(combo_a.get('mods', []))
-            mods_b = set(combo_b.get('mods', []))
-            conflict = False
-            if strict:
-                conflict = mods_a == mods_b
-            else:
-                # пересечение по подмножеству — любой из наборов покрывает другой
-                conflict = mods_a.issubset(mods_b) or mods_b.issubset(mods_a)
+            # Удар за ударом: vk совпадает, strict — маски равны; иначе — любой из наборов покрывает другой.
+            # Для разной длины это конфликт префикса: короткая комбинация перехватит начало длинной
+            conflict = hotkey_sequences.strokes_conflict(strokes_a, new_strokes, strict)
             if conflict and scopes_overlap(hk.get('scope','global'), hk.get('app',''), new_scope, new_app):
                 return hk
     return None
 
+def analyze_conflicts(hotkeys: Optional[List[Dict[str, Any]]] = None, *, strict: Optional[bool] = None):
+    """Все конфликты конфигурации разом (conflict_analyzer); по умолчанию — текущие хоткеи
+    вместе с правилами профилей приложений. Семантика совпадает с hotkey_conflicts,
+    но без квадратичного перебора."""
+    import conflict_analyzer
+    if hotkeys is None:
+        hotkeys = load_hotkeys() + _profile_hotkeys()
+    if strict is None:
+        strict = get_strict_mods()
+    return conflict_analyzer.analyze_conflicts(hotkeys, strict=strict)
+
 def compare_hotkey_event(event_vk, event_mods, hk_combo, strict: bool):
     """Сравнивает событие с хоткеем.
-    event_mods: set(str)
+    event_mods: битовая маска modifiers (или, для совместимости, набор имён)
     hk_combo: dict {mods:[...], vk:int}
-    strict: True -> точное совпадение множества модификаторов; False -> hk.mods ⊆ event_mods
+    strict: True -> основные модификаторы совпадают точно; False -> маска хоткея ⊆ маски события
     """
     if hk_combo is None:
         return False
     hk_vk = hk_combo.get('vk')
     if hk_vk is None or hk_vk != event_vk:
         return False
-    hk_mods = set(hk_combo.get('mods', []))
-    # Нормализуем регистр (UI сохраняет в нижнем, Quartz даёт с заглавной первой буквой)
-    hk_mods_l = {m.lower() for m in hk_mods}
-    event_mods_l = {m.lower() for m in event_mods}
-    if strict:
-        return hk_mods_l == event_mods_l
-    return hk_mods_l.issubset(event_mods_l)
+    hk_mask = modifiers.parse_mods(hk_combo.get('mods', []))
+    if hk_mask is None:
+        return False
+    event_mask = modifiers.parse_mods(event_mods, ignore_unknown=True)
+    return modifiers.matches(event_mask, hk_mask, strict)
 
 # --- Работа с хоткеями ---
 ## Старые функции load_hotkeys / save_hotkeys заменены обновлёнными версиями выше
@@ -265,203 +895,316 @@ def get_hotkey_key(hk):
     hk_type = hk.get('type', 'keyboard')
     if hk_type == 'keyboard':
         combo = hk.get('combo', {})
-        mods, vk = parse_combo(combo)
-        return (hk_type, vk, frozenset(mods or []), hk.get('scope', 'global'), hk.get('app', ''))
+        mask, vk = parse_combo(combo)
+        return (hk_type, vk, mask, hk.get('scope', 'global'), hk.get('app', ''))
     elif hk_type == 'trackpad':
         return (hk_type, hk.get('gesture', ''), hk.get('scope', 'global'), hk.get('app', ''))
     return None
 
 def parse_combo(combo):
     if isinstance(combo, dict):
-        mods = set(combo.get('mods', []))
+        mask = modifiers.parse_mods(combo.get('mods', []), ignore_unknown=True)
         vk = combo.get('vk')
-        return (frozenset(mods), vk)
-    return (frozenset(), None)
+        return (mask, vk)
+    return (0, None)
 
 def get_active_app_name():
     # Deprecated local wrapper — use unified version
     return unified_get_active_app_name()
 
+def get_frontmost_app():
+    """AppInfo активного приложения из событийного кэша (O(1) при запущенном трекере)."""
+    return frontmost_app.get_tracker().current()
+
 def run_action(action):
     # Proxy to unified implementation for backwards compatibility
     unified_run_action(action)
 
+# --- Асинхронное выполнение действий ---
+# Слушатели только ставят действие в очередь; выполняют его рабочие потоки
+_action_executor = ActionExecutor(unified_run_action)
+
+def configure_action_executor(**kwargs):
+    """Пересоздаёт исполнитель действий с новыми параметрами
+    (workers, maxsize, overflow, limits, block_timeout — см. action_executor.ActionExecutor).
+    Ещё не выполненные действия старого исполнителя переносятся в новый."""
+    global _action_executor
+    old = _action_executor
+    new = ActionExecutor(unified_run_action, **kwargs)
+    running = bool(old._threads)
+    old.stop()
+    _action_executor = new
+    # Забираем после переключения: действия, поставленные в старую очередь до него, тоже не теряются
+    pending = old.drain()
+    moved = sum(new.submit(action) for action in pending)
+    if moved < len(pending):
+        logger.warning(f"При перенастройке исполнителя отброшено действий: {len(pending) - moved}")
+    if running:
+        new.start()
+    return new
+
+# --- Бортовой самописец клавиатурных событий (вместо debug-лога на каждое нажатие) ---
+_flight_recorder = FlightRecorder()
+FLIGHT_DUMP_DIR = os.path.join(os.path.expanduser('~'), 'Library', 'Logs')
+
+def get_flight_recorder() -> FlightRecorder:
+    return _flight_recorder
+
+def dump_flight_recorder(path: Optional[str] = None) -> Optional[str]:
+    """Сохраняет кольцевой буфер событий в файл (расшифровка: python flight_recorder.py <файл>)."""
+    if path is None:
+        path = os.path.join(FLIGHT_DUMP_DIR, time.strftime('HotkeyMaster-flight-%Y%m%d-%H%M%S.bin'))
+    try:
+        _flight_recorder.dump(path)
+        logger.info(f"Журнал событий сохранён: {path}")
+        return path
+    except Exception as e:
+        logger.error(f"Не удалось сохранить журнал событий: {e}")
+        return None
+
+def submit_action(action) -> bool:
+    """Поставить действие в очередь исполнителя (не блокирует поток ввода)."""
+    _action_executor.start()
+    return _action_executor.submit(action)
+
 # --- Глобальные переменные для управления слушателем ---
 _hotkey_listener_thread = None
 _hotkey_listener_stop_event = threading.Event()
 _hotkey_tap = None
 _hotkey_run_loop_source = None
-KEY_REPEAT_DEBOUNCE = 0.4  # секунды подавления повтора удержанной клавиши
-_last_hotkey_fire = {}  # key -> timestamp последнего срабатывания
+KEY_REPEAT_DEBOUNCE = 0.4  # окно подавления для событий без признака автоповтора (прежнее поведение)
+# Последние срабатывания по правилам: монотонные часы, ограниченный LRU
+_repeat_gate = RepeatGate(KEY_REPEAT_DEBOUNCE)
 
-def _hotkey_fire_key(hk: Dict[str, Any]):
-    """Возвращает ключ для системы подавления повторов."""
+def _hotkey_fire_key(hk):
+    """Возвращает ключ для системы подавления повторов (hk — Rule или dict)."""
+    if isinstance(hk, Rule):
+        return hk.id
     if 'id' in hk:
         return hk['id']
     if hk.get('type') == 'keyboard':
         combo = hk.get('combo') or {}
-        return ('kbd', combo.get('vk'), tuple(sorted(combo.get('mods', []))), hk.get('scope'), hk.get('app'))
+        return ('kbd', combo.get('vk'), modifiers.parse_mods(combo.get('mods', []), ignore_unknown=True), hk.get('scope'), hk.get('app'))
     if hk.get('type') == 'trackpad':
         return ('tp', hk.get('gesture'), hk.get('scope'), hk.get('app'))
     return ('unknown', id(hk))
 
-def allow_hotkey_fire(hk: Dict[str, Any], now: Optional[float]=None) -> bool:
-    """Возвращает True если действие можно выполнить (не подавлено)."""
-    if now is None:
-        now = time.time()
-    key = _hotkey_fire_key(hk)
-    last = _last_hotkey_fire.get(key)
-    if last is not None and (now - last) < KEY_REPEAT_DEBOUNCE:
-        return False
-    _last_hotkey_fire[key] = now
-    return True
+def allow_hotkey_fire(hk, now: Optional[float]=None, autorepeat: Optional[bool]=None) -> bool:
+    """Возвращает True если действие можно выполнить (не подавлено).
+    autorepeat — поле kCGKeyboardEventAutorepeat события; None — неизвестно (окно KEY_REPEAT_DEBOUNCE).
+    now — время по time.monotonic()."""
+    if isinstance(hk, Rule):
+        policy, rate = hk.repeat, hk.repeat_rate
+    else:
+        policy, rate = normalize_policy(hk.get('repeat', REPEAT_ONCE)), _float(hk.get('repeat_rate', 0.0))
+    return _repeat_gate.allow(_hotkey_fire_key(hk), autorepeat, policy, rate, now)
 
 # --- Quartz глобальный слушатель ---
-def start_quartz_hotkey_listener():
+# Старт ждёт готовности tap, стоп — завершения потока; оба ожидания прерываются событием,
+# а не фиксированными паузами, таймауты — только страховка от зависания
+LISTENER_START_TIMEOUT = 2.0
+LISTENER_STOP_TIMEOUT = 2.0
+_hotkey_run_loop = None  # CFRunLoop потока слушателя (CFRunLoopStop потокобезопасен)
+_hotkey_listener_ready = threading.Event()  # tap создан (или создать не удалось)
+_listener_stats = {'restarts': 0, 'last_downtime': None, 'last_stop_duration': None, 'last_start_duration': None}
+# Пробуждения потока слушателя (события, управляющие команды, выходы из run loop) с момента старта:
+# в простое поток спит в ядре и счётчик не растёт
+_listener_wakeups = 0
+_listener_started_at: Optional[float] = None
+# Ожидание run loop без тайм-аута: будят только события tap и команды _post_to_listener
+LISTENER_IDLE_WAIT = 1.0e9
+
+def get_listener_stats() -> Dict[str, Any]:
+    """Измерения перезапусков (секунды) и пробуждений слушателя."""
+    stats = dict(_listener_stats)
+    stats['wakeups'] = _listener_wakeups
+    uptime = time.monotonic() - _listener_started_at if _listener_started_at is not None else 0.0
+    stats['uptime'] = uptime
+    stats['wakeups_per_sec'] = _listener_wakeups / uptime if uptime > 0 else 0.0
+    return stats
+
+def _post_to_listener(fn) -> bool:
+    """Выполнить fn в потоке слушателя: блок ставится в его run loop и будит его.
+    False — слушатель не запущен или CFRunLoopPerformBlock недоступен."""
+    loop = _hotkey_run_loop
+    if loop is None:
+        return False
+    try:
+        import Quartz
+        perform = getattr(Quartz, 'CFRunLoopPerformBlock', None)
+        if perform is None:
+            return False
+        perform(loop, Quartz.kCFRunLoopDefaultMode, fn)
+        Quartz.CFRunLoopWakeUp(loop)
+        return True
+    except Exception as e:
+        logger.error(f"Не удалось передать команду слушателю: {e}")
+        return False
+
+def reconfigure_hotkey_listener() -> bool:
+    """Попросить слушатель перепроверить tap (например, после пробуждения) без перезапуска."""
+    def check():
+        global _listener_wakeups
+        _listener_wakeups += 1
+        _ensure_tap_enabled(_hotkey_tap)
+    return _post_to_listener(check)
+
+def _ensure_tap_enabled(tap):
+    if tap is None:
+        return
     import Quartz
-    import AppKit
-    from PyQt5.QtCore import QCoreApplication
+    if not Quartz.CGEventTapIsEnabled(tap):
+        logger.warning("CGEventTap отключен, пытаемся включить...")
+        Quartz.CGEventTapEnable(tap, True)
+
+def is_hotkey_listener_running() -> bool:
+    return bool(_hotkey_listener_thread and _hotkey_listener_thread.is_alive() and _hotkey_tap is not None)
+
+def start_quartz_hotkey_listener() -> bool:
+    """Запускает слушатель и ждёт, пока tap будет создан. True — tap работает."""
     global _hotkey_listener_thread
+    t0 = time.monotonic()
     
     logger.info("Запуск Quartz hotkey listener...")
+    # Конфиг отслеживается в фоне — колбэк события не делает файлового I/O
+    start_config_watcher()
+    _action_executor.start()
+    tracker = frontmost_app.get_tracker()
+    tracker.remove_listener(_on_frontmost_app_changed)
+    tracker.add_listener(_on_frontmost_app_changed)
+    _on_frontmost_app_changed(tracker.current())
     
-    # Если слушатель уже запущен, останавливаем его
+    # Если слушатель уже запущен, останавливаем его (stop возвращается, когда tap разобран)
     if _hotkey_listener_thread and _hotkey_listener_thread.is_alive():
         logger.info("Останавливаем существующий hotkey listener")
         stop_quartz_hotkey_listener()
         
-    # Небольшая пауза для очистки ресурсов
-    time.sleep(0.1)
-        
     _hotkey_listener_stop_event.clear()
+    _hotkey_listener_ready.clear()
     _hotkey_listener_thread = threading.Thread(target=_run_hotkey_listener, name="QuartzHotkeyThread", daemon=True)
     _hotkey_listener_thread.start()
+    if not _hotkey_listener_ready.wait(LISTENER_START_TIMEOUT):
+        logger.warning(f"CGEventTap не создан за {LISTENER_START_TIMEOUT} с")
+    _listener_stats['last_start_duration'] = time.monotonic() - t0
     
     logger.info("Новый Quartz hotkey listener thread запущен")
+    return _hotkey_tap is not None
 
-def stop_quartz_hotkey_listener():
-    """Остановить слушатель хоткеев"""
-    global _hotkey_listener_thread, _hotkey_tap, _hotkey_run_loop_source
+def stop_quartz_hotkey_listener() -> float:
+    """Остановить слушатель хоткеев: run loop потока останавливается напрямую,
+    tap разбирается в самом потоке. Возвращает время остановки в секундах."""
+    global _hotkey_listener_thread
+    t0 = time.monotonic()
     
     logger.info("Остановка Quartz hotkey listener...")
+    # Сначала флаг, потом чтение run loop: поток публикует run loop до проверки флага,
+    # поэтому остановка не теряется, даже если поток ещё только запускается
     _hotkey_listener_stop_event.set()
-    
-    # Очищаем CGEventTap первым делом
-    if _hotkey_tap:
+    thread = _hotkey_listener_thread
+    loop = _hotkey_run_loop
+    if loop is not None:
         try:
             import Quartz
-            Quartz.CGEventTapEnable(_hotkey_tap, False)
-            if _hotkey_run_loop_source:
-                try:
-                    # Получаем текущий run loop потока
-                    if _hotkey_listener_thread and _hotkey_listener_thread.is_alive():
-                        # Сигнализируем потоку о необходимости остановки
-                        pass  # stop event уже установлен
-                except Exception as e:
-                    logger.error(f"Ошибка остановки run loop source: {e}")
+            # Команда остановки приходит в run loop потока как блок; CFRunLoopStop снаружи —
+            # запасной путь (тоже будит поток сразу)
+            if not _post_to_listener(lambda: Quartz.CFRunLoopStop(Quartz.CFRunLoopGetCurrent())):
+                Quartz.CFRunLoopStop(loop)
         except Exception as e:
-            logger.error(f"Ошибка остановки CGEventTap: {e}")
+            logger.error(f"Ошибка остановки run loop: {e}")
     
-    # Ждем завершения потока
-    if _hotkey_listener_thread and _hotkey_listener_thread.is_alive():
-        try:
-            _hotkey_listener_thread.join(timeout=3.0)
-            if _hotkey_listener_thread.is_alive():
-                logger.warning("Поток hotkey listener не завершился за 3 секунды")
-        except Exception as e:
-            logger.error(f"Ошибка при ожидании завершения потока: {e}")
-        
-    # Очищаем глобальные переменные
+    # Ждем завершения потока (обычно — миллисекунды)
+    if thread and thread.is_alive() and thread is not threading.current_thread():
+        thread.join(timeout=LISTENER_STOP_TIMEOUT)
+        if thread.is_alive():
+            logger.warning(f"Поток hotkey listener не завершился за {LISTENER_STOP_TIMEOUT} с")
     _hotkey_listener_thread = None
-    _hotkey_tap = None
-    _hotkey_run_loop_source = None
     
+    elapsed = time.monotonic() - t0
+    _listener_stats['last_stop_duration'] = elapsed
     logger.info("Quartz hotkey listener остановлен")
+    return elapsed
 
-def restart_quartz_hotkey_listener():
-    """Перезапустить слушатель хоткеев"""
-    logger.info("Перезапуск Quartz hotkey listener после пробуждения...")
-    
+def restart_quartz_hotkey_listener() -> Optional[float]:
+    """Перезапустить слушатель хоткеев. Возвращает измеренный простой (секунды),
+    None — если tap создать не удалось (вызывающий может повторить позже)."""
+    logger.info("Перезапуск Quartz hotkey listener...")
+    t0 = time.monotonic()
     try:
-        # Останавливаем с тайм-аутом
         stop_quartz_hotkey_listener()
-        
-        # Даем системе время для очистки ресурсов
-        time.sleep(1.0)
-        
-        # Запускаем заново
-        start_quartz_hotkey_listener()
-        
-        logger.info("Hotkey listener успешно перезапущен")
+        ok = start_quartz_hotkey_listener()
     except Exception as e:
         logger.error(f"Ошибка перезапуска hotkey listener: {e}")
-        # Попытаемся запустить заново даже при ошибке остановки
-        try:
-            time.sleep(0.5)
-            start_quartz_hotkey_listener()
-            logger.info("Hotkey listener запущен после ошибки остановки")
-        except Exception as restart_error:
-            logger.error(f"Критическая ошибка запуска hotkey listener: {restart_error}")
+        ok = False
+    downtime = time.monotonic() - t0
+    _listener_stats['restarts'] += 1
+    if not ok:
+        logger.error(f"Hotkey listener не перезапущен (прошло {downtime * 1000:.0f} мс)")
+        return None
+    _listener_stats['last_downtime'] = downtime
+    logger.info(f"Hotkey listener перезапущен, простой {downtime * 1000:.0f} мс")
+    return downtime
 
 def _run_hotkey_listener():
     """Основная функция слушателя хоткеев"""
     import Quartz
+    _frontmost_tracker = frontmost_app.get_tracker()
     
-    MODS_MAP = {
-        Quartz.kCGEventFlagMaskCommand: 'Cmd',
-        Quartz.kCGEventFlagMaskShift: 'Shift',
-        Quartz.kCGEventFlagMaskAlternate: 'Alt',
-        Quartz.kCGEventFlagMaskControl: 'Ctrl',
-    }
-    def get_mods_from_flags(flags):
-        mods = set()
-        for mask, name in MODS_MAP.items():
-            if flags & mask:
-                mods.add(name)
-        return mods
-        
+    record = _flight_recorder.record
+    clock = time.monotonic_ns
+    sequence_matcher = SequenceMatcher()
+
+    tap_disabled_types = (Quartz.kCGEventTapDisabledByTimeout, Quartz.kCGEventTapDisabledByUserInput)
+
     def event_callback(proxy, type_, event, refcon):
-        # Проверяем, не был ли event tap отключен
-        if not Quartz.CGEventTapIsEnabled(_hotkey_tap):
+        global _listener_wakeups
+        _listener_wakeups += 1
+        t0 = clock()
+        # macOS сообщает об отключении tap отдельным событием — опрашивать состояние не нужно
+        if type_ in tap_disabled_types:
             logger.warning("CGEventTap был отключен, пытаемся включить обратно...")
-            Quartz.CGEventTapEnable(_hotkey_tap, True)
+            Quartz.CGEventTapEnable(tap, True)
+            record(t0, 0, 0, flight_recorder.TAP_REENABLED)
             return event
         if type_ != Quartz.kCGEventKeyDown:
             return event
         vk = Quartz.CGEventGetIntegerValueField(event, Quartz.kCGKeyboardEventKeycode)
-        flags = Quartz.CGEventGetFlags(event)
-        mods = get_mods_from_flags(flags)
-        logger.debug(f"CGEventTap: vk={vk}, mods={mods}")  # Логируем все нажатия
-        # Загружаем настройки (strict_mod_match) при необходимости
-        _load_general_settings()
-        # Отсекаем отключённые хоткеи
-        hotkeys = [hk for hk in load_hotkeys() if hk.get('enabled', True)]
-        for hk in hotkeys:
-            if hk.get('type') != 'keyboard':
-                continue
-            combo = hk.get('combo', {})
-            logger.debug(f"Сравниваем с хоткеем: vk={combo.get('vk')}, mods={combo.get('mods')}, disp={combo.get('disp')} strict={_strict_mods}")
-            if compare_hotkey_event(vk, mods, combo, _strict_mods):
-                scope = hk.get('scope', 'global')
-                app = hk.get('app', '')
-                if scope == 'app' and app:
-                    active_app = get_active_app_name()
-                    if not active_app or app not in active_app:
-                        continue
-                # Подавление повторов удержания
-                if not allow_hotkey_fire(hk):
-                    logger.debug("[DEBOUNCE] suppressed repeat hotkey fire")
-                    break
-                logger.info(f'Hotkey triggered (Quartz): {combo.get("disp", str(hk))}')
-                run_action(hk.get('action', ''))
-                break
+        # Удержание клавиши отличается от нового нажатия полем автоповтора
+        autorepeat = bool(Quartz.CGEventGetIntegerValueField(event, Quartz.kCGKeyboardEventAutorepeat))
+        mask = Quartz.CGEventGetFlags(event) & modifiers.MODIFIER_MASK
+        # Один поиск в таблице активного приложения (app-правила уже наложены на глобальные,
+        # отключённые туда не попадают); таблицу переключают наблюдатели конфига и приложений
+        table = _active_table if _frontmost_tracker.observing else get_active_table()
+        reason, rule = flight_recorder.NO_MATCH, None
+        candidates = ()
+        seq_state = hotkey_sequences.NONE
+        if table.sequences.size or sequence_matcher.pending:
+            # Автомат последовательностей: шаг по trie из текущих узлов, дедлайн проверяется здесь же
+            seq_state, rule = sequence_matcher.feed(table.sequences, vk, mask, _strict_mods, t0 / 1e9, autorepeat)
+        if seq_state == hotkey_sequences.PENDING:
+            reason = flight_recorder.SEQUENCE_PREFIX
+        elif seq_state == hotkey_sequences.NONE:
+            candidates = table.keyboard.lookup(vk, mask, _strict_mods)
+            if candidates:
+                rule = candidates[0]
+        if rule is not None:
+            # Подавление автоповтора удержания по политике правила
+            if not allow_hotkey_fire(rule, autorepeat=autorepeat):
+                reason = flight_recorder.REPEAT_SUPPRESSED if autorepeat else flight_recorder.DEBOUNCED
+            elif _action_executor.submit(rule.action):
+                reason = flight_recorder.FIRED
+            else:
+                reason = flight_recorder.QUEUE_FULL
+        # Каждое решение — одна запись в самописец, без форматирования строк
+        record(t0, vk, mask, reason, rule.id if rule is not None else None, len(candidates), clock() - t0)
+        if reason == flight_recorder.FIRED:
+            logger.info('Hotkey triggered (Quartz): %s', rule.disp or rule.id)
         return event
     
     # Создаем event tap
-    global _hotkey_tap, _hotkey_run_loop_source
+    global _hotkey_tap, _hotkey_run_loop_source, _hotkey_run_loop
     
     mask = Quartz.CGEventMaskBit(Quartz.kCGEventKeyDown)
-    _hotkey_tap = Quartz.CGEventTapCreate(
+    tap = Quartz.CGEventTapCreate(
         Quartz.kCGHIDEventTap,  # use HID tap for global key events
         Quartz.kCGHeadInsertEventTap,
         Quartz.kCGEventTapOptionDefault,
@@ -470,57 +1213,55 @@ def _run_hotkey_listener():
         None
     )
     
-    if not _hotkey_tap:
+    if not tap:
         logger.error('Не удалось создать CGEventTap. Проверьте права Accessibility!')
+        _hotkey_listener_ready.set()
         return
         
-    _hotkey_run_loop_source = Quartz.CFMachPortCreateRunLoopSource(None, _hotkey_tap, 0)
+    source = Quartz.CFMachPortCreateRunLoopSource(None, tap, 0)
     loop = Quartz.CFRunLoopGetCurrent()
-    Quartz.CFRunLoopAddSource(loop, _hotkey_run_loop_source, Quartz.kCFRunLoopCommonModes)
-    Quartz.CGEventTapEnable(_hotkey_tap, True)
+    Quartz.CFRunLoopAddSource(loop, source, Quartz.kCFRunLoopCommonModes)
+    _hotkey_tap, _hotkey_run_loop_source, _hotkey_run_loop = tap, source, loop
+    Quartz.CGEventTapEnable(tap, True)
+    _hotkey_listener_ready.set()
     logger.info('Quartz hotkey listener started.')
     
-    # Запускаем run loop с проверкой на остановку
+    # Поток спит в run loop, пока нет работы: событие tap (включая уведомление об отключении),
+    # блок-команда (_post_to_listener) или CFRunLoopStop. Периодического опроса нет.
     logger.info('Hotkey listener run loop запущен')
+    global _listener_wakeups, _listener_started_at
+    _listener_wakeups = 0
+    _listener_started_at = time.monotonic()
     while not _hotkey_listener_stop_event.is_set():
         try:
-            # Используем короткие интервалы для возможности проверки stop_event
-            Quartz.CFRunLoopRunInMode(Quartz.kCFRunLoopDefaultMode, 0.1, False)
-            
-            # Периодически проверяем состояние event tap
-            if _hotkey_tap and not Quartz.CGEventTapIsEnabled(_hotkey_tap):
-                logger.warning("CGEventTap отключен, пытаемся включить...")
-                try:
-                    Quartz.CGEventTapEnable(_hotkey_tap, True)
-                except Exception as e:
-                    logger.error(f"Не удалось включить CGEventTap: {e}")
-                    break  # Выходим из цикла при критической ошибке
-                
+            result = Quartz.CFRunLoopRunInMode(Quartz.kCFRunLoopDefaultMode, LISTENER_IDLE_WAIT, False)
+            _listener_wakeups += 1
+            if result == Quartz.kCFRunLoopRunFinished:
+                # В режиме не осталось источников (tap инвалидирован системой) — ждать нечего
+                logger.error("Run loop слушателя остался без источников, слушатель остановлен")
+                break
+            if not _hotkey_listener_stop_event.is_set():
+                _ensure_tap_enabled(tap)
         except Exception as e:
             logger.error(f"Ошибка в run loop: {e}")
-            # При критической ошибке пытаемся продолжить, но ограничиваем количество попыток
+            # Пауза только на пути ошибки — чтобы не уйти в горячий цикл
             time.sleep(0.1)
     
     logger.info('Hotkey listener run loop завершен')
     
-    # Очистка ресурсов
+    # Детерминированная очистка в своём потоке: источник снят, tap выключен и инвалидирован
+    # до того, как stop_quartz_hotkey_listener дождётся join — новый tap не пересечётся со старым
     try:
-        if _hotkey_run_loop_source and loop:
-            try:
-                Quartz.CFRunLoopRemoveSource(loop, _hotkey_run_loop_source, Quartz.kCFRunLoopCommonModes)
-                logger.debug("Run loop source удален")
-            except Exception as e:
-                logger.error(f"Ошибка удаления run loop source: {e}")
-        
-        if _hotkey_tap:
-            try:
-                Quartz.CGEventTapEnable(_hotkey_tap, False)
-                Quartz.CFMachPortInvalidate(_hotkey_tap)
-                logger.debug("CGEventTap отключен и инвалидирован")
-            except Exception as e:
-                logger.error(f"Ошибка инвалидации CGEventTap: {e}")
-                
+        Quartz.CFRunLoopRemoveSource(loop, source, Quartz.kCFRunLoopCommonModes)
+    except Exception as e:
+        logger.error(f"Ошибка удаления run loop source: {e}")
+    try:
+        Quartz.CGEventTapEnable(tap, False)
+        Quartz.CFMachPortInvalidate(tap)
     except Exception as e:
-        logger.error(f"Ошибка при очистке ресурсов: {e}")
+        logger.error(f"Ошибка инвалидации CGEventTap: {e}")
+    # Глобальные ссылки сбрасываем, только если они всё ещё наши
+    if _hotkey_tap is tap:
+        _hotkey_tap, _hotkey_run_loop_source, _hotkey_run_loop = None, None, None
         
     logger.info('Quartz hotkey listener stopped.')
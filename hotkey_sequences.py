@@ -0,0 +1,223 @@
+"""Многоударные последовательности хоткеев (leader keys): Cmd+K, затем Cmd+C.
+
+Формат правила в hotkeys.json — клавиатурное правило без combo, с полем sequence:
+    {"type": "keyboard", "sequence": [{"mods": ["Cmd"], "vk": 40, "disp": "Cmd + K"},
+                                      {"mods": ["Cmd"], "vk": 8, "disp": "Cmd + C"}],
+     "sequence_timeout": 1.0, "action": "..."}
+sequence_timeout — допустимая пауза между ударами (секунды).
+
+Последовательности компилируются в префиксное дерево (trie) на каждую таблицу
+правил. SequenceMatcher продвигается по нему один раз на нажатие: из текущих
+узлов — одно обращение к словарю, как в DispatchIndex, поэтому стоимость
+нажатия не зависит от числа последовательностей. Незавершённая
+последовательность сбрасывается по общему дедлайну, который проверяется
+на следующем нажатии, — без таймеров и дополнительных потоков.
+
+Пока последовательность не завершена, её префикс имеет приоритет над
+одиночными хоткеями с той же комбинацией (такие пары — конфликт префикса,
+о нём сообщает hotkey_conflicts). События tap при этом не поглощаются.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from modifiers import CORE_MASK, parse_mods, overlaps
+from hotkey_dispatch import _supersets
+
+if TYPE_CHECKING:
+    from rules import Rule
+
+Stroke = Tuple[int, int]  # (vk, маска модификаторов)
+
+DEFAULT_SEQUENCE_TIMEOUT = 1.0
+
+# Результат SequenceMatcher.feed
+NONE = 0       # нажатие не относится к последовательностям
+PENDING = 1    # нажатие продолжило последовательность, ждём следующее
+FIRED = 2      # последовательность завершена
+
+
+def parse_stroke(combo: Any, ignore_unknown: bool = False) -> Optional[Stroke]:
+    if not isinstance(combo, dict) or combo.get('vk') is None:
+        return None
+    mask = parse_mods(combo.get('mods', []), ignore_unknown=ignore_unknown)
+    if mask is None:
+        return None
+    return (combo['vk'], mask)
+
+
+def parse_sequence(items: Any, ignore_unknown: bool = False) -> Optional[Tuple[Stroke, ...]]:
+    """Удары последовательности или None, если хоть один удар некорректен."""
+    if not isinstance(items, (list, tuple)) or not items:
+        return None
+    strokes = tuple(parse_stroke(c, ignore_unknown) for c in items)
+    return None if any(s is None for s in strokes) else strokes
+
+
+def rule_strokes(hk: Dict[str, Any]) -> Optional[Tuple[Stroke, ...]]:
+    """Удары клавиатурного правила (одиночный combo — последовательность из одного удара).
+    Неизвестные модификаторы игнорируются — как в hotkey_conflicts."""
+    if hk.get('sequence'):
+        return parse_sequence(hk['sequence'], ignore_unknown=True)
+    combo = hk.get('combo') or {}
+    vk = combo.get('vk')
+    if vk is None:
+        return None
+    return ((vk, parse_mods(combo.get('mods', []), ignore_unknown=True)),)
+
+
+def strokes_conflict(a: Tuple[Stroke, ...], b: Tuple[Stroke, ...], strict: bool) -> bool:
+    """Конфликт: более короткая последовательность — префикс более длинной (удар за ударом)."""
+    for (vk_a, mask_a), (vk_b, mask_b) in zip(a, b):
+        if vk_a != vk_b or not overlaps(mask_a, mask_b, strict):
+            return False
+    return True
+
+
+class _Node:
+    __slots__ = ('_by_stroke', '_strict', '_loose', '_any_extra', 'extra', 'rules', 'timeout')
+
+    def __init__(self):
+        self._by_stroke: Dict[Stroke, '_Node'] = {}
+        self._strict: Dict[Stroke, Tuple['_Node', ...]] = {}
+        self._loose: Dict[Stroke, Tuple['_Node', ...]] = {}
+        self._any_extra = False  # у кого-то из детей есть дополнительные биты
+        self.extra = 0  # требуемые дополнительные биты удара, ведущего в этот узел
+        self.rules: Tuple['Rule', ...] = ()
+        self.timeout = 0.0  # наибольшая пауза, допустимая перед следующим ударом
+
+    @property
+    def has_children(self) -> bool:
+        return bool(self._by_stroke)
+
+    def child(self, stroke: Stroke) -> '_Node':
+        node = self._by_stroke.get(stroke)
+        if node is None:
+            node = self._by_stroke[stroke] = _Node()
+        return node
+
+    def compile(self):
+        """Раскладка детей по корзинам (vk, основная маска события), как в DispatchIndex."""
+        strict: Dict[Stroke, List['_Node']] = {}
+        loose: Dict[Stroke, List['_Node']] = {}
+        for (vk, mask), node in self._by_stroke.items():
+            core = mask & CORE_MASK
+            if mask != core:
+                node.extra = mask & ~CORE_MASK
+                self._any_extra = True
+            strict.setdefault((vk, core), []).append(node)
+            for ev_mask in _supersets(core):
+                loose.setdefault((vk, ev_mask), []).append(node)
+            node.compile()
+        self._strict = {k: tuple(v) for k, v in strict.items()}
+        self._loose = {k: tuple(v) for k, v in loose.items()}
+
+    def step(self, vk: int, mask: int, strict: bool) -> Tuple['_Node', ...]:
+        hit = (self._strict if strict else self._loose).get((vk, mask & CORE_MASK), ())
+        if hit and self._any_extra:
+            return tuple(n for n in hit if mask & n.extra == n.extra)
+        return hit
+
+
+class SequenceTrie:
+    """Префиксное дерево включённых клавиатурных последовательностей (≥ 2 ударов).
+    Порядок правил задаёт приоритет при одновременном завершении."""
+    __slots__ = ('root', 'size', 'rules')
+
+    def __init__(self, rules: Iterable['Rule'] = ()):
+        self.root = _Node()
+        self.rules = tuple(r for r in rules if _in_trie(r))  # правила дерева в порядке приоритета
+        size = 0
+        for rule in self.rules:
+            node = self.root
+            for stroke in rule.sequence:
+                node.timeout = max(node.timeout, rule.sequence_timeout)
+                node = node.child(stroke)
+            node.rules = node.rules + (rule,)
+            size += 1
+        self.root.compile()
+        self.size = size
+
+    def patched(self, removed: Iterable['Rule'], added: Iterable['Rule'],
+                rank: Callable[['Rule'], Any]) -> 'SequenceTrie':
+        """Дерево без правил removed (по id) и с правилами added. Если последовательности
+        не затронуты, возвращается то же дерево (незавершённый набор не сбрасывается)."""
+        gone = {r.id for r in removed}
+        kept = tuple(r for r in self.rules if r.id not in gone)
+        new = tuple(r for r in added if _in_trie(r))
+        if len(kept) == len(self.rules) and not new:
+            return self
+        return SequenceTrie(sorted(kept + new, key=rank))
+
+
+def _in_trie(rule: 'Rule') -> bool:
+    return rule.type == 'keyboard' and rule.enabled and len(rule.sequence) >= 2
+
+
+EMPTY_TRIE = SequenceTrie()
+
+
+class SequenceMatcher:
+    """Состояние набора последовательности. Используется одним потоком (event tap)."""
+    __slots__ = ('_trie', '_active', '_deadline', '_last')
+
+    def __init__(self):
+        self._trie: Optional[SequenceTrie] = None
+        self._active: Tuple[_Node, ...] = ()
+        self._deadline = 0.0
+        self._last = 0.0
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._active)
+
+    def reset(self):
+        self._active = ()
+
+    def feed(self, trie: SequenceTrie, vk: int, mask: int, strict: bool, now: float,
+             autorepeat: bool = False) -> Tuple[int, Optional['Rule']]:
+        """Продвинуть автомат на одно нажатие. now — time.monotonic()."""
+        if trie is not self._trie:
+            # Сменилась таблица (приложение или конфиг) — незавершённый набор теряет смысл
+            self._trie = trie
+            self._active = ()
+        active = self._active
+        if active and now > self._deadline:
+            active = self._active = ()
+        if autorepeat:
+            # Удержание клавиши не продвигает последовательность
+            return (PENDING, None) if active else (NONE, None)
+        if not trie.size:
+            return NONE, None
+        nxt: Tuple[_Node, ...] = ()
+        for node in active:
+            nxt += node.step(vk, mask, strict)
+        if not nxt:
+            # Сбой посередине — нажатие может начать новую последовательность
+            active = ()
+            nxt = trie.root.step(vk, mask, strict)
+            if not nxt:
+                self._active = ()
+                return NONE, None
+        if active:
+            gap = now - self._last
+            for node in nxt:
+                for rule in node.rules:
+                    if gap <= rule.sequence_timeout:
+                        self._active = ()
+                        return FIRED, rule
+        pending = tuple(n for n in nxt if n.has_children)
+        if not pending:
+            self._active = ()
+            return NONE, None
+        self._active = pending
+        self._last = now
+        self._deadline = now + max(n.timeout for n in pending)
+        return PENDING, None
+
+
+__all__ = [
+    'SequenceTrie', 'SequenceMatcher', 'EMPTY_TRIE', 'DEFAULT_SEQUENCE_TIMEOUT',
+    'NONE', 'PENDING', 'FIRED',
+    'parse_stroke', 'parse_sequence', 'rule_strokes', 'strokes_conflict',
+]
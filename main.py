@@ -8,7 +8,6 @@ import time # Добавим импорт time
 from PyQt5.QtWidgets import QSystemTrayIcon, QMenu, QAction
 from PyQt5.QtGui import QIcon
 import logging
-from ui import show_settings_window
 import Quartz
 import socket
 from trackpad_engine import TrackpadGestureEngine
@@ -20,13 +19,17 @@ from Foundation import NSObject
 from objc import selector
 
 from hotkey_engine import (
-    load_hotkeys, save_hotkeys, start_quartz_hotkey_listener,
-    stop_quartz_hotkey_listener, restart_quartz_hotkey_listener
+    get_rule_repository, submit_action, start_quartz_hotkey_listener,
+    stop_quartz_hotkey_listener, restart_quartz_hotkey_listener, get_active_table,
+    dump_flight_recorder
 )
-from actions import run_action, get_active_app_name
+from frontmost_app import get_tracker as get_frontmost_tracker
 from sleep_wake_monitor import get_sleep_wake_monitor
+from settings_service import get_settings
 
 HOTKEYS_FILE = 'hotkeys.json'
+# Паузы между повторными попытками запуска слушателя после пробуждения (только при неудаче)
+WAKE_RETRY_DELAYS_MS = (100, 250, 500, 1000, 2000)
 # --- Настройка логирования только в файл ---
 LOG_DIR = os.path.join(os.path.expanduser('~'), 'Library', 'Logs')
 LOG_FILE = os.path.join(LOG_DIR, 'HotkeyMaster.log')
@@ -92,6 +95,8 @@ def handle_exception(exc_type, exc_value, exc_traceback):
     
     logger.critical("Неперехваченное исключение:", 
                    exc_info=(exc_type, exc_value, exc_traceback))
+    # Последние клавиатурные события и решения по ним — для разбора падения
+    dump_flight_recorder()
     
     # Пытаемся корректно завершить работу
     try:
@@ -126,7 +131,9 @@ def open_settings_window():
     except Exception:
         pass
     try:
-        show_settings_window(load_hotkeys, save_hotkeys)
+        # Окно настроек (и весь код виджетов) загружается при первом открытии, а не на старте
+        from ui import show_settings_window
+        show_settings_window(get_rule_repository())
     finally:
         # Возвращаем политику к Accessory, чтобы скрыть из Dock
         try:
@@ -151,9 +158,12 @@ def create_tray_qt(app):
     menu = QMenu()
     settings_action = QAction('Настройки', parent=app)
     settings_action.triggered.connect(open_settings_window)
+    dump_action = QAction('Сохранить журнал событий', parent=app)
+    dump_action.triggered.connect(lambda: dump_flight_recorder())
     quit_action = QAction('Выход', parent=app)
     quit_action.triggered.connect(app.quit)
     menu.addAction(settings_action)
+    menu.addAction(dump_action)
     menu.addAction(quit_action)
     tray_icon.setContextMenu(menu)
     tray_icon.show()
@@ -234,15 +244,7 @@ def cleanup_listeners():
         logger.error(f"Ошибка остановки trackpad engine: {e}")
 
 def load_general_settings():
-    import os, json
-    path = os.path.join(os.path.expanduser('~'), 'Library', 'Application Support', 'HotkeyMaster', 'settings.json')
-    if os.path.exists(path):
-        try:
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
-            pass
-    return {'autostart': False}
+    return get_settings().snapshot()
 
 def main():
     # --- Устанавливаем путь к Qt-плагинам для PyQt5 (важно для .app) ---
@@ -289,13 +291,15 @@ def main():
     if not check_accessibility_and_warn():
         logger.warning("Нет прав Accessibility — глобальные хоткеи работать не будут!")
 
+    # Активное приложение отслеживается по уведомлениям NSWorkspace (подписка — из главного потока)
+    get_frontmost_tracker().start()
+
     # Запуск глобального слушателя клавиатурных хоткеев через Quartz
     start_quartz_hotkey_listener()
 
-    # Запуск трекпад-движка в отдельном потоке
-    def get_gesture_actions():
-        return load_hotkeys()
-    trackpad_engine = TrackpadGestureEngine(get_gesture_actions, run_action, get_active_app_name)
+    # Запуск трекпад-движка в отдельном потоке (читает таблицу правил активного приложения)
+    # Действия жестов выполняются асинхронно, как и клавиатурные — колбэк кадров не блокируется
+    trackpad_engine = TrackpadGestureEngine(get_active_table, submit_action)
     try:
         trackpad_engine.start()
         logger.info("Trackpad engine started.")
@@ -318,51 +322,42 @@ def main():
     def on_system_did_wake():
         logger.info("Система проснулась - перезапускаем слушатели")
         
-        # Используем QtTimer для отложенного перезапуска в главном потоке
+        # Перезапуск сразу после пробуждения (в главном потоке Qt): stop/start сами ждут
+        # разбора старого и готовности нового tap, фиксированных пауз нет
         from PyQt5.QtCore import QTimer
         
-        def delayed_restart():
+        def restart_hotkeys(attempt=0):
+            downtime = restart_quartz_hotkey_listener()
+            if downtime is None and attempt < len(WAKE_RETRY_DELAYS_MS):
+                # tap может быть недоступен в первые мгновения после пробуждения — повтор с нарастающей паузой
+                delay = WAKE_RETRY_DELAYS_MS[attempt]
+                logger.warning(f"Hotkey listener не запустился, повтор через {delay} мс")
+                QTimer.singleShot(delay, lambda: restart_hotkeys(attempt + 1))
+        
+        def restart_after_wake():
             try:
-                logger.info("Начинаем отложенный перезапуск слушателей...")
-                
-                # Перезапускаем hotkey listener
+                restart_hotkeys()
+            except Exception as e:
+                logger.error(f"Ошибка перезапуска hotkey listener: {e}")
+            # Перезапускаем trackpad engine
+            if trackpad_engine:
                 try:
-                    restart_quartz_hotkey_listener()
-                    logger.info("Hotkey listener перезапущен")
+                    trackpad_engine.restart()
+                    logger.info("Trackpad engine перезапущен")
                 except Exception as e:
-                    logger.error(f"Ошибка перезапуска hotkey listener: {e}")
-                
-                # Небольшая пауза между перезапусками
-                import time
-                time.sleep(0.2)
-                
-                # Перезапускаем trackpad engine
-                if trackpad_engine:
-                    try:
-                        trackpad_engine.restart()
-                        logger.info("Trackpad engine перезапущен")
-                    except Exception as e:
-                        logger.error(f"Ошибка перезапуска trackpad engine: {e}")
-                        
-                logger.info("Все слушатели успешно перезапущены после пробуждения")
-            except Exception as e:
-                logger.error(f"Критическая ошибка перезапуска слушателей: {e}")
+                    logger.error(f"Ошибка перезапуска trackpad engine: {e}")
         
-        # Задержка 2 секунды для стабилизации системы после пробуждения
-        QTimer.singleShot(2000, delayed_restart)
-        # Watchdog: если спустя 6с после пробуждения слушатели не генерируют событий (tap disabled) — форс рестарт
-        from PyQt5.QtCore import QTimer as _QTimer
+        QTimer.singleShot(0, restart_after_wake)
+        # Watchdog: если спустя 6с после пробуждения слушатель не работает (tap не создан) — форс рестарт
         def watchdog():
             try:
-                # Простая эвристика: проверим поток hotkey listener жив ли
-                from hotkey_engine import _hotkey_listener_thread
-                alive = bool(_hotkey_listener_thread and _hotkey_listener_thread.is_alive())
-                if not alive:
+                from hotkey_engine import is_hotkey_listener_running
+                if not is_hotkey_listener_running():
                     logger.warning("Watchdog: hotkey listener не жив после пробуждения — форс рестарт")
                     restart_quartz_hotkey_listener()
             except Exception as e:
                 logger.error(f"Watchdog ошибка: {e}")
-        _QTimer.singleShot(6000, watchdog)
+        QTimer.singleShot(6000, watchdog)
     
     # Подключаем обработчики
     sleep_monitor.add_sleep_callback(on_system_will_sleep)
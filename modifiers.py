@@ -0,0 +1,151 @@
+"""Единая битовая модель модификаторов HotkeyMaster.
+
+Биты совпадают с раскладкой флагов CGEvent (kCGEventFlagMask* и
+device-dependent NX_DEVICE*KEYMASK), поэтому перевод флагов события в маску —
+одна операция AND, без словарей и множеств строк. В hotkeys.json модификаторы
+по-прежнему хранятся читаемым списком имён ("mods": ["Cmd", "Shift"]),
+регистр имён при чтении не важен, так что старые конфиги грузятся как есть.
+
+Правила сравнения (event — маска события, rule — маска правила):
+  - нестрогое:  event & rule == rule
+  - строгое:    (event & CORE_MASK) == (rule & CORE_MASK) и event & rule == rule
+Fn, CapsLock и левые/правые варианты участвуют в сравнении только если
+правило их явно требует: macOS сам выставляет Fn для стрелок и F-клавиш,
+а CapsLock — просто состояние индикатора.
+"""
+from __future__ import annotations
+
+import enum
+from typing import Iterable, List, Optional
+
+
+class Mod(enum.IntFlag):
+    # Device-dependent биты (какая именно физическая клавиша нажата)
+    LCTRL = 0x00000001
+    LSHIFT = 0x00000002
+    RSHIFT = 0x00000004
+    LCMD = 0x00000008
+    RCMD = 0x00000010
+    LALT = 0x00000020
+    RALT = 0x00000040
+    RCTRL = 0x00002000
+    # Device-independent биты (kCGEventFlagMask*)
+    CAPSLOCK = 0x00010000
+    SHIFT = 0x00020000
+    CTRL = 0x00040000
+    ALT = 0x00080000
+    CMD = 0x00100000
+    FN = 0x00800000
+
+
+# Обычные int — для горячего пути (операции над IntFlag заметно медленнее)
+CORE_MASK = int(Mod.CTRL | Mod.ALT | Mod.SHIFT | Mod.CMD)
+SIDE_MASK = int(Mod.LCTRL | Mod.RCTRL | Mod.LALT | Mod.RALT | Mod.LSHIFT | Mod.RSHIFT | Mod.LCMD | Mod.RCMD)
+MODIFIER_MASK = CORE_MASK | SIDE_MASK | int(Mod.FN | Mod.CAPSLOCK)
+
+# Каноничный порядок и написание (совпадает с порядком отображения в UI)
+_CANONICAL = (
+    ('Ctrl', Mod.CTRL, Mod.LCTRL, Mod.RCTRL),
+    ('Alt', Mod.ALT, Mod.LALT, Mod.RALT),
+    ('Shift', Mod.SHIFT, Mod.LSHIFT, Mod.RSHIFT),
+    ('Cmd', Mod.CMD, Mod.LCMD, Mod.RCMD),
+)
+_NAMES = {
+    'ctrl': Mod.CTRL, 'control': Mod.CTRL, 'ctl': Mod.CTRL, '⌃': Mod.CTRL,
+    'alt': Mod.ALT, 'option': Mod.ALT, 'opt': Mod.ALT, '⌥': Mod.ALT,
+    'shift': Mod.SHIFT, '⇧': Mod.SHIFT,
+    'cmd': Mod.CMD, 'command': Mod.CMD, '⌘': Mod.CMD,
+    'fn': Mod.FN, 'function': Mod.FN,
+    'capslock': Mod.CAPSLOCK, 'caps': Mod.CAPSLOCK, '⇪': Mod.CAPSLOCK,
+}
+for _name, _generic, _left, _right in _CANONICAL:
+    _NAMES['l' + _name.lower()] = _generic | _left
+    _NAMES['r' + _name.lower()] = _generic | _right
+# Синонимы левых/правых вариантов
+for _alias, _base in (('control', 'ctrl'), ('option', 'alt'), ('command', 'cmd')):
+    _NAMES['l' + _alias] = _NAMES['l' + _base]
+    _NAMES['r' + _alias] = _NAMES['r' + _base]
+
+
+def from_cg_flags(flags: int) -> int:
+    """Маска модификаторов из флагов CGEvent."""
+    return flags & MODIFIER_MASK
+
+
+def to_cg_flags(mask: int) -> int:
+    """Флаги для CGEventSetFlags (раскладка битов совпадает)."""
+    return mask & MODIFIER_MASK
+
+
+def parse_mods(names, ignore_unknown: bool = False) -> Optional[int]:
+    """Маска из списка имён ("Cmd", "shift", "LCmd", ...).
+    Для неизвестного имени возвращает None (или пропускает его при ignore_unknown).
+    Целое число считается уже готовой маской.
+    """
+    if isinstance(names, int):
+        return names & MODIFIER_MASK
+    mask = 0
+    for name in names or ():
+        bit = _NAMES.get(str(name).strip().lower())
+        if bit is None:
+            if ignore_unknown:
+                continue
+            return None
+        mask |= int(bit)
+    return mask
+
+
+def mask_to_names(mask: int) -> List[str]:
+    """Читаемый список имён в каноничном порядке (для hotkeys.json и disp)."""
+    res = []
+    for name, generic, left, right in _CANONICAL:
+        if mask & left:
+            res.append('L' + name)
+        if mask & right:
+            res.append('R' + name)
+        if mask & generic and not mask & (left | right):
+            res.append(name)
+    if mask & Mod.FN:
+        res.append('Fn')
+    if mask & Mod.CAPSLOCK:
+        res.append('CapsLock')
+    return res
+
+
+def core(mask: int) -> int:
+    return mask & CORE_MASK
+
+
+def extra(mask: int) -> int:
+    """Требования правила сверх четырёх основных модификаторов."""
+    return mask & ~CORE_MASK
+
+
+def matches(event_mask: int, rule_mask: int, strict: bool) -> bool:
+    """Совпадает ли событие с правилом (см. правила в docstring модуля)."""
+    if event_mask & rule_mask != rule_mask:
+        return False
+    return not strict or (event_mask & CORE_MASK) == (rule_mask & CORE_MASK)
+
+
+def overlaps(mask_a: int, mask_b: int, strict: bool) -> bool:
+    """Могут ли два правила сработать на одно и то же событие (для конфликтов).
+    В строгом режиме основные биты должны совпасть, а требования сверх них
+    (Fn, CapsLock, сторона) всегда совместимы — оба правила сработают на событие mask_a | mask_b."""
+    if strict:
+        return (mask_a & CORE_MASK) == (mask_b & CORE_MASK)
+    common = mask_a & mask_b
+    return common == mask_a or common == mask_b
+
+
+def normalize_names(names: Iterable[str]) -> Optional[List[str]]:
+    """Каноничный список имён или None, если есть неизвестные."""
+    mask = parse_mods(names)
+    return None if mask is None else mask_to_names(mask)
+
+
+__all__ = [
+    'Mod', 'CORE_MASK', 'SIDE_MASK', 'MODIFIER_MASK',
+    'from_cg_flags', 'to_cg_flags', 'parse_mods', 'mask_to_names',
+    'core', 'extra', 'matches', 'overlaps', 'normalize_names',
+]
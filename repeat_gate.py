@@ -0,0 +1,69 @@
+"""Подавление повторов срабатывания хоткеев.
+
+Раньше любое второе срабатывание в течение 0.4 с (по time.time()) отбрасывалось:
+быстрое намеренное двойное нажатие терялось, перевод часов ломал логику,
+а словарь последних срабатываний рос без ограничений.
+
+Теперь удержание клавиши отличается от нового нажатия по полю автоповтора
+CGEvent (kCGKeyboardEventAutorepeat), время берётся из монотонных часов,
+а состояние хранится в ограниченном LRU-словаре.
+
+Политика правила (поле "repeat" в hotkeys.json):
+  - 'once'     — срабатывать только на нажатие, автоповтор игнорируется (по умолчанию);
+  - 'repeat'   — срабатывать и на каждый автоповтор (например, яркость при удержании);
+  - 'throttle' — не чаще repeat_rate раз в секунду (и нажатия, и автоповтор).
+Для событий без признака автоповтора (autorepeat=None) действует прежнее окно legacy_window.
+"""
+from __future__ import annotations
+
+import time
+import collections
+from typing import Callable, Hashable, Optional
+
+REPEAT_ONCE = 'once'
+REPEAT_ALWAYS = 'repeat'
+REPEAT_THROTTLE = 'throttle'
+REPEAT_POLICIES = (REPEAT_ONCE, REPEAT_ALWAYS, REPEAT_THROTTLE)
+
+
+def normalize_policy(policy) -> str:
+    return policy if policy in REPEAT_POLICIES else REPEAT_ONCE
+
+
+class RepeatGate:
+    def __init__(self, legacy_window: float = 0.4, max_entries: int = 256,
+                 clock: Callable[[], float] = time.monotonic):
+        self.legacy_window = legacy_window
+        self.max_entries = max(1, int(max_entries))
+        self._clock = clock
+        self._last: 'collections.OrderedDict[Hashable, float]' = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._last)
+
+    def allow(self, key: Hashable, autorepeat: Optional[bool] = None, policy: str = REPEAT_ONCE,
+              rate: float = 0.0, now: Optional[float] = None) -> bool:
+        """True — действие можно выполнить; при этом срабатывание запоминается."""
+        if now is None:
+            now = self._clock()
+        last = self._last.get(key)
+        if policy == REPEAT_THROTTLE and rate > 0:
+            if last is not None and now - last < 1.0 / rate:
+                return False
+        elif autorepeat is None:
+            if last is not None and now - last < self.legacy_window:
+                return False
+        elif autorepeat and policy != REPEAT_ALWAYS:
+            return False
+        last_map = self._last
+        last_map[key] = now
+        last_map.move_to_end(key)
+        if len(last_map) > self.max_entries:
+            last_map.popitem(last=False)
+        return True
+
+    def clear(self):
+        self._last.clear()
+
+
+__all__ = ['RepeatGate', 'REPEAT_ONCE', 'REPEAT_ALWAYS', 'REPEAT_THROTTLE', 'REPEAT_POLICIES', 'normalize_policy']
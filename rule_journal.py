@@ -0,0 +1,269 @@
+"""Журнал изменений правил (append-only) с фоновым сворачиванием в hotkeys.json.
+
+Без журнала каждый клик в окне настроек переписывает весь hotkeys.json
+(O(N) байт на изменение). В режиме журнала (settings.json:
+"hotkeys_storage": "journal") save_hotkeys дописывает в hotkeys.json.journal
+только изменённые правила — записи upsert / delete / enable — и делает fsync.
+Фоновый поток сворачивает журнал в JSON после паузы в правках (или сразу,
+если записей накопилось много).
+
+Формат файла: MAGIC, затем кадры <длина, crc32> + JSON. Первый кадр — заголовок
+с SHA-256 содержимого hotkeys.json, к которому относится журнал.
+
+Восстановление после падения:
+  - недописанный или повреждённый хвост (не сходится длина или crc) отбрасывается;
+  - если JSON уже заменён сворачиванием, а журнал ещё не сброшен, хэш в заголовке
+    не совпадёт с JSON — журнал целиком устарел и игнорируется (всё уже в JSON);
+  - по той же причине игнорируется журнал, если hotkeys.json отредактировали вручную.
+При загрузке непустой журнал применяется к JSON и сразу сворачивается.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import zlib
+import struct
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("hotkeymaster.rule_journal")
+
+MAGIC = b'HKJ1'
+JOURNAL_SUFFIX = '.journal'
+_FRAME = struct.Struct('<II')  # длина полезной нагрузки, crc32
+
+OP_UPSERT = 'upsert'
+OP_DELETE = 'delete'
+OP_ENABLE = 'enable'
+
+COMPACT_DELAY = 2.0         # пауза в правках перед сворачиванием, с
+COMPACT_MAX_RECORDS = 256   # столько записей — сворачиваем, не дожидаясь паузы
+
+
+def journal_path_for(json_path: str) -> str:
+    return json_path + JOURNAL_SUFFIX
+
+
+def fsync_file(f):
+    """fsync с F_FULLFSYNC на macOS (обычный fsync не сбрасывает кэш диска)."""
+    f.flush()
+    if sys.platform == 'darwin':
+        try:
+            import fcntl
+            fcntl.fcntl(f.fileno(), fcntl.F_FULLFSYNC)
+            return
+        except (ImportError, AttributeError, OSError):
+            pass
+    os.fsync(f.fileno())
+
+
+def fsync_dir(path: str):
+    """Сделать переименование в каталоге долговечным (там, где это поддерживается)."""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _frame(payload: Dict[str, Any]) -> bytes:
+    blob = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return _FRAME.pack(len(blob), zlib.crc32(blob)) + blob
+
+
+def _read_frames(data: bytes) -> List[Dict[str, Any]]:
+    """Целые кадры до первого повреждённого (недописанный хвост после падения)."""
+    frames = []
+    pos = len(MAGIC)
+    while pos + _FRAME.size <= len(data):
+        length, crc = _FRAME.unpack_from(data, pos)
+        start = pos + _FRAME.size
+        blob = data[start:start + length]
+        if len(blob) != length or zlib.crc32(blob) != crc:
+            break
+        try:
+            frames.append(json.loads(blob.decode('utf-8')))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            break
+        pos = start + length
+    return frames
+
+
+def read_journal(json_path: str, base: bytes) -> List[Dict[str, Any]]:
+    """Записи журнала, относящиеся к содержимому JSON base ([] — журнала нет или он устарел)."""
+    try:
+        with open(journal_path_for(json_path), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return []
+    if not data.startswith(MAGIC):
+        return []
+    frames = _read_frames(data)
+    if not frames or frames[0].get('base') != _digest(base):
+        return []
+    return frames[1:]
+
+
+def discard(json_path: str):
+    try:
+        os.unlink(journal_path_for(json_path))
+    except OSError:
+        pass
+
+
+def diff_hotkeys(old: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    """Записи журнала, превращающие old в new (правила сопоставляются по id).
+    None — изменился порядок правил; такое изменение записывается целиком в JSON."""
+    old_by_id = {hk.get('id'): hk for hk in old}
+    new_ids = {hk.get('id') for hk in new}
+    kept = [hk.get('id') for hk in old if hk.get('id') in new_ids]
+    # Новые правила дописываются в конец, удалённые выпадают — остальное должно сохранить порядок
+    if [hk.get('id') for hk in new[:len(kept)]] != kept:
+        return None
+    records: List[Dict[str, Any]] = [{'op': OP_DELETE, 'id': hk.get('id')} for hk in old
+                                     if hk.get('id') not in new_ids]
+    for hk in new:
+        prev = old_by_id.get(hk.get('id'))
+        if prev == hk:
+            continue
+        if prev is not None and {**prev, 'enabled': hk.get('enabled', True)} == hk:
+            records.append({'op': OP_ENABLE, 'id': hk.get('id'), 'enabled': hk.get('enabled', True)})
+        else:
+            records.append({'op': OP_UPSERT, 'rule': hk})
+    return records
+
+
+def apply_records(hotkeys: List[Dict[str, Any]], records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Применить записи журнала к списку правил (записи идемпотентны)."""
+    res = list(hotkeys)
+    pos = {hk.get('id'): i for i, hk in enumerate(res)}
+    for rec in records:
+        op = rec.get('op')
+        if op == OP_UPSERT and isinstance(rec.get('rule'), dict):
+            rule = rec['rule']
+            i = pos.get(rule.get('id'))
+            if i is None:
+                pos[rule.get('id')] = len(res)
+                res.append(rule)
+            else:
+                res[i] = rule
+        elif op == OP_ENABLE and rec.get('id') in pos:
+            i = pos[rec['id']]
+            res[i] = {**res[i], 'enabled': bool(rec.get('enabled', True))}
+        elif op == OP_DELETE and rec.get('id') in pos:
+            del res[pos[rec['id']]]
+            pos = {hk.get('id'): i for i, hk in enumerate(res)}
+    return res
+
+
+class RuleJournal:
+    """Дозапись изменений и фоновое сворачивание.
+
+    compact — функция владельца, которая записывает текущее состояние в JSON
+    и вызывает reset() с записанными байтами (владелец держит свою блокировку).
+    """
+
+    def __init__(self, json_path: str, compact: Callable[[], None], delay: float = COMPACT_DELAY,
+                 max_records: int = COMPACT_MAX_RECORDS):
+        self.json_path = json_path
+        self.path = journal_path_for(json_path)
+        self.delay = delay
+        self.max_records = max(1, int(max_records))
+        self._compact = compact
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._pending = 0
+        self._last_append = 0.0
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.appended = 0
+        self.compactions = 0
+
+    @property
+    def pending(self) -> int:
+        """Записей с момента последнего сворачивания."""
+        return self._pending
+
+    def reset(self, base: bytes):
+        """Начать пустой журнал для содержимого JSON base (атомарная замена файла)."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC + _frame({'base': _digest(base)}))
+            fsync_file(f)
+        os.replace(tmp_path, self.path)
+        fsync_dir(self.path)
+        with self._lock:
+            self._pending = 0
+
+    def append(self, records: List[Dict[str, Any]]):
+        """Дописать записи и дождаться fsync. Вызывать после reset()."""
+        if not records:
+            return
+        blob = b''.join(_frame(r) for r in records)
+        with open(self.path, 'ab') as f:
+            f.write(blob)
+            fsync_file(f)
+        with self._lock:
+            self._pending += len(records)
+            self.appended += len(records)
+            self._last_append = time.monotonic()
+            self._wake.notify()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='RuleJournalCompactor', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._wake.notify()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._stopping:
+                    if self._pending >= self.max_records:
+                        break
+                    if self._pending:
+                        left = self._last_append + self.delay - time.monotonic()
+                        if left <= 0:
+                            break
+                        self._wake.wait(left)
+                    else:
+                        self._wake.wait()
+                if self._stopping:
+                    return
+            try:
+                self._compact()
+                self.compactions += 1
+            except Exception as e:
+                logger.error(f"Ошибка сворачивания журнала правил: {e}")
+            with self._lock:
+                if self._pending:
+                    self._last_append = time.monotonic()  # не свернулось — повтор после следующей паузы
+
+
+__all__ = [
+    'RuleJournal', 'read_journal', 'discard', 'diff_hotkeys', 'apply_records', 'journal_path_for',
+    'fsync_file', 'fsync_dir', 'OP_UPSERT', 'OP_DELETE', 'OP_ENABLE', 'COMPACT_DELAY', 'COMPACT_MAX_RECORDS',
+]
@@ -0,0 +1,299 @@
+"""Неизменяемая модель правил и снимков конфигурации.
+
+Rule — типизированное, frozen/slots представление одной записи hotkeys.json.
+RuleSnapshot — версия всей конфигурации вместе с заранее построенными
+структурами поиска. Снимок никогда не меняется после создания: писатель
+строит новый и публикует его заменой одной ссылки, а читатели (колбэк
+клавиатуры, движок трекпада, UI) берут текущий снимок одним чтением
+атрибута — без блокировок и копирования.
+
+RuleTable — правила, действующие в конкретном приложении: его app-правила
+поверх глобальных. Движок переключает текущую таблицу при активации
+приложения, поэтому на событие область действия не проверяется.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from modifiers import parse_mods
+from frontmost_app import AppInfo, app_matches
+from hotkey_dispatch import DispatchIndex
+from repeat_gate import REPEAT_ONCE, normalize_policy
+from hotkey_sequences import SequenceTrie, DEFAULT_SEQUENCE_TIMEOUT, parse_sequence
+
+
+def _float(value, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass(frozen=True, slots=True)
+class Rule:
+    id: str
+    type: str = 'keyboard'
+    action: str = ''
+    scope: str = 'global'
+    app: str = ''
+    # Bundle ID приложения (новые правила); пусто — сопоставление по имени app
+    bundle_id: str = ''
+    enabled: bool = True
+    vk: Optional[int] = None
+    # Маска modifiers; None — в правиле есть неизвестные имена, оно не сработает
+    mods: Optional[int] = 0
+    disp: str = ''
+    gesture: str = ''
+    # Политика автоповтора (repeat_gate): 'once' | 'repeat' | 'throttle' (не чаще repeat_rate/с)
+    repeat: str = 'once'
+    repeat_rate: float = 0.0
+    # Многоударная последовательность ((vk, маска), ...) вместо combo; пауза между ударами
+    sequence: Tuple[Tuple[int, int], ...] = ()
+    sequence_timeout: float = DEFAULT_SEQUENCE_TIMEOUT
+    # Исходная запись (только для чтения) — чтобы to_dict() сохранял неизвестные поля
+    raw: Dict[str, Any] = field(default_factory=dict, compare=False, hash=False, repr=False)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> 'Rule':
+        combo = d.get('combo') or {}
+        if not isinstance(combo, dict):
+            combo = {}
+        vk, mods = combo.get('vk'), parse_mods(combo.get('mods', []))
+        sequence = ()
+        if d.get('sequence'):
+            # Некорректная последовательность (неизвестные имена, нет vk) не сработает
+            sequence = parse_sequence(d['sequence']) or ()
+            if len(sequence) == 1 and vk is None:
+                (vk, mods), sequence = sequence[0], ()
+        return cls(
+            id=str(d.get('id', '')),
+            type=d.get('type', 'keyboard') or 'keyboard',
+            action=d.get('action', '') or '',
+            scope=d.get('scope', 'global') or 'global',
+            app=d.get('app', '') or '',
+            bundle_id=d.get('bundle_id', '') or '',
+            enabled=bool(d.get('enabled', True)),
+            vk=vk,
+            mods=mods,
+            disp=combo.get('disp', '') or '',
+            gesture=d.get('gesture', '') or '',
+            repeat=normalize_policy(d.get('repeat', REPEAT_ONCE)),
+            repeat_rate=_float(d.get('repeat_rate', 0.0)),
+            sequence=sequence,
+            sequence_timeout=_float(d.get('sequence_timeout', DEFAULT_SEQUENCE_TIMEOUT), DEFAULT_SEQUENCE_TIMEOUT),
+            raw=dict(d),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Изменяемая копия в формате hotkeys.json."""
+        d = dict(self.raw)
+        combo = d.get('combo')
+        if isinstance(combo, dict):
+            combo = dict(combo)
+            if isinstance(combo.get('mods'), list):
+                combo['mods'] = list(combo['mods'])
+            d['combo'] = combo
+        return d
+
+    @property
+    def is_app_scoped(self) -> bool:
+        return self.scope == 'app' and bool(self.app or self.bundle_id)
+
+    def matches_app(self, info) -> bool:
+        """Подходит ли правило для активного приложения (AppInfo или имя)."""
+        if not self.is_app_scoped:
+            return True
+        return app_matches(self.app, info, self.bundle_id)
+
+
+def _index_gestures(rules: Iterable[Rule]) -> Dict[str, Tuple[Rule, ...]]:
+    res: Dict[str, List[Rule]] = {}
+    for r in rules:
+        if r.type == 'trackpad' and r.enabled and r.gesture:
+            res.setdefault(r.gesture, []).append(r)
+    return {k: tuple(v) for k, v in res.items()}
+
+
+@dataclass(frozen=True, slots=True)
+class RuleTable:
+    """Эффективные правила для одного приложения: всё, что нужно на событие, — один поиск.
+
+    Приоритет: правила приложения перекрывают глобальные. Для клавиатуры
+    они стоят в индексе раньше глобальных (срабатывает первое подходящее),
+    для жестов — заменяют глобальные правила того же жеста целиком.
+    """
+    keyboard: DispatchIndex
+    gestures: Dict[str, Tuple[Rule, ...]]
+    app_rules: Tuple[Rule, ...] = ()
+    sequences: SequenceTrie = field(default_factory=SequenceTrie, compare=False, repr=False)
+
+    @classmethod
+    def build(cls, global_rules: Tuple[Rule, ...], app_rules: Tuple[Rule, ...] = ()) -> 'RuleTable':
+        gestures = _index_gestures(global_rules)
+        gestures.update(_index_gestures(app_rules))
+        ordered = app_rules + global_rules
+        return cls(DispatchIndex(ordered), gestures, app_rules, SequenceTrie(ordered))
+
+    def patched(self, removed: Iterable[Rule], added: Iterable[Rule], rank: Callable[[Rule], Any],
+                app_rules: Optional[Tuple[Rule, ...]] = None,
+                global_gestures: Optional[Dict[str, Tuple[Rule, ...]]] = None) -> 'RuleTable':
+        """Таблица без правил removed (по id) и с правилами added; меняются только их
+        корзины. rank — порядок приоритета в новой таблице. Для таблицы приложения
+        передаются её app_rules и жесты глобальной таблицы (app-жест заменяет глобальный)."""
+        removed, added = tuple(removed), tuple(added)
+        gestures = self.gestures
+        names = {r.gesture for r in removed + added if r.type == 'trackpad' and r.gesture}
+        if names:
+            gestures = dict(gestures)
+            gone = {r.id for r in removed}
+            for name in names:
+                if global_gestures is None:
+                    hit = tuple(sorted([r for r in gestures.get(name, ()) if r.id not in gone]
+                                       + [r for r in added if r.type == 'trackpad' and r.enabled and r.gesture == name],
+                                       key=rank))
+                else:
+                    hit = _index_gestures(app_rules or ()).get(name) or global_gestures.get(name, ())
+                if hit:
+                    gestures[name] = hit
+                else:
+                    gestures.pop(name, None)
+        return RuleTable(self.keyboard.patched(removed, added, rank), gestures,
+                         self.app_rules if app_rules is None else app_rules,
+                         self.sequences.patched(removed, added, rank))
+
+
+# Ограничение кэша таблиц по приложениям (ключ — bundle ID и имя)
+MAX_APP_TABLES = 256
+
+
+@dataclass(frozen=True, slots=True)
+class RuleSnapshot:
+    """Версия конфигурации. Словари внутри считаются только для чтения
+    (кроме кэшей таблиц приложений, которые только дополняются)."""
+    generation: int
+    rules: Tuple[Rule, ...]
+    by_id: Dict[str, Rule] = field(compare=False, repr=False)
+    # id -> индекс в rules (порядок приоритета)
+    positions: Dict[str, int] = field(compare=False, repr=False)
+    global_table: RuleTable = field(compare=False, repr=False)
+    app_rules: Tuple[Rule, ...] = field(default=(), compare=False, repr=False)
+    # набор id подходящих app-правил -> таблица; разные приложения с одним набором делят таблицу
+    _tables_by_rules: Dict[Tuple[str, ...], RuleTable] = field(default_factory=dict, compare=False, repr=False)
+    # (bundle_id, имя) активного приложения -> таблица
+    _tables_by_app: Dict[Tuple[str, str], RuleTable] = field(default_factory=dict, compare=False, repr=False)
+
+    @classmethod
+    def build(cls, generation: int, items: Iterable[Any]) -> 'RuleSnapshot':
+        """Строит снимок из записей hotkeys.json (dict) или готовых Rule."""
+        rules = tuple(it if isinstance(it, Rule) else Rule.from_dict(it) for it in items)
+        app_rules = tuple(r for r in rules if r.is_app_scoped and r.enabled)
+        global_rules = tuple(r for r in rules if not r.is_app_scoped)
+        snap = cls(
+            generation=generation,
+            rules=rules,
+            by_id={r.id: r for r in rules},
+            positions={r.id: i for i, r in enumerate(rules)},
+            global_table=RuleTable.build(global_rules),
+            app_rules=app_rules,
+        )
+        # Таблицы для приложений, явно указанных в правилах, компилируются сразу
+        for r in app_rules:
+            snap.table_for(AppInfo(r.app, r.bundle_id))
+        return snap
+
+    @property
+    def keyboard(self) -> DispatchIndex:
+        """Индекс глобальных клавиатурных правил."""
+        return self.global_table.keyboard
+
+    @property
+    def gestures(self) -> Dict[str, Tuple[Rule, ...]]:
+        """Глобальные жесты трекпада."""
+        return self.global_table.gestures
+
+    def table_for(self, app: Union[AppInfo, str, None]) -> RuleTable:
+        """Эффективная таблица для активного приложения (AppInfo или имя).
+        Вызывается при смене приложения, а не на каждое событие."""
+        if app is None or not self.app_rules:
+            return self.global_table
+        if isinstance(app, str):
+            app = AppInfo(app)
+        key = (app.bundle_id, app.name)
+        table = self._tables_by_app.get(key)
+        if table is not None:
+            return table
+        matched = tuple(r for r in self.app_rules if r.matches_app(app))
+        if not matched:
+            table = self.global_table
+        else:
+            ids = tuple(r.id for r in matched)
+            table = self._tables_by_rules.get(ids)
+            if table is None:
+                table = self._tables_by_rules[ids] = self.table_with(matched)
+        if len(self._tables_by_app) >= MAX_APP_TABLES:
+            self._tables_by_app.clear()
+        self._tables_by_app[key] = table
+        return table
+
+    def table_with(self, app_rules: Tuple[Rule, ...]) -> RuleTable:
+        """Таблица: app_rules (в этом порядке) поверх глобальных правил снимка. Глобальный
+        индекс не пересобирается — в копию добавляются только корзины app_rules."""
+        if not app_rules:
+            return self.global_table
+        order = {r.id: i for i, r in enumerate(app_rules)}
+        positions = self.positions
+
+        def rank(r: Rule):
+            i = order.get(r.id)
+            return (0, i) if i is not None else (1, positions.get(r.id, 0))
+        return self.global_table.patched((), app_rules, rank, app_rules, self.global_table.gestures)
+
+    def patched(self, generation: int, upserts: Iterable[Rule] = (), deletes: Iterable[str] = ()) -> 'RuleSnapshot':
+        """Следующая версия: правила upserts заменяют одноимённые на их месте (новые id —
+        в конец), правила deletes удаляются. Глобальная таблица правится по корзинам
+        затронутых правил, а не строится заново; таблицы приложений собираются лениво."""
+        upserts = list({r.id: r for r in upserts}.values())
+        gone = {i for i in deletes if i in self.by_id}
+        removed = [self.by_id[i] for i in gone]
+        by_id = dict(self.by_id)
+        if gone:
+            rules = [r for r in self.rules if r.id not in gone]
+            positions = {r.id: i for i, r in enumerate(rules)}
+            for i in gone:
+                del by_id[i]
+        else:
+            rules, positions = list(self.rules), self.positions
+        added: List[Rule] = []
+        for rule in upserts:
+            old = by_id.get(rule.id)
+            if old is not None:
+                rules[positions[rule.id]] = rule
+                removed.append(old)
+            else:
+                if positions is self.positions:
+                    positions = dict(positions)
+                positions[rule.id] = len(rules)
+                rules.append(rule)
+            by_id[rule.id] = rule
+            added.append(rule)
+        app_rules = self.app_rules
+        if any(r.is_app_scoped for r in removed + added):
+            touched = {r.id for r in removed} | {r.id for r in added}
+            app_rules = tuple(sorted([r for r in app_rules if r.id not in touched]
+                                     + [r for r in added if r.is_app_scoped and r.enabled],
+                                     key=lambda r: positions[r.id]))
+        global_removed = [r for r in removed if not r.is_app_scoped]
+        global_added = [r for r in added if not r.is_app_scoped]
+        global_table = self.global_table
+        if global_removed or global_added:
+            global_table = global_table.patched(global_removed, global_added, lambda r: positions[r.id])
+        return RuleSnapshot(generation, tuple(rules), by_id, positions, global_table, app_rules)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [r.to_dict() for r in self.rules]
+
+
+EMPTY_SNAPSHOT = RuleSnapshot.build(0, ())
+
+__all__ = ['Rule', 'RuleTable', 'RuleSnapshot', 'EMPTY_SNAPSHOT']
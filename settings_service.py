@@ -0,0 +1,282 @@
+"""Единый сервис settings.json: кэш чтения, подписки на изменения и отложенная запись.
+
+Раньше settings.json по отдельности разбирали движок клавиатуры, движок
+трекпада, main и окно настроек, а писали окно настроек целиком и обработчик
+resizeEvent — на каждое событие изменения размера; писатели затирали ключи
+друг друга. Теперь все работают через один SettingsService на файл:
+  - чтение идёт из кэша в памяти (типизированные get_bool/get_float/...);
+    файл перечитывается, только если изменилась его сигнатура (reload —
+    из наблюдателя за конфигом или лениво из движка);
+  - подписчики (subscribe) получают изменившиеся значения — и после set/update
+    в этом процессе, и после правки файла извне;
+  - запись отложенная: set/update сразу меняют кэш, а в файл правки уходят одной
+    записью через WRITE_DELAY после последней из них — перетаскивание края окна
+    даёт одну запись вместо сотен. Перед записью файл перечитывается, поэтому
+    ключи, изменённые извне, не затираются. При выходе несохранённое сбрасывается.
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from config_watcher import file_signature
+
+logger = logging.getLogger("hotkeymaster.settings")
+
+APP_SUPPORT_DIR = os.path.join(os.path.expanduser('~'), 'Library', 'Application Support', 'HotkeyMaster')
+SETTINGS_PATH = os.path.join(APP_SUPPORT_DIR, 'settings.json')
+WRITE_DELAY = 0.5  # пауза в правках перед записью файла, с
+
+# Значения по умолчанию для ключей без собственного default у читателя
+DEFAULTS: Dict[str, Any] = {
+    'autostart': False,
+    'strict_mod_match': False,
+    'hotkeys_storage': 'json',
+}
+
+Callback = Callable[[Dict[str, Any]], None]
+_UNSET = object()
+
+
+class SettingsService:
+    """Кэш одного settings.json. Потокобезопасен; подписчики вызываются вне блокировки."""
+
+    def __init__(self, path: str, write_delay: float = WRITE_DELAY):
+        self.path = path
+        self.write_delay = write_delay
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._data: Dict[str, Any] = {}
+        self._signature: Any = _UNSET
+        self._dirty: set = set()
+        self._last_change = 0.0
+        self._subscribers: List[Tuple[Optional[FrozenSet[str]], Callback]] = []
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.writes = 0
+
+    # ---------- чтение ----------
+    def _read_file(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _reload_locked(self, force: bool) -> Dict[str, Any]:
+        sig = file_signature(self.path)
+        if not force and sig == self._signature:
+            return {}
+        try:
+            data = self._read_file()
+        except (OSError, ValueError) as e:
+            # Недописанный файл (правка извне) — кэш остаётся, повтор при следующей сверке
+            logger.warning(f"Не удалось прочитать {self.path}: {e}")
+            return {}
+        self._signature = sig
+        for key in self._dirty:  # несохранённые правки новее файла
+            data[key] = self._data[key]
+        changes = {k: data.get(k) for k in set(self._data) | set(data)
+                   if self._data.get(k, _UNSET) != data.get(k, _UNSET)}
+        self._data = data
+        return changes
+
+    def reload(self, force: bool = False) -> Dict[str, Any]:
+        """Перечитать файл, если изменилась его сигнатура (force — в любом случае).
+        Возвращает изменившиеся ключи и рассылает их подписчикам."""
+        with self._lock:
+            changes = self._reload_locked(force)
+        self._notify(changes)
+        return changes
+
+    def _ensure_loaded(self):
+        if self._signature is _UNSET:
+            self.reload()
+
+    def get(self, key: str, default: Any = _UNSET) -> Any:
+        self._ensure_loaded()
+        value = self._data.get(key, _UNSET)
+        if value is _UNSET:
+            return DEFAULTS.get(key) if default is _UNSET else default
+        return value
+
+    def get_bool(self, key: str, default: bool = False) -> bool:
+        return bool(self.get(key, default))
+
+    def get_float(self, key: str, default: float, min_value: Optional[float] = None,
+                  max_value: Optional[float] = None) -> float:
+        """Число в допустимых границах; иначе (нет ключа, не число, вне границ) — default."""
+        value = self.get(key, None)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return default
+        if (min_value is not None and value < min_value) or (max_value is not None and value > max_value):
+            return default
+        return float(value)
+
+    def get_str(self, key: str, default: Optional[str] = None, choices: Optional[Sequence[str]] = None) -> str:
+        """Строка (из choices, если заданы); иначе default, а без него — DEFAULTS."""
+        value = self.get(key, None)
+        if not isinstance(value, str) or (choices is not None and value not in choices):
+            return default if default is not None else DEFAULTS.get(key, '')
+        return value
+
+    def get_size(self, key: str) -> Optional[Tuple[int, int]]:
+        """Пара (ширина, высота), например window_size; None — нет или некорректно."""
+        value = self.get(key, None)
+        if isinstance(value, (list, tuple)) and len(value) == 2 and all(
+                isinstance(v, int) and not isinstance(v, bool) and v > 0 for v in value):
+            return int(value[0]), int(value[1])
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Копия всех настроек (с DEFAULTS для отсутствующих ключей)."""
+        self._ensure_loaded()
+        with self._lock:
+            return {**DEFAULTS, **self._data}
+
+    # ---------- запись ----------
+    def set(self, key: str, value: Any) -> bool:
+        return bool(self.update({key: value}))
+
+    def update(self, values: Optional[Dict[str, Any]] = None, **fields) -> Dict[str, Any]:
+        """Изменить значения: кэш и подписчики — сразу, файл — отложенной записью.
+        Возвращает действительно изменившиеся ключи."""
+        values = {**(values or {}), **fields}
+        self._ensure_loaded()
+        with self._lock:
+            changes = {k: v for k, v in values.items() if self._data.get(k, _UNSET) != v}
+            if not changes:
+                return {}
+            self._data.update(changes)
+            self._dirty.update(changes)
+            self._last_change = time.monotonic()
+            self._start_writer_locked()
+            self._wake.notify()
+        self._notify(changes)
+        return changes
+
+    @property
+    def pending(self) -> bool:
+        """Есть правки, ещё не записанные в файл."""
+        return bool(self._dirty)
+
+    def _write_locked(self) -> Dict[str, Any]:
+        # Ключи, изменённые в файле извне, подхватываются (и рассылаются), а не затираются
+        changes = self._reload_locked(False)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+        self._signature = file_signature(self.path)
+        self._dirty.clear()
+        self.writes += 1
+        return changes
+
+    def flush(self) -> bool:
+        """Записать несохранённые правки сейчас. False — записывать нечего."""
+        with self._lock:
+            if not self._dirty:
+                return False
+            changes = self._write_locked()
+        self._notify(changes)
+        return True
+
+    def _start_writer_locked(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='SettingsWriter', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._stopping:
+                    if self._dirty:
+                        left = self._last_change + self.write_delay - time.monotonic()
+                        if left <= 0:
+                            break
+                        self._wake.wait(left)
+                    else:
+                        self._wake.wait()
+                if self._stopping:
+                    return
+                changes: Dict[str, Any] = {}
+                try:
+                    changes = self._write_locked()
+                except Exception as e:
+                    logger.error(f"Ошибка записи {self.path}: {e}")
+                    self._last_change = time.monotonic()  # повтор после следующей паузы
+            self._notify(changes)
+
+    def close(self):
+        """Остановить поток записи и сбросить несохранённые правки."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._wake.notify()
+        if thread is not None:
+            thread.join(2.0)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Ошибка записи {self.path}: {e}")
+
+    # ---------- подписки ----------
+    def subscribe(self, callback: Callback, keys: Optional[Iterable[str]] = None) -> Callable[[], None]:
+        """callback(изменения) при изменении любого из keys (None — любых ключей).
+        Возвращает функцию отписки."""
+        entry = (frozenset(keys) if keys is not None else None, callback)
+        with self._lock:
+            self._subscribers.append(entry)
+
+        def unsubscribe():
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+        return unsubscribe
+
+    def _notify(self, changes: Dict[str, Any]):
+        if not changes:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for keys, callback in subscribers:
+            if keys is not None and keys.isdisjoint(changes):
+                continue
+            try:
+                callback(changes if keys is None else {k: v for k, v in changes.items() if k in keys})
+            except Exception as e:
+                logger.error(f"Ошибка подписчика настроек: {e}")
+
+
+_services: Dict[str, SettingsService] = {}
+_services_lock = threading.Lock()
+
+
+def get_settings(path: Optional[str] = None) -> SettingsService:
+    """Общий сервис для файла настроек (по умолчанию — SETTINGS_PATH)."""
+    path = os.path.abspath(path or SETTINGS_PATH)
+    with _services_lock:
+        service = _services.get(path)
+        if service is None:
+            service = _services[path] = SettingsService(path)
+        return service
+
+
+def flush_all():
+    with _services_lock:
+        services = list(_services.values())
+    for service in services:
+        service.close()
+
+
+atexit.register(flush_all)
+
+__all__ = ['SettingsService', 'get_settings', 'flush_all', 'SETTINGS_PATH', 'DEFAULTS', 'WRITE_DELAY']
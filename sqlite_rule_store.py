@@ -0,0 +1,235 @@
+"""Хранилище правил в SQLite — для больших (командных) наборов правил.
+
+Включается в settings.json: "hotkeys_storage": "sqlite". База лежит рядом
+с hotkeys.json (hotkeys.sqlite) и становится источником истины: изменение
+одного правила — одна строка (UPDATE/INSERT/DELETE в одной транзакции),
+а не перезапись всего JSON. Запись целиком хранится в колонке data (JSON),
+для выборок есть индексированные колонки: тип, vk, маска модификаторов,
+жест, приложение; pos задаёт порядок (приоритет).
+
+Колбэк клавиатуры по-прежнему работает со снимком в памяти (RuleSnapshot):
+поиск в dict на событие дешевле любого запроса к базе. К базе обращаются UI
+и утилиты — выборки по id, типу, клавише, жесту и приложению.
+
+Импорт/экспорт в формат hotkeys.json:
+    python sqlite_rule_store.py import hotkeys.json hotkeys.sqlite
+    python sqlite_rule_store.py export hotkeys.sqlite hotkeys.json
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import uuid
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from rules import Rule
+from rule_journal import OP_UPSERT, OP_DELETE, OP_ENABLE
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rules (
+    id      TEXT PRIMARY KEY,
+    pos     INTEGER NOT NULL,
+    type    TEXT NOT NULL,
+    vk      INTEGER,
+    mods    INTEGER,
+    gesture TEXT NOT NULL DEFAULT '',
+    app     TEXT NOT NULL DEFAULT '',
+    enabled INTEGER NOT NULL DEFAULT 1,
+    data    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rules_pos ON rules(pos);
+CREATE INDEX IF NOT EXISTS rules_key ON rules(type, vk, mods);
+CREATE INDEX IF NOT EXISTS rules_gesture ON rules(gesture) WHERE gesture != '';
+CREATE INDEX IF NOT EXISTS rules_app ON rules(app) WHERE app != '';
+"""
+
+
+def sqlite_path_for(json_path: str) -> str:
+    return os.path.splitext(json_path)[0] + '.sqlite'
+
+
+def _row(hk: Dict[str, Any], pos: int) -> Tuple:
+    """Значения индексируемых колонок — из той же разборки, что и в снимке (Rule.from_dict)."""
+    rule = Rule.from_dict(hk)
+    vk = rule.vk if rule.vk is not None else (rule.sequence[0][0] if rule.sequence else None)
+    app = rule.app if rule.scope == 'app' else ''
+    return (rule.id, pos, rule.type, vk, rule.mods, rule.gesture or '', app or '', int(rule.enabled),
+            json.dumps(hk, ensure_ascii=False))
+
+
+class SqliteRuleStore:
+    """Одно соединение на процесс; операции сериализуются своей блокировкой."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            version = self._db.execute('PRAGMA user_version').fetchone()[0]
+            if version > SCHEMA_VERSION:
+                self._db.close()
+                raise ValueError(f'база {path} создана более новой версией (схема {version})')
+            self._db.executescript(_SCHEMA)
+            self._db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _select(self, where: str = '', args: Tuple = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(f'SELECT data FROM rules {where} ORDER BY pos', args).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    # ---------- чтение ----------
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM rules').fetchone()[0]
+
+    def load_all(self) -> List[Dict[str, Any]]:
+        return self._select()
+
+    def get(self, hk_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute('SELECT data FROM rules WHERE id = ?', (hk_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list(self, type_: Optional[str] = None) -> List[Dict[str, Any]]:
+        if type_ is None:
+            return self._select()
+        return self._select('WHERE type = ?', (type_,))
+
+    def find_keyboard(self, vk: int, mods: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Клавиатурные правила клавиши vk (и точной маски mods, если задана)."""
+        if mods is None:
+            return self._select("WHERE type = 'keyboard' AND vk = ?", (vk,))
+        return self._select("WHERE type = 'keyboard' AND vk = ? AND mods = ?", (vk, mods))
+
+    def find_gesture(self, gesture: str) -> List[Dict[str, Any]]:
+        return self._select("WHERE gesture = ? AND gesture != ''", (gesture,))
+
+    def for_app(self, app: str) -> List[Dict[str, Any]]:
+        return self._select("WHERE app = ? AND app != ''", (app,))
+
+    # ---------- запись ----------
+    def _upsert_locked(self, hk: Dict[str, Any]):
+        cur = self._db.execute('SELECT pos FROM rules WHERE id = ?', (hk['id'],)).fetchone()
+        if cur is None:
+            pos = self._db.execute('SELECT COALESCE(MAX(pos) + 1, 0) FROM rules').fetchone()[0]
+        else:
+            pos = cur[0]
+        self._db.execute('INSERT OR REPLACE INTO rules VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', _row(hk, pos))
+
+    def _set_enabled_locked(self, hk_id: str, enabled: bool):
+        row = self._db.execute('SELECT data FROM rules WHERE id = ?', (hk_id,)).fetchone()
+        if row is None:
+            return
+        data = {**json.loads(row[0]), 'enabled': bool(enabled)}
+        self._db.execute('UPDATE rules SET enabled = ?, data = ? WHERE id = ?',
+                         (int(bool(enabled)), json.dumps(data, ensure_ascii=False), hk_id))
+
+    def _write(self, fn, *args):
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                fn(*args)
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    def upsert(self, hk: Dict[str, Any]):
+        """Добавить правило в конец или заменить существующее на его месте."""
+        self._write(self._upsert_locked, hk)
+
+    def delete(self, hk_id: str):
+        self._write(lambda: self._db.execute('DELETE FROM rules WHERE id = ?', (hk_id,)))
+
+    def set_enabled(self, hk_id: str, enabled: bool):
+        self._write(self._set_enabled_locked, hk_id, enabled)
+
+    def apply_records(self, records: Iterable[Dict[str, Any]]):
+        """Записи rule_journal (upsert/delete/enable) — одной транзакцией."""
+        def apply():
+            for rec in records:
+                op = rec.get('op')
+                if op == OP_UPSERT:
+                    self._upsert_locked(rec['rule'])
+                elif op == OP_DELETE:
+                    self._db.execute('DELETE FROM rules WHERE id = ?', (rec['id'],))
+                elif op == OP_ENABLE:
+                    self._set_enabled_locked(rec['id'], rec.get('enabled', True))
+        self._write(apply)
+
+    def replace_all(self, hotkeys: List[Dict[str, Any]]):
+        def replace():
+            self._db.execute('DELETE FROM rules')
+            self._db.executemany('INSERT INTO rules VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                 [_row(hk, pos) for pos, hk in enumerate(hotkeys)])
+        self._write(replace)
+
+    # ---------- импорт/экспорт ----------
+    def import_json(self, path: str) -> int:
+        """Заменить содержимое базы правилами из hotkeys.json. Правилам без id (или с
+        повторным id) назначается новый, как при загрузке в hotkey_engine; записи, не
+        являющиеся объектами, — ошибка (база не меняется)."""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            raise ValueError(f'{path}: ожидается список правил')
+        rejected = sum(1 for hk in data if not isinstance(hk, dict))
+        if rejected:
+            raise ValueError(f'{path}: {rejected} записей не являются объектами правил')
+        seen = set()
+        hotkeys = []
+        for hk in data:
+            if not isinstance(hk.get('id'), str) or not hk['id'] or hk['id'] in seen:
+                hk = {**hk, 'id': uuid.uuid4().hex}
+            seen.add(hk['id'])
+            hotkeys.append(hk)
+        self.replace_all(hotkeys)
+        return len(hotkeys)
+
+    def export_json(self, path: str) -> int:
+        hotkeys = self.load_all()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(hotkeys, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return len(hotkeys)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Импорт/экспорт правил HotkeyMaster между JSON и SQLite')
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('source')
+    parser.add_argument('target')
+    args = parser.parse_args(argv)
+    try:
+        if args.command == 'import':
+            store = SqliteRuleStore(args.target)
+            count = store.import_json(args.source)
+        else:
+            if not os.path.exists(args.source):
+                raise FileNotFoundError(args.source)
+            store = SqliteRuleStore(args.source)
+            count = store.export_json(args.target)
+        store.close()
+    except Exception as e:
+        print(f'Ошибка: {e}', file=sys.stderr)
+        return 2
+    print(f'{count} правил: {args.source} -> {args.target}')
+    return 0
+
+
+__all__ = ['SqliteRuleStore', 'sqlite_path_for', 'SCHEMA_VERSION', 'main']
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,18 @@
+import sys
+import json
+
+import pytest
+
+@pytest.fixture
+def reload_engine(tmp_path, monkeypatch):
+    """Свежий hotkey_engine поверх hotkeys.json во временном каталоге теста:
+    reload_engine(hotkeys=()) -> модуль. Путь задаётся через monkeypatch.setenv,
+    поэтому после теста переменная окружения восстанавливается."""
+    def reload(hotkeys=()):
+        path = tmp_path / 'hotkeys.json'
+        monkeypatch.setenv('HOTKEYMASTER_HOTKEYS_FILE', str(path))
+        path.write_text(json.dumps(list(hotkeys)), encoding='utf-8')
+        sys.modules.pop('hotkey_engine', None)
+        import hotkey_engine
+        return hotkey_engine
+    return reload
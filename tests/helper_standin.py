@@ -0,0 +1,53 @@
+"""Заменитель coredisplay_helper для тестов: тот же протокол, яркость хранится в памяти.
+
+HELPER_STANDIN_LOG=<файл>       — дописывать "<pid> <команда>" для каждой команды;
+HELPER_STANDIN_DIE_AFTER=<n>    — завершиться, не ответив на n-ю команду;
+HELPER_STANDIN_LEGACY=1         — вести себя как helper без режима сервера;
+HELPER_STANDIN_SLOW_START=<файл> — пока файла нет: создать его и ответить "ready" через 2 с.
+"""
+import os
+import sys
+import time
+
+def log(text):
+    path = os.environ.get('HELPER_STANDIN_LOG')
+    if path:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(f'{os.getpid()} {text}\n')
+
+def main(argv):
+    legacy = os.environ.get('HELPER_STANDIN_LEGACY') == '1'
+    if len(argv) == 2:
+        log(f'oneshot {float(argv[1]):.4f}')
+        return 0
+    if legacy or len(argv) > 2:
+        print('Usage: coredisplay_helper <value>', file=sys.stderr)
+        return 1
+    die_after = int(os.environ.get('HELPER_STANDIN_DIE_AFTER', '0'))
+    slow = os.environ.get('HELPER_STANDIN_SLOW_START')
+    if slow and not os.path.exists(slow):
+        open(slow, 'w').close()
+        time.sleep(2.0)
+    levels = {}
+    print('ready', flush=True)
+    for n, line in enumerate(sys.stdin, 1):
+        parts = line.split()
+        log(line.strip())
+        if die_after and n >= die_after:
+            os._exit(1)
+        if not parts:
+            reply = 'err empty'
+        elif parts[0] == 'set' and len(parts) >= 2:
+            levels[parts[2] if len(parts) > 2 else 'main'] = float(parts[1])
+            reply = 'ok'
+        elif parts[0] == 'get':
+            reply = f"ok {levels.get(parts[1] if len(parts) > 1 else 'main', 0.5):.4f}"
+        elif parts[0] == 'quit':
+            break
+        else:
+            reply = 'err unknown'
+        print(reply, flush=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,82 @@
+import time
+import threading
+
+from action_executor import ActionExecutor, action_kind
+
+def test_submit_returns_immediately_and_runs_in_worker():
+    release = threading.Event()
+    done = []
+    def run(action):
+        release.wait(2.0)
+        done.append((action, threading.current_thread().name))
+    ex = ActionExecutor(run, workers=1)
+    ex.start()
+    t0 = time.perf_counter()
+    assert ex.submit('run slow')
+    assert time.perf_counter() - t0 < 0.05
+    release.set()
+    assert ex.wait_idle(2.0)
+    ex.stop()
+    assert done == [('run slow', 'ActionWorker-0')]
+
+def test_overflow_policies():
+    for policy, expected in (('drop_new', ['run 1', 'run 2']), ('drop_oldest', ['run 2', 'run 3'])):
+        done = []
+        ex = ActionExecutor(done.append, workers=1, maxsize=2, overflow=policy)
+        assert ex.submit('run 1') and ex.submit('run 2')
+        assert ex.submit('run 3') is (policy == 'drop_oldest')
+        assert ex.dropped == 1
+        ex.start()
+        assert ex.wait_idle(2.0)
+        ex.stop()
+        assert done == expected
+
+def test_per_kind_limit_serializes_without_blocking_other_kinds():
+    gate = threading.Event()
+    active = []
+    peak = []
+    lock = threading.Lock()
+    order = []
+    def run(action):
+        kind = action_kind(action)
+        with lock:
+            active.append(kind)
+            peak.append(active.count('brightness'))
+        if action == 'brightness_up':
+            gate.wait(2.0)
+        with lock:
+            active.remove(kind)
+            order.append(action)
+    ex = ActionExecutor(run, workers=3, limits={'brightness': 1})
+    ex.start()
+    ex.submit('brightness_up')
+    ex.submit('brightness_down')
+    ex.submit('run echo')
+    # 'run' не ждёт освобождения слота яркости
+    deadline = time.time() + 2.0
+    while 'run echo' not in order and time.time() < deadline:
+        time.sleep(0.01)
+    assert 'run echo' in order
+    gate.set()
+    assert ex.wait_idle(2.0)
+    ex.stop()
+    assert max(peak) == 1
+    assert order.index('brightness_up') < order.index('brightness_down')
+
+def test_drain_returns_pending_in_order():
+    ex = ActionExecutor(lambda action: None, workers=1, limits={'run': 1})
+    for action in ('run 1', 'open x', 'run 2'):
+        assert ex.submit(action)
+    assert ex.drain() == ['run 1', 'open x', 'run 2']
+    assert ex.pending() == 0
+
+def test_reconfigure_keeps_queued_actions(reload_engine):
+    eng = reload_engine()
+    old = eng._action_executor
+    for action in ('run 1', 'run 2', 'run 3'):
+        assert old.submit(action)
+    new = eng.configure_action_executor(workers=1, maxsize=2)
+    assert new is eng._action_executor and not new._threads
+    # Переносится столько, сколько вмещает новая очередь, остальное считается отброшенным
+    assert new.drain() == ['run 1', 'run 2'] and new.dropped == 1
+    assert old.pending() == 0
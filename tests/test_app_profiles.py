@@ -0,0 +1,116 @@
+import os
+import json
+
+import app_profiles
+from frontmost_app import AppInfo
+from modifiers import parse_mods
+
+def write_profile(tmp_path, name, rules):
+    path = tmp_path / 'profiles' / f'{name}.json'
+    path.parent.mkdir(exist_ok=True)
+    tmp = str(path) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(rules, f)
+    os.replace(tmp, path)
+    return str(path)
+
+def kbd(hk_id, vk, action):
+    return {'id': hk_id, 'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': vk}, 'action': action}
+
+def fired(eng, vk):
+    return [r.action for r in eng._active_table.keyboard.lookup(vk, parse_mods(['Cmd']), False)]
+
+SAFARI = AppInfo('Safari', 'com.apple.Safari', 1)
+TERMINAL = AppInfo('Terminal', 'com.apple.Terminal', 2)
+NOTES = AppInfo('Notes', 'com.apple.Notes', 3)
+
+def test_profiles_load_on_activation_and_evict_lru(reload_engine, tmp_path):
+    safari = write_profile(tmp_path, 'com.apple.Safari', [kbd('s1', 1, 'safari')])
+    terminal = write_profile(tmp_path, 'Terminal', [kbd('t1', 1, 'terminal')])
+    write_profile(tmp_path, 'Notes', [{'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 1}, 'action': 'notes'}])
+    eng = reload_engine([kbd('g1', 1, 'global'), kbd('g2', 2, 'global2')])
+    profiles = eng._get_app_profiles()
+    profiles.capacity = 2
+    eng.get_snapshot()
+    # Глобальный снимок не содержит правил профилей; ни один профиль ещё не разобран
+    assert set(eng.get_snapshot().by_id) == {'g1', 'g2'}
+    assert profiles.loads == 0 and profiles.cached() == []
+
+    eng._on_frontmost_app_changed(SAFARI)
+    assert fired(eng, 1) == ['safari', 'global']
+    assert profiles.cached() == [safari]
+    eng._on_frontmost_app_changed(TERMINAL)  # профиль по имени приложения
+    assert fired(eng, 1) == ['terminal', 'global']
+    eng._on_frontmost_app_changed(SAFARI)  # из кэша, без повторного разбора
+    assert profiles.loads == 2
+    eng._on_frontmost_app_changed(NOTES)
+    assert fired(eng, 1) == ['notes', 'global']
+    assert profiles.cached() == [safari, str(tmp_path / 'profiles' / 'Notes.json')]
+    assert profiles.evictions == 1 and terminal not in profiles.cached()
+    eng._on_frontmost_app_changed(AppInfo('Other', 'com.example.other'))
+    assert fired(eng, 1) == ['global']
+    eng._on_frontmost_app_changed(TERMINAL)
+    assert profiles.loads == 4
+
+def test_profile_edit_and_new_snapshot_rebuild_active_table(reload_engine, tmp_path):
+    write_profile(tmp_path, 'com.apple.Safari', [kbd('s1', 1, 'safari')])
+    eng = reload_engine([kbd('g1', 1, 'global')])
+    eng.get_snapshot()
+    eng._on_frontmost_app_changed(SAFARI)
+    assert fired(eng, 1) == ['safari', 'global']
+
+    # Новый снимок глобального профиля: таблица активного приложения пересобрана с профилем
+    eng.save_hotkeys(eng.load_hotkeys() + [kbd('g2', 2, 'global2')])
+    assert fired(eng, 2) == ['global2'] and fired(eng, 1) == ['safari', 'global']
+
+    # Изменённый файл профиля подхватывается при следующей сверке
+    write_profile(tmp_path, 'com.apple.Safari', [kbd('s1', 1, 'safari v2'), kbd('s2', 2, 'safari2')])
+    eng._on_app_profiles_changed()
+    assert fired(eng, 1) == ['safari v2', 'global']
+    assert fired(eng, 2) == ['safari2', 'global2']
+
+    # Сломанный профиль не ломает глобальные правила
+    write_profile(tmp_path, 'com.apple.Safari', {'not': 'a list'})
+    eng._on_app_profiles_changed()
+    assert fired(eng, 1) == ['global']
+
+def test_split_moves_app_rules_to_profiles(tmp_path):
+    hotkeys = [kbd('g1', 1, 'global'),
+               {**kbd('a1', 2, 'safari'), 'scope': 'app', 'app': 'Safari', 'bundle_id': 'com.apple.Safari'},
+               {**kbd('a2', 3, 'term'), 'scope': 'app', 'app': 'Terminal'}]
+    src = tmp_path / 'hotkeys.json'
+    src.write_text(json.dumps(hotkeys), encoding='utf-8')
+    assert app_profiles.main(['split', str(src), str(tmp_path / 'profiles')]) == 0
+    assert json.loads(src.read_text(encoding='utf-8')) == hotkeys[:1]
+    profiles = app_profiles.AppProfiles(str(tmp_path / 'profiles'))
+    assert profiles.path_for(SAFARI).endswith('com.apple.Safari.json')
+    assert profiles.path_for(TERMINAL).endswith('Terminal.json')
+    assert [r.id for r in app_profiles.load_profile(profiles.path_for(TERMINAL))] == ['a2']
+
+def test_repository_lists_edits_and_checks_profile_rules(reload_engine, tmp_path):
+    path = write_profile(tmp_path, 'com.apple.Safari', [kbd('s1', 1, 'safari'),
+                                                        {'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 2},
+                                                         'action': 'safari без id'}])
+    eng = reload_engine([kbd('g1', 1, 'global'), kbd('g3', 3, 'global3')])
+    eng._on_frontmost_app_changed(SAFARI)
+    repo = eng.get_rule_repository()
+    assert [hk['id'] for hk in repo.list('keyboard')] == ['g1', 'g3', 's1', 'com.apple.Safari#1']
+    assert repo.get('s1')['scope'] == 'app' and 's1' not in repo and len(repo) == 2
+
+    # Правка по id переписывает файл профиля, таблица приложения пересобрана
+    assert repo.update('s1', action='safari v2')
+    assert repo.set_enabled('com.apple.Safari#1', False)
+    assert fired(eng, 1) == ['safari v2', 'global']
+    repo.delete('s1')
+    saved = json.loads(open(path, encoding='utf-8').read())
+    assert saved == [{'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 2}, 'action': 'safari без id',
+                      'id': 'com.apple.Safari#1', 'enabled': False}]
+    assert fired(eng, 1) == ['global'] and repo.get('com.apple.Safari#1')['enabled'] is False
+    assert json.loads(open(eng.HOTKEYS_FILE, encoding='utf-8').read()) == [kbd('g1', 1, 'global'),
+                                                                           kbd('g3', 3, 'global3')]
+
+    # Конфликты видят правила профилей
+    write_profile(tmp_path, 'com.apple.Safari', [kbd('s3', 3, 'safari3')])
+    report = eng.analyze_conflicts(strict=True)  # g1, g3, затем s3 из профиля
+    assert report.rules_count == 3 and [g.members for g in report.groups] == [(1, 2)]
+    assert eng.hotkey_conflicts(kbd('new', 3, 'x'), repo.list(), strict=True)['id'] == 'g3'
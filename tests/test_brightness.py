@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import time
+
+from brightness import Backend, BrightnessController, BrightnessResolver, HelperBackend
+
+class FakeBackend(Backend):
+    def __init__(self, name, latency=0.0, ok=True, available=True):
+        self.name = name
+        self.latency = latency
+        self.ok = ok
+        self.available = available
+        self.loads = 0
+        self.values = []
+
+    def load(self):
+        self.loads += 1
+        return self.available
+
+    def set(self, val):
+        self.values.append(val)
+        if self.latency:
+            time.sleep(self.latency)
+        return self.ok
+
+def test_probe_once_picks_fastest_and_reprobes_after_failure():
+    slow, fast, missing = FakeBackend('helper', 0.02), FakeBackend('displayservices'), FakeBackend('coredisplay', available=False)
+    res = BrightnessResolver([slow, missing, fast])
+    assert res.active is None
+    assert res.set(0.5)
+    assert res.active == 'displayservices' and set(res.probe_latency_ms) == {'helper', 'displayservices'}
+    for i in range(20):
+        assert res.set(i / 20)
+    # После выбора вызовы идут только в выбранный механизм, библиотеки загружены один раз
+    assert len(slow.values) == 1 and len(fast.values) == 21
+    assert slow.loads == fast.loads == missing.loads == 1 and missing.values == []
+    st = res.status()
+    assert st['backend'] == 'displayservices' and st['calls'] == 21 and st['probes'] == 1
+    assert st['last_ms'] is not None and st['avg_ms'] < 20
+
+    fast.ok = False
+    assert res.set(0.3)
+    assert res.active == 'helper' and res.probes == 2 and res.failures == 1
+    assert slow.values[-1] == 0.3
+
+def test_total_failure_waits_before_reprobing():
+    now = [100.0]
+    broken = FakeBackend('helper', ok=False)
+    res = BrightnessResolver([broken], reprobe_interval=30.0, clock=lambda: now[0])
+    assert not res.set(0.5) and not res.set(0.6)
+    assert broken.values == [0.5] and res.active is None
+    now[0] += 31
+    broken.ok = True
+    assert res.set(0.7) and res.active == 'helper'
+
+def test_choice_is_cached_across_runs(tmp_path):
+    cache = str(tmp_path / 'brightness_backend.json')
+    first = [FakeBackend('helper', 0.01), FakeBackend('coredisplay')]
+    assert BrightnessResolver(first, cache_path=cache).set(0.4)
+    with open(cache, 'r', encoding='utf-8') as f:
+        assert json.load(f)['key'][2] == 'coredisplay'
+
+    second = [FakeBackend('helper', 0.01), FakeBackend('coredisplay')]
+    res = BrightnessResolver(second, cache_path=cache)
+    assert res.set(0.6)
+    assert res.active == 'coredisplay' and res.probes == 0
+    assert second[0].loads == 0 and second[0].values == []
+
+    # Сохранённый механизм отказал — обычная проверка
+    third = [FakeBackend('helper'), FakeBackend('coredisplay', ok=False)]
+    res = BrightnessResolver(third, cache_path=cache)
+    assert res.set(0.6) and res.active == 'helper' and res.probes == 1
+
+STANDIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'helper_standin.py')
+
+def standin(tmp_path, **env):
+    log = tmp_path / 'helper.log'
+    backend = HelperBackend(command=[sys.executable, STANDIN],
+                            env={**os.environ, 'HELPER_STANDIN_LOG': str(log), **env})
+    assert backend.load()
+    return backend, log
+
+def logged(log):
+    return [line.split(' ', 1) for line in log.read_text(encoding='utf-8').splitlines()]
+
+def test_helper_server_keeps_one_process_and_pipelines(tmp_path):
+    backend, log = standin(tmp_path)
+    try:
+        for i in range(50):
+            backend.server.request(f'set {i / 100:.4f}', wait=False)
+        assert backend.get() == 0.49
+        assert backend.set(0.7) and backend.set(0.2, display=2)
+        assert backend.get() == 0.7 and backend.get(2) == 0.2
+        assert backend.server.starts == 1
+        assert len({pid for pid, _ in logged(log)}) == 1 and len(logged(log)) == 55
+    finally:
+        backend.close()
+    assert not backend.server.running
+
+def test_helper_server_restarts_after_death(tmp_path):
+    backend, log = standin(tmp_path, HELPER_STANDIN_DIE_AFTER='2')
+    try:
+        assert backend.set(0.1)
+        assert not backend.set(0.2)  # процесс умер, не ответив
+        assert backend.set(0.3) and backend.server.starts == 2
+        assert [cmd for _, cmd in logged(log)] == ['set 0.1000', 'set 0.2000', 'set 0.3000']
+    finally:
+        backend.close()
+
+def test_legacy_helper_falls_back_to_process_per_call(tmp_path):
+    backend, log = standin(tmp_path, HELPER_STANDIN_LEGACY='1')
+    assert backend.server.unsupported
+    assert backend.set(0.4) and backend.set(0.5)
+    assert [cmd for _, cmd in logged(log)] == ['oneshot 0.4000', 'oneshot 0.5000']
+
+def test_slow_ready_is_retried_not_marked_legacy(tmp_path):
+    log = tmp_path / 'helper.log'
+    backend = HelperBackend(command=[sys.executable, STANDIN],
+                            env={**os.environ, 'HELPER_STANDIN_LOG': str(log),
+                                 'HELPER_STANDIN_SLOW_START': str(tmp_path / 'slow')})
+    backend.server.timeout = 0.5
+    try:
+        assert not backend.server.start()  # "ready" не успел — процесс снят
+        assert not backend.server.unsupported
+        backend.server.timeout = 5.0
+        assert backend.set(0.3) and backend.server.starts == 1
+        assert [cmd for _, cmd in logged(log)] == ['set 0.3000']
+    finally:
+        backend.close()
+
+def test_controller_coalesces_presses_into_bounded_ramp():
+    calls, settled = [], []
+    ctl = BrightnessController(lambda v: calls.append((time.monotonic(), v)) or True, lambda: 0.5,
+                               on_settled=settled.append, frame_interval=0.02, max_step=0.05)
+    start = time.monotonic()
+    for _ in range(200):  # автоповтор: цель в памяти, без чтения cache
+        ctl.step(0.01)
+    assert ctl.target == 1.0
+    assert ctl.wait_settled(2.0)
+    elapsed = time.monotonic() - start
+    values = [v for _, v in calls]
+    assert values[-1] == 1.0 and values == sorted(values)
+    assert all(b - a <= 0.05 + 1e-9 for a, b in zip([0.5] + values, values))
+    assert len(calls) <= elapsed / 0.02 + 1
+    assert all(t2 - t1 >= 0.019 for (t1, _), (t2, _) in zip(calls, calls[1:]))
+    assert settled == [1.0] and ctl.requests == 200
+
+    # Побеждает последний запрос: рампа к промежуточной цели не доводится
+    calls.clear()
+    ctl.set_target(0.2)
+    ctl.set_target(0.95)
+    assert ctl.wait_settled(2.0)
+    assert all(v >= 0.95 for _, v in calls) and calls[-1][1] == 0.95
+    ctl.stop()
@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import importlib
+
+import config_cache
+from modifiers import parse_mods
+
+HOTKEYS = [
+    {'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 12}, 'action': 'run 1'},
+    {'type': 'keyboard', 'combo': {'mods': ['LCmd'], 'vk': 13}, 'action': 'run 2', 'scope': 'app', 'app': 'Safari'},
+    {'type': 'keyboard', 'action': 'run 3', 'sequence': [{'mods': ['LCmd'], 'vk': 40}, {'mods': ['Cmd'], 'vk': 8}]},
+]
+
+def test_cold_start_uses_cache_without_parsing_json(reload_engine, monkeypatch):
+    eng = reload_engine(HOTKEYS)
+    snap = eng.get_snapshot()
+    cache = config_cache.cache_path_for(eng.HOTKEYS_FILE)
+    assert os.path.exists(cache)
+    ids = [r.id for r in snap.rules]
+    assert all(ids)  # id дописаны в JSON до записи кэша — второй разбор не нужен
+    # Новый процесс: JSON и кэш на диске те же
+    sys.modules.pop('hotkey_engine', None)
+    import hotkey_engine as eng
+    importlib.reload(eng)
+    def no_parse(blob):
+        raise AssertionError('JSON не должен разбираться при валидном кэше')
+    monkeypatch.setattr(eng, '_parse_hotkeys', no_parse)
+    cached = eng.get_snapshot()
+    assert [r.id for r in cached.rules] == ids and cached.generation == 1
+    cmd = parse_mods(['Cmd'])
+    assert [r.action for r in cached.keyboard.lookup(12, cmd, False)] == ['run 1']
+    safari = cached.table_for('Safari')
+    assert [r.action for r in safari.keyboard.lookup(13, parse_mods(['LCmd']), True)] == ['run 2']
+    # trie последовательностей после загрузки из кэша проверяет дополнительные биты
+    assert safari.sequences.size == 1
+    assert not safari.sequences.root.step(40, cmd, True)
+    assert safari.sequences.root.step(40, parse_mods(['LCmd']), True)
+
+def test_changed_json_rebuilds_cache(reload_engine):
+    eng = reload_engine(HOTKEYS)
+    eng.get_snapshot()
+    data = eng.load_hotkeys()
+    data[0]['action'] = 'run changed'
+    with open(eng.HOTKEYS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    eng.refresh_hotkeys_cache(force=True)
+    assert eng.get_snapshot().rules[0].action == 'run changed'
+    with open(eng.HOTKEYS_FILE, 'rb') as f:
+        blob = f.read()
+    fresh = config_cache.load_snapshot(eng.HOTKEYS_FILE, blob, 7)
+    assert fresh is not None and fresh.rules[0].action == 'run changed' and fresh.generation == 7
+    # Правка правила сбрасывает кэш, новый пишется при выходе
+    data[0]['action'] = 'run saved'
+    eng.save_hotkeys(data)
+    with open(eng.HOTKEYS_FILE, 'rb') as f:
+        blob = f.read()
+    assert config_cache.load_snapshot(eng.HOTKEYS_FILE, blob, 8) is None
+    eng._store_stale_config_cache()
+    assert config_cache.load_snapshot(eng.HOTKEYS_FILE, blob, 8).rules[0].action == 'run saved'
+
+def test_corrupt_or_foreign_cache_is_a_miss(reload_engine, monkeypatch):
+    eng = reload_engine(HOTKEYS)
+    eng.get_snapshot()
+    path = config_cache.cache_path_for(eng.HOTKEYS_FILE)
+    with open(eng.HOTKEYS_FILE, 'rb') as f:
+        blob = f.read()
+    monkeypatch.setattr(config_cache, 'CACHE_SCHEMA', config_cache.CACHE_SCHEMA + 1)
+    assert config_cache.load_snapshot(eng.HOTKEYS_FILE, blob, 1) is None
+    monkeypatch.undo()
+    with open(path, 'r+b') as f:
+        f.seek(60)
+        f.write(b'\x00garbage\x00')
+    assert config_cache.load_snapshot(eng.HOTKEYS_FILE, blob, 1) is None
+    eng.refresh_hotkeys_cache(force=True)
+    assert len(eng.get_snapshot().rules) == 3
+    assert config_cache.load_snapshot(eng.HOTKEYS_FILE, blob, 1) is not None
@@ -0,0 +1,49 @@
+import os
+import json
+import threading
+
+from config_watcher import ConfigWatcher, PollingBackend, file_signature
+
+def atomic_write(path, data):
+    tmp = str(path) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def test_atomic_replace_with_same_size_and_mtime_is_detected(tmp_path):
+    path = tmp_path / 'hotkeys.json'
+    atomic_write(path, [1])
+    seen = []
+    watcher = ConfigWatcher(PollingBackend(interval=0.01))
+    watcher.watch(str(path), seen.append)
+    st = os.stat(path)
+    atomic_write(path, [2])  # тот же размер
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))  # и тот же mtime
+    assert watcher.check_now() == [str(path)]
+    assert seen == [str(path)]
+    assert watcher.generation == 1
+    # Без изменений — колбэки не вызываются
+    assert watcher.check_now() == []
+
+def test_own_write_is_not_reported(tmp_path):
+    path = tmp_path / 'settings.json'
+    watcher = ConfigWatcher(PollingBackend(interval=0.01))
+    watcher.watch(str(path), lambda p: None)
+    atomic_write(path, {'strict_mod_match': True})
+    watcher.note_written(str(path))
+    assert watcher.check_now() == []
+    assert file_signature(str(path)) is not None
+
+def test_background_thread_publishes_changes(tmp_path):
+    path = tmp_path / 'hotkeys.json'
+    atomic_write(path, [])
+    changed = threading.Event()
+    watcher = ConfigWatcher(PollingBackend(interval=0.01))
+    watcher.watch(str(path), lambda p: changed.set())
+    watcher.start()
+    try:
+        atomic_write(path, [{'type': 'keyboard'}])
+        assert changed.wait(2.0)
+    finally:
+        watcher.stop()
+    assert not watcher.is_running()
@@ -1,20 +1,7 @@
-import os
 import json
-import importlib
 
-def setup_engine(tmp_path):
-    os.environ['HOTKEYMASTER_HOTKEYS_FILE'] = str(tmp_path / 'hotkeys.json')
-    # Ensure empty file
-    with open(os.environ['HOTKEYMASTER_HOTKEYS_FILE'], 'w', encoding='utf-8') as f:
-        json.dump([], f)
-    import sys
-    sys.modules.pop('hotkey_engine', None)
-    import hotkey_engine
-    importlib.reload(hotkey_engine)
-    return hotkey_engine
-
-def test_keyboard_conflict_strict(tmp_path):
-    eng = setup_engine(tmp_path)
+def test_keyboard_conflict_strict(reload_engine):
+    eng = reload_engine()
     base = {
         'id': 'a',
         'type': 'keyboard',
@@ -45,8 +32,8 @@ def test_keyboard_conflict_strict(tmp_path):
     res2 = eng.hotkey_conflicts(no_conflict_different_vk, [base], strict=True)
     assert res2 is None, 'Не ожидаем конфликт при другом vk'
 
-def test_keyboard_conflict_subset_non_strict(tmp_path):
-    eng = setup_engine(tmp_path)
+def test_keyboard_conflict_subset_non_strict(reload_engine):
+    eng = reload_engine()
     base = {
         'id': 'a', 'type':'keyboard', 'combo': {'mods':['Cmd'], 'vk': 12, 'disp':'Cmd + Q'}, 'action':'run 1','scope':'global','app':'','enabled':True
     }
@@ -57,8 +44,8 @@ def test_keyboard_conflict_subset_non_strict(tmp_path):
     res = eng.hotkey_conflicts(superset, [base], strict=False)
     assert res is not None, 'Ожидаем конфликт superset в нестрогом режиме'
 
-def test_trackpad_conflict(tmp_path):
-    eng = setup_engine(tmp_path)
+def test_trackpad_conflict(reload_engine):
+    eng = reload_engine()
     gesture = {
         'id': 'g1','type':'trackpad','combo':None,'gesture':'Тап двумя пальцами','action':'run 1','scope':'global','app':'','enabled':True
     }
@@ -68,8 +55,8 @@ def test_trackpad_conflict(tmp_path):
     res = eng.hotkey_conflicts(new_same, [gesture], strict=True)
     assert res is not None, 'Ожидаем конфликт одинакового жеста'
 
-def test_no_conflict_different_scope_app(tmp_path):
-    eng = setup_engine(tmp_path)
+def test_no_conflict_different_scope_app(reload_engine):
+    eng = reload_engine()
     base_app = {
         'id':'x','type':'keyboard','combo': {'mods':['Cmd'], 'vk':15, 'disp':'Cmd + R'}, 'action':'run 1','scope':'app','app':'Safari','enabled':True
     }
@@ -78,3 +65,65 @@ def test_no_conflict_different_scope_app(tmp_path):
     }
     res = eng.hotkey_conflicts(same_combo_other_app, [base_app], strict=True)
     assert res is None, 'Не ожидаем конфликт для разных приложений при app scope'
+
+def random_pack(rnd, n):
+    names = ['Cmd', 'shift', 'Alt', 'Ctrl', 'LCmd', 'Fn', 'Hyper']
+    apps = ['Safari', 'Xcode', '']
+    gestures = ['Тап двумя пальцами', 'Тап тремя пальцами']
+    pack = []
+    for i in range(n):
+        scope = 'global' if rnd.random() < 0.4 else 'app'
+        hk = {'id': str(i), 'scope': scope, 'app': rnd.choice(apps) if scope == 'app' else '',
+              'action': f'run {i}', 'enabled': rnd.random() < 0.8}
+        if rnd.random() < 0.2:
+            hk.update(type='trackpad', combo=None, gesture=rnd.choice(gestures))
+        else:
+            vk = rnd.randrange(5) if rnd.random() < 0.95 else None
+            hk.update(type='keyboard', combo={'mods': [m for m in names if rnd.random() < 0.3], 'vk': vk})
+        pack.append(hk)
+    return pack
+
+def test_analyzer_matches_reference_pairwise(reload_engine):
+    import random
+    from conflict_analyzer import analyze_conflicts
+    eng = reload_engine()
+    rnd = random.Random(11)
+    pack = random_pack(rnd, 120)
+    for strict in (True, False):
+        report = analyze_conflicts(pack, strict=strict)
+        expected = {(i, j) for j in range(len(pack)) for i in range(j)
+                    if eng.hotkey_conflicts(pack[j], [pack[i]], strict=strict) is not None}
+        assert set(report.pairs) == expected
+        assert len(report.pairs) == len(expected)
+        # Каждая пара лежит внутри одной группы, а группы не пересекаются
+        group_of = {i: n for n, g in enumerate(report.groups) for i in g.members}
+        assert sum(len(g.members) for g in report.groups) == len(group_of)
+        assert all(group_of[i] == group_of[j] for i, j in expected)
+        assert set(group_of) == {i for pair in expected for i in pair}
+
+def test_analyzer_strict_side_and_fn_masks_conflict():
+    from conflict_analyzer import analyze_conflicts
+    def kbd(i, mods):
+        return {'id': i, 'type': 'keyboard', 'combo': {'mods': mods, 'vk': 12}, 'scope': 'global', 'action': 'run'}
+    pack = [kbd('cmd', ['Cmd']), kbd('lcmd', ['LCmd']), kbd('fn', ['Cmd', 'Fn']), kbd('shift', ['Cmd', 'Shift'])]
+    report = analyze_conflicts(pack, strict=True)
+    # Все три срабатывают на LCmd+Fn+Q; Cmd+Shift+Q — другие основные модификаторы
+    assert report.pairs == ((0, 1), (0, 2), (1, 2))
+    assert [g.members for g in report.groups] == [(0, 1, 2)]
+
+def test_analyzer_cli_reports_json(tmp_path, capsys):
+    from conflict_analyzer import main
+    path = tmp_path / 'pack.json'
+    pack = [
+        {'id': 'a', 'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 12}, 'scope': 'global', 'action': 'run 1'},
+        {'id': 'b', 'type': 'keyboard', 'combo': {'mods': ['Cmd', 'Shift'], 'vk': 12}, 'scope': 'app',
+         'app': 'Safari', 'action': 'run 2'},
+    ]
+    path.write_text(json.dumps(pack), encoding='utf-8')
+    assert main([str(path), '--strict', '--json']) == 0
+    assert json.loads(capsys.readouterr().out)['conflicts'] == 0
+    assert main([str(path), '--json']) == 1
+    out = json.loads(capsys.readouterr().out)
+    assert out['conflicts'] == 1 and out['pairs'] == [[0, 1]]
+    assert [r['id'] for r in out['groups'][0]['rules']] == ['a', 'b']
+    assert main([str(tmp_path / 'missing.json')]) == 2
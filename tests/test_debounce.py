@@ -1,17 +1,7 @@
 import time
-import importlib, sys, os, json
 
-def reload_engine(tmp_path):
-    os.environ['HOTKEYMASTER_HOTKEYS_FILE'] = str(tmp_path / 'hotkeys.json')
-    with open(os.environ['HOTKEYMASTER_HOTKEYS_FILE'], 'w', encoding='utf-8') as f:
-        json.dump([], f)
-    sys.modules.pop('hotkey_engine', None)
-    import hotkey_engine
-    importlib.reload(hotkey_engine)
-    return hotkey_engine
-
-def test_keyboard_debounce(tmp_path):
-    eng = reload_engine(tmp_path)
+def test_keyboard_debounce(reload_engine):
+    eng = reload_engine()
     hk = {'id':'abc','type':'keyboard','combo':{'mods':['Cmd'], 'vk':12,'disp':'Cmd + Q'},'scope':'global','app':'','action':'run echo 1'}
     # Первое срабатывание
     assert eng.allow_hotkey_fire(hk) is True
@@ -20,3 +10,20 @@ def test_keyboard_debounce(tmp_path):
     # По истечении интервала — снова True
     time.sleep(eng.KEY_REPEAT_DEBOUNCE + 0.1)
     assert eng.allow_hotkey_fire(hk) is True
+
+def test_autorepeat_policies(reload_engine):
+    eng = reload_engine()
+    once = {'id': 'once', 'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 12}}
+    # Быстрое двойное нажатие (не автоповтор) не теряется, удержание — подавляется
+    assert eng.allow_hotkey_fire(once, now=1.0, autorepeat=False) is True
+    assert eng.allow_hotkey_fire(once, now=1.05, autorepeat=False) is True
+    assert eng.allow_hotkey_fire(once, now=1.1, autorepeat=True) is False
+    repeat = {'id': 'rep', 'repeat': 'repeat'}
+    assert all(eng.allow_hotkey_fire(repeat, now=2.0 + i * 0.03, autorepeat=True) for i in range(5))
+    throttle = {'id': 'thr', 'repeat': 'throttle', 'repeat_rate': 4}
+    fired = [eng.allow_hotkey_fire(throttle, now=3.0 + i * 0.05, autorepeat=i > 0) for i in range(20)]
+    assert fired.count(True) == 4
+    # Мусор в repeat_rate не роняет колбэк: throttle без частоты ведёт себя как once
+    broken = {'id': 'bad', 'repeat': 'throttle', 'repeat_rate': 'fast'}
+    assert eng.allow_hotkey_fire(broken, now=4.0, autorepeat=False) is True
+    assert eng.allow_hotkey_fire(broken, now=4.03, autorepeat=True) is False
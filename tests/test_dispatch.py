@@ -0,0 +1,61 @@
+import random
+
+from hotkey_dispatch import DispatchIndex
+from rules import Rule
+from modifiers import parse_mods
+
+NAMES = ['Cmd', 'Shift', 'Alt', 'Ctrl']
+
+def random_rules(rnd, n):
+    rules = []
+    for i in range(n):
+        mods = [m for m in NAMES if rnd.random() < 0.4]
+        if rnd.random() < 0.5:
+            mods = [m.lower() for m in mods]
+        rules.append({'id': str(i), 'type': 'keyboard', 'combo': {'mods': mods, 'vk': rnd.randrange(6)},
+                      'enabled': rnd.random() < 0.9, 'action': f'run {i}'})
+    return rules
+
+def test_index_matches_linear_scan(reload_engine):
+    eng = reload_engine()
+    rnd = random.Random(7)
+    rules = random_rules(rnd, 300)
+    index = DispatchIndex([Rule.from_dict(hk) for hk in rules])
+    for strict in (True, False):
+        for vk in range(7):
+            for mask in range(16):
+                ev_mods = {NAMES[b] for b, bit in enumerate((8, 4, 2, 1)) if mask & bit}
+                expected = [hk['id'] for hk in rules
+                            if hk['enabled'] and eng.compare_hotkey_event(vk, ev_mods, hk['combo'], strict)]
+                got = [r.id for r in index.lookup(vk, parse_mods(ev_mods), strict)]
+                assert got == expected
+
+def test_index_skips_disabled_and_non_keyboard():
+    rules = [
+        {'id': 'a', 'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 12}, 'enabled': False},
+        {'id': 'b', 'type': 'trackpad', 'gesture': 'Тап тремя пальцами'},
+        {'id': 'c', 'type': 'keyboard', 'combo': {'mods': ['cmd'], 'vk': 12}},
+    ]
+    index = DispatchIndex([Rule.from_dict(hk) for hk in rules])
+    assert index.size == 1
+    assert [r.id for r in index.lookup(12, parse_mods(['Cmd']), True)] == ['c']
+    assert index.lookup(13, parse_mods(['Cmd']), False) == ()
+
+def test_index_extra_modifiers_require_explicit_bits():
+    rules = [
+        {'id': 'left', 'type': 'keyboard', 'combo': {'mods': ['LCmd'], 'vk': 12}},
+        {'id': 'any', 'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 12}},
+    ]
+    index = DispatchIndex([Rule.from_dict(hk) for hk in rules])
+    left_cmd = parse_mods(['LCmd'])
+    right_cmd = parse_mods(['RCmd'])
+    assert [r.id for r in index.lookup(12, left_cmd, True)] == ['left', 'any']
+    assert [r.id for r in index.lookup(12, right_cmd, True)] == ['any']
+
+def test_save_publishes_new_index_generation(reload_engine):
+    eng = reload_engine()
+    assert eng.get_dispatch_index().size == 0
+    gen = eng.get_snapshot().generation
+    eng.save_hotkeys([{'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 12}, 'action': 'run 1'}])
+    assert eng.get_snapshot().generation == gen + 1
+    assert eng.get_dispatch_index().size == 1
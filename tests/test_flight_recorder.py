@@ -0,0 +1,54 @@
+import flight_recorder
+from flight_recorder import FlightRecorder, load_dump, format_record, main
+from modifiers import parse_mods
+
+def test_ring_buffer_keeps_last_records_in_order():
+    rec = FlightRecorder(capacity=4)
+    for i in range(10):
+        rec.record(1000 + i, i, 0, flight_recorder.NO_MATCH)
+    records = rec.records()
+    assert rec.count == 10
+    assert [r.vk for r in records] == [6, 7, 8, 9]
+    assert [r.t_ns for r in records] == [1006, 1007, 1008, 1009]
+
+def test_records_keep_rule_reason_and_duration():
+    rec = FlightRecorder(capacity=8)
+    cmd = parse_mods(['Cmd'])
+    rec.record(5, 12, cmd, flight_recorder.FIRED, 'rule-a', 2, 1500)
+    rec.record(6, 12, cmd, flight_recorder.DEBOUNCED, 'rule-a', 2, 900)
+    rec.record(7, 13, 0, flight_recorder.NO_MATCH)
+    first, second, third = rec.records()
+    assert first.rule_id == 'rule-a' and first.reason == flight_recorder.FIRED
+    assert first.candidates == 2 and first.duration_ns == 1500 and first.flags == cmd
+    assert second.reason == flight_recorder.DEBOUNCED
+    assert third.rule_id is None
+
+def test_dump_roundtrip_and_decoder(tmp_path, capsys):
+    rec = FlightRecorder(capacity=3)
+    for i in range(5):
+        rec.record(i, 40 + i, parse_mods(['Cmd', 'Shift']), flight_recorder.FIRED, f'id-{i}', 1, 2000)
+    path = rec.dump(str(tmp_path / 'dump.bin'))
+    with open(path, 'rb') as f:
+        wall_offset, records = load_dump(f.read())
+    assert records == rec.records()
+    assert 'rule=id-4' in format_record(records[-1], wall_offset)
+    assert main([path]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 3
+    assert 'vk=42 mods=Shift+Cmd FIRED rule=id-2 candidates=1 2.0us' in lines[0]
+    (tmp_path / 'bad.bin').write_bytes(b'garbage' * 10)
+    assert main([str(tmp_path / 'bad.bin')]) == 2
+
+def test_rule_id_table_is_bounded_and_cleared():
+    rec = FlightRecorder(capacity=4)
+    for i in range(1000):
+        rec.record(i, i, 0, flight_recorder.FIRED, f'rule-{i}')
+    # В таблице только id из кольца и ещё не больше одного «окна» новых
+    assert len(rec._ids) <= 2 * rec.capacity + 1
+    assert [r.rule_id for r in rec.records()] == ['rule-996', 'rule-997', 'rule-998', 'rule-999']
+    _, records = load_dump(rec.dumps())
+    assert [r.rule_id for r in records] == ['rule-996', 'rule-997', 'rule-998', 'rule-999']
+    rec.clear()
+    assert rec.records() == [] and rec._ids == [''] and not rec._slots
+    rec.record(1, 2, 0, flight_recorder.FIRED, 'again')
+    assert rec.records()[0].rule_id == 'again'
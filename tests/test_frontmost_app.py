@@ -0,0 +1,46 @@
+import time
+
+from frontmost_app import AppInfo, FrontmostAppTracker, app_matches
+from rules import Rule
+
+def test_tracker_uses_ttl_cache_until_observing():
+    calls = []
+    def query():
+        calls.append(1)
+        return AppInfo('Safari', 'com.apple.Safari', 42)
+    tracker = FrontmostAppTracker(ttl=0.2, query=query)
+    assert tracker.current().bundle_id == 'com.apple.Safari'
+    tracker.current()
+    assert len(calls) == 1
+    time.sleep(0.25)
+    tracker.current()
+    assert len(calls) == 2
+
+def test_set_current_notifies_listeners_once():
+    tracker = FrontmostAppTracker(query=lambda: None)
+    seen = []
+    tracker.add_listener(seen.append)
+    info = AppInfo('Terminal', 'com.apple.Terminal', 7)
+    tracker.set_current(info)
+    tracker.set_current(info)
+    assert seen == [info]
+
+def test_app_matches_bundle_id_and_legacy_name():
+    safari = AppInfo('Safari', 'com.apple.Safari', 1)
+    assert app_matches('Safari', safari)
+    assert app_matches('com.apple.Safari', safari)
+    assert not app_matches('com.apple.SafariTechnologyPreview', safari)
+    # Явный bundle_id в правиле не путается с похожими именами
+    preview = AppInfo('Safari Technology Preview', 'com.apple.SafariTechnologyPreview', 2)
+    assert app_matches('Safari', preview)
+    assert not app_matches('Safari', preview, 'com.apple.Safari')
+    # Старый формат: get_active_app_name возвращал строку
+    assert app_matches('Safari', 'Safari')
+    assert not app_matches('Safari', None)
+
+def test_rule_matches_app():
+    rule = Rule.from_dict({'id': 'r', 'scope': 'app', 'app': 'Safari', 'bundle_id': 'com.apple.Safari'})
+    assert rule.is_app_scoped
+    assert rule.matches_app(AppInfo('Safari', 'com.apple.Safari'))
+    assert not rule.matches_app(AppInfo('Safari Technology Preview', 'com.apple.SafariTechnologyPreview'))
+    assert Rule.from_dict({'id': 'g'}).matches_app(None)
@@ -1,10 +1,10 @@
-import os, json, tempfile, uuid, sys, importlib
+import json, tempfile, uuid, sys, importlib
 
 # We import hotkey_engine after setting env var to override path
 
-def test_hotkeys_load_save_roundtrip(tmp_path):
+def test_hotkeys_load_save_roundtrip(tmp_path, monkeypatch):
     test_file = tmp_path / 'hotkeys.json'
-    os.environ['HOTKEYMASTER_HOTKEYS_FILE'] = str(test_file)
+    monkeypatch.setenv('HOTKEYMASTER_HOTKEYS_FILE', str(test_file))
     if 'hotkey_engine' in sys.modules:
         del sys.modules['hotkey_engine']
     hotkey_engine = importlib.import_module('hotkey_engine')
@@ -20,9 +20,9 @@ def test_hotkeys_load_save_roundtrip(tmp_path):
     assert 'id' in loaded[0]
 
 
-def test_hotkeys_cache_invalidation(tmp_path):
+def test_hotkeys_cache_invalidation(tmp_path, monkeypatch):
     test_file = tmp_path / 'hotkeys.json'
-    os.environ['HOTKEYMASTER_HOTKEYS_FILE'] = str(test_file)
+    monkeypatch.setenv('HOTKEYMASTER_HOTKEYS_FILE', str(test_file))
     if 'hotkey_engine' in sys.modules:
         del sys.modules['hotkey_engine']
     hotkey_engine = importlib.import_module('hotkey_engine')
@@ -0,0 +1,26 @@
+import os
+import sys
+import json
+import subprocess
+
+from benchmarks import import_time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_engine_imports_do_not_load_gui_or_frameworks():
+    assert import_time.check() == []
+
+def test_trackpad_frameworks_load_on_start_not_on_import():
+    code = ('import sys, json, trackpad_engine\n'
+            'print(json.dumps([trackpad_engine.MT is None, trackpad_engine.CF is None]))')
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=import_time._env(),
+                         capture_output=True, text=True, check=True).stdout
+    assert json.loads(out.strip().splitlines()[-1]) == [True, True]
+
+def test_importtime_breakdown_is_parsed():
+    rows = import_time.measure('hotkey_engine')
+    top = [r for r in rows if r.depth == 0]
+    assert [r.module for r in top][-1] == 'hotkey_engine'
+    assert all(r.cumulative_us >= r.self_us >= 0 for r in rows)
+    assert any(r.module == 'rules' and r.depth == 1 for r in rows)
+    assert 'hotkey_engine' in import_time.format_breakdown(rows, top=5)
@@ -0,0 +1,20 @@
+import sys
+import json
+
+from benchmarks import keystroke_bench
+
+def test_benchmark_drives_listener_callback(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'Quartz', keystroke_bench.fake_quartz())
+    report = keystroke_bench.run_benchmark([10, 200], [0.0, 0.5], (False, True), events=300, hit_ratio=0.5)
+    rows = report['results']
+    assert [(r['rules'], r['app_mix'], r['strict']) for r in rows][:2] == [(10, 0.0, False), (10, 0.0, True)]
+    assert len(rows) == 8
+    for r in rows:
+        assert r['events'] == 300 and r['throughput_eps'] > 0
+        assert 0 < r['p50_us'] <= r['p99_us'] <= r['max_us']
+        # Поток событий прошёл через настоящий колбэк: часть нажатий сработала, часть — нет
+        assert r['decisions'].get('FIRED', 0) > 0 and r['decisions'].get('NO_MATCH', 0) > 0
+        assert sum(r['decisions'].values()) == 300
+    json.dumps(report)
+    assert keystroke_bench.percentile([1, 2, 3, 4], 50) == 2
+    assert 'p50' in keystroke_bench.format_table(report, report)
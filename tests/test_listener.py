@@ -0,0 +1,124 @@
+import sys
+import time
+import types
+import threading
+
+class FakeRunLoop:
+    def __init__(self):
+        self.wake = threading.Event()
+        self.stopped = False
+        self.blocks = []
+        self.sources = set()
+
+def fake_quartz():
+    """Минимальный Quartz для жизненного цикла слушателя: run loop на threading.Event."""
+    q = types.SimpleNamespace()
+    q.kCGEventKeyDown = 10
+    q.kCGHIDEventTap = q.kCGHeadInsertEventTap = q.kCGEventTapOptionDefault = 0
+    q.kCFRunLoopCommonModes = q.kCFRunLoopDefaultMode = 'mode'
+    q.taps = []
+    # Имена, которые hotkey_engine импортирует из Quartz на уровне модуля
+    for name in ('CGMainDisplayID', 'CGEventPost', 'CGEventCreateKeyboardEvent', 'CGEventSetFlags'):
+        setattr(q, name, lambda *args: None)
+    q.kCGEventFlagMaskShift, q.kCGEventFlagMaskControl = 0x20000, 0x40000
+    q.kCGEventFlagMaskAlternate, q.kCGEventFlagMaskCommand = 0x80000, 0x100000
+    q.CGEventMaskBit = lambda t: 1 << t
+    def tap_create(*args):
+        tap = types.SimpleNamespace(enabled=False, valid=True)
+        q.taps.append(tap)
+        return tap
+    q.CGEventTapCreate = tap_create
+    q.CGEventTapEnable = lambda tap, on: setattr(tap, 'enabled', on)
+    q.CGEventTapIsEnabled = lambda tap: tap.enabled
+    q.CFMachPortInvalidate = lambda tap: setattr(tap, 'valid', False)
+    q.CFMachPortCreateRunLoopSource = lambda alloc, tap, order: ('source', id(tap))
+    local = threading.local()
+    def current():
+        if not hasattr(local, 'loop'):
+            local.loop = FakeRunLoop()
+        return local.loop
+    q.CFRunLoopGetCurrent = current
+    q.CFRunLoopAddSource = lambda loop, src, mode: loop.sources.add(src)
+    q.CFRunLoopRemoveSource = lambda loop, src, mode: loop.sources.discard(src)
+    q.kCFRunLoopRunFinished, q.kCFRunLoopRunStopped, q.kCFRunLoopRunTimedOut = 1, 2, 3
+    q.kCGEventTapDisabledByTimeout, q.kCGEventTapDisabledByUserInput = 0xFFFFFFFE, 0xFFFFFFFF
+    def run_in_mode(mode, seconds, once):
+        # Спит до CFRunLoopWakeUp/CFRunLoopStop; выполняет поставленные блоки
+        loop = current()
+        deadline = time.monotonic() + min(seconds, 5.0)
+        while True:
+            if not loop.wake.wait(max(0.0, deadline - time.monotonic())):
+                return q.kCFRunLoopRunTimedOut
+            loop.wake.clear()
+            while loop.blocks:
+                loop.blocks.pop(0)()
+            if loop.stopped:
+                loop.stopped = False
+                return q.kCFRunLoopRunStopped
+    q.CFRunLoopRunInMode = run_in_mode
+    def stop(loop):
+        loop.stopped = True
+        loop.wake.set()
+    q.CFRunLoopStop = stop
+    q.CFRunLoopPerformBlock = lambda loop, mode, block: loop.blocks.append(block)
+    q.CFRunLoopWakeUp = lambda loop: loop.wake.set()
+    return q
+
+def test_restart_is_event_driven_and_reports_downtime(reload_engine, monkeypatch):
+    quartz = fake_quartz()
+    monkeypatch.setitem(sys.modules, 'Quartz', quartz)
+    eng = reload_engine()
+    try:
+        assert eng.start_quartz_hotkey_listener() is True
+        assert eng.is_hotkey_listener_running()
+        first = quartz.taps[0]
+        assert first.enabled
+        downtime = eng.restart_quartz_hotkey_listener()
+        assert downtime is not None and downtime < 0.5
+        # Старый tap разобран до создания нового
+        assert not first.valid and not first.enabled
+        assert len(quartz.taps) == 2 and quartz.taps[1].enabled
+        stats = eng.get_listener_stats()
+        assert stats['restarts'] == 1 and stats['last_downtime'] == downtime
+        t0 = time.monotonic()
+        eng.stop_quartz_hotkey_listener()
+        assert time.monotonic() - t0 < 0.5
+        assert not eng.is_hotkey_listener_running()
+        assert not quartz.taps[1].valid
+    finally:
+        eng.stop_quartz_hotkey_listener()
+        eng.stop_config_watcher()
+
+def test_start_reports_tap_creation_failure(reload_engine, monkeypatch):
+    quartz = fake_quartz()
+    quartz.CGEventTapCreate = lambda *args: None
+    monkeypatch.setitem(sys.modules, 'Quartz', quartz)
+    eng = reload_engine()
+    try:
+        assert eng.start_quartz_hotkey_listener() is False
+        assert eng.restart_quartz_hotkey_listener() is None
+    finally:
+        eng.stop_quartz_hotkey_listener()
+        eng.stop_config_watcher()
+
+def test_idle_listener_does_not_wake_up(reload_engine, monkeypatch):
+    quartz = fake_quartz()
+    monkeypatch.setitem(sys.modules, 'Quartz', quartz)
+    eng = reload_engine()
+    try:
+        assert eng.start_quartz_hotkey_listener() is True
+        time.sleep(0.3)
+        assert eng.get_listener_stats()['wakeups'] == 0
+        # Отключение tap и команда перепроверки будят поток ровно по разу
+        quartz.taps[0].enabled = False
+        assert eng.reconfigure_hotkey_listener() is True
+        for _ in range(100):
+            if quartz.taps[0].enabled:
+                break
+            time.sleep(0.01)
+        assert quartz.taps[0].enabled
+        stats = eng.get_listener_stats()
+        assert stats['wakeups'] == 1 and stats['wakeups_per_sec'] < 10
+    finally:
+        eng.stop_quartz_hotkey_listener()
+        eng.stop_config_watcher()
@@ -0,0 +1,40 @@
+import modifiers
+from modifiers import Mod, parse_mods, mask_to_names, matches, overlaps
+
+def test_parse_is_case_insensitive_and_accepts_aliases():
+    assert parse_mods(['Cmd', 'Shift']) == parse_mods(['shift', 'command'])
+    assert parse_mods(['⌥']) == int(Mod.ALT)
+    assert parse_mods(['Hyper']) is None
+    assert parse_mods(['Hyper', 'cmd'], ignore_unknown=True) == int(Mod.CMD)
+
+def test_names_roundtrip_in_canonical_order():
+    mask = parse_mods(['cmd', 'ctrl', 'shift', 'alt'])
+    assert mask_to_names(mask) == ['Ctrl', 'Alt', 'Shift', 'Cmd']
+    assert mask_to_names(parse_mods(['RAlt', 'Fn'])) == ['RAlt', 'Fn']
+    assert parse_mods(mask_to_names(parse_mods(['LCmd', 'Shift']))) == parse_mods(['LCmd', 'Shift'])
+
+def test_cg_flags_are_a_single_and():
+    # Cmd (левый) + Shift + CapsLock + NumericPad(не модификатор)
+    flags = 0x100000 | 0x8 | 0x20000 | 0x10000 | 0x200000
+    mask = modifiers.from_cg_flags(flags)
+    assert mask == int(Mod.CMD | Mod.LCMD | Mod.SHIFT | Mod.CAPSLOCK)
+
+def test_matching_ignores_unrequested_fn_and_capslock():
+    cmd = parse_mods(['Cmd'])
+    event = int(Mod.CMD | Mod.FN | Mod.CAPSLOCK)
+    assert matches(event, cmd, strict=True)
+    assert not matches(int(Mod.CMD | Mod.ALT), cmd, strict=True)
+    assert matches(int(Mod.CMD | Mod.ALT), cmd, strict=False)
+    assert not matches(int(Mod.CMD | Mod.RCMD), parse_mods(['LCmd']), strict=False)
+
+def test_overlaps():
+    a = parse_mods(['Cmd'])
+    b = parse_mods(['Cmd', 'Shift'])
+    assert overlaps(a, b, strict=False)
+    assert not overlaps(a, b, strict=True)
+    assert not overlaps(parse_mods(['Alt']), b, strict=False)
+    # Строгий режим: сторона и Fn не разделяют правила — событие a | b запускает оба
+    for other in (parse_mods(['LCmd']), parse_mods(['Cmd', 'Fn']), parse_mods(['LCmd', 'RCmd'])):
+        assert matches(a | other, a, strict=True) and matches(a | other, other, strict=True)
+        assert overlaps(a, other, strict=True) and overlaps(other, a, strict=True)
+    assert not overlaps(parse_mods(['LCmd']), parse_mods(['LCmd', 'Shift']), strict=True)
@@ -0,0 +1,28 @@
+import time
+
+from repeat_gate import RepeatGate
+
+def test_state_is_bounded_lru():
+    gate = RepeatGate(max_entries=3)
+    for key in 'abcd':
+        assert gate.allow(key, autorepeat=False, now=0.0)
+    assert len(gate) == 3
+    # 'a' вытеснен — его окно забыто, а 'd' ещё помнится
+    assert gate.allow('a', now=0.1) is True
+    assert gate.allow('d', now=0.1) is False
+
+def test_uses_monotonic_clock_by_default():
+    assert RepeatGate()._clock is time.monotonic
+
+def test_injected_clock_drives_legacy_window():
+    ticks = iter([10.0, 10.1, 10.6])
+    gate = RepeatGate(legacy_window=0.4, clock=lambda: next(ticks))
+    assert gate.allow('k') is True
+    assert gate.allow('k') is False
+    assert gate.allow('k') is True
+
+def test_rule_policy_fields_parsed():
+    from rules import Rule
+    rule = Rule.from_dict({'id': 'x', 'repeat': 'throttle', 'repeat_rate': '8'})
+    assert rule.repeat == 'throttle' and rule.repeat_rate == 8.0
+    assert Rule.from_dict({'id': 'y', 'repeat': 'bogus'}).repeat == 'once'
@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import time
+import random
+import importlib
+
+import rule_journal
+
+def journal_engine(reload_engine, hotkeys=(), delay=60.0):
+    eng = reload_engine(hotkeys)
+    eng.SETTINGS_PATH = os.path.join(os.path.dirname(eng.HOTKEYS_FILE), 'settings.json')
+    with open(eng.SETTINGS_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'hotkeys_storage': 'journal'}, f)
+    eng.get_snapshot()
+    eng._load_general_settings(force=True)
+    eng._journal.delay = delay
+    return eng
+
+def restart(eng):
+    """Новый процесс поверх тех же файлов (без сворачивания — как после падения)."""
+    eng._journal.stop()
+    sys.modules.pop('hotkey_engine', None)
+    import hotkey_engine
+    importlib.reload(hotkey_engine)
+    return hotkey_engine
+
+HOTKEYS = [{'id': f'h{i}', 'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': i}, 'action': f'run {i}'}
+           for i in range(50)]
+
+def test_diff_and_apply_roundtrip():
+    rnd = random.Random(5)
+    old = [dict(h) for h in HOTKEYS]
+    for _ in range(200):
+        new = [dict(h) for h in old if rnd.random() > 0.05]
+        for h in new:
+            if rnd.random() < 0.1:
+                h['enabled'] = not h.get('enabled', True)
+            if rnd.random() < 0.05:
+                h['action'] = f'run {rnd.random()}'
+        if rnd.random() < 0.3:
+            new.append({'id': f'n{rnd.random()}', 'type': 'keyboard', 'action': 'x'})
+        records = rule_journal.diff_hotkeys(old, new)
+        assert records is not None
+        assert rule_journal.apply_records(old, records) == new
+        # Повторное применение (журнал не сброшен после сворачивания) ничего не меняет
+        assert rule_journal.apply_records(new, records) == new
+        old = new
+    assert rule_journal.diff_hotkeys(old, old[::-1]) is None
+
+def test_toggle_appends_small_record_and_survives_crash(reload_engine):
+    eng = journal_engine(reload_engine, HOTKEYS)
+    json_before = open(eng.HOTKEYS_FILE, 'rb').read()
+    journal_size = os.path.getsize(eng._journal.path)
+    hs = eng.load_hotkeys()
+    hs[3]['enabled'] = False
+    eng.save_hotkeys(hs)
+    assert open(eng.HOTKEYS_FILE, 'rb').read() == json_before  # JSON не переписан
+    assert os.path.getsize(eng._journal.path) - journal_size < 100
+    assert eng.get_snapshot().rules[3].enabled is False
+    hs = eng.load_hotkeys()
+    del hs[0]
+    hs.append({'id': 'new', 'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 99}, 'action': 'run new'})
+    eng.save_hotkeys(hs)
+    # Недописанная запись в конце журнала (падение во время записи) отбрасывается
+    with open(eng._journal.path, 'ab') as f:
+        f.write(b'\x40\x00\x00\x00garbage')
+    eng = restart(eng)
+    snap = eng.get_snapshot()
+    assert [r.id for r in snap.rules][:3] == ['h1', 'h2', 'h3'] and snap.rules[-1].id == 'new'
+    assert snap.by_id['h3'].enabled is False
+    # Восстановленное состояние сразу свёрнуто в JSON
+    with open(eng.HOTKEYS_FILE, 'r', encoding='utf-8') as f:
+        assert [h['id'] for h in json.load(f)] == [r.id for r in snap.rules]
+
+def test_background_compaction_and_stale_journal(reload_engine):
+    eng = journal_engine(reload_engine, HOTKEYS, delay=0.05)
+    hs = eng.load_hotkeys()
+    hs[1]['action'] = 'run compacted'
+    eng.save_hotkeys(hs)
+    for _ in range(200):
+        if eng._journal.pending == 0:
+            break
+        time.sleep(0.01)
+    assert eng._journal.pending == 0 and eng._journal.compactions == 1
+    with open(eng.HOTKEYS_FILE, 'r', encoding='utf-8') as f:
+        assert json.load(f)[1]['action'] == 'run compacted'
+    # Журнал относится к старому содержимому JSON (JSON заменён, журнал не сброшен) — игнорируется
+    eng._journal.delay = 60.0
+    hs[2]['action'] = 'run journaled'
+    eng.save_hotkeys(hs)
+    with open(eng.HOTKEYS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(HOTKEYS, f)
+    eng = restart(eng)
+    assert eng.get_snapshot().rules[2].action == 'run 2'
+    assert not os.path.exists(rule_journal.journal_path_for(eng.HOTKEYS_FILE))
@@ -0,0 +1,127 @@
+import dataclasses
+import pytest
+
+from rules import Rule, RuleSnapshot, RuleTable
+from frontmost_app import AppInfo
+from modifiers import parse_mods
+
+def test_rule_is_frozen_and_roundtrips_unknown_fields():
+    d = {'id': 'a', 'type': 'keyboard', 'combo': {'mods': ['cmd'], 'vk': 12, 'disp': 'Cmd + Q'},
+         'action': 'run 1', 'note': 'x'}
+    rule = Rule.from_dict(d)
+    assert rule.mods == parse_mods(['Cmd']) and rule.vk == 12 and rule.disp == 'Cmd + Q'
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        rule.action = 'run 2'
+    assert not hasattr(rule, '__dict__')
+    out = rule.to_dict()
+    assert out == d
+    out['combo']['mods'].append('shift')
+    assert rule.to_dict()['combo']['mods'] == ['cmd']
+
+def test_snapshot_indexes_enabled_gestures():
+    snap = RuleSnapshot.build(3, [
+        {'id': 'g1', 'type': 'trackpad', 'gesture': 'Тап тремя пальцами', 'action': 'run 1'},
+        {'id': 'g2', 'type': 'trackpad', 'gesture': 'Тап тремя пальцами', 'action': 'run 2', 'enabled': False},
+    ])
+    assert snap.generation == 3
+    assert [r.id for r in snap.gestures['Тап тремя пальцами']] == ['g1']
+    assert snap.by_id['g2'].enabled is False
+
+def test_save_publishes_snapshot_and_old_readers_keep_theirs(reload_engine):
+    eng = reload_engine()
+    before = eng.get_snapshot()
+    eng.save_hotkeys([{'type': 'trackpad', 'gesture': 'Тап двумя пальцами', 'action': 'open example.com'}])
+    after = eng.get_snapshot()
+    assert after is not before and after.generation == before.generation + 1
+    assert before.rules == ()
+    assert len(after.rules) == 1 and after.rules[0].id
+
+def test_app_table_layers_app_rules_over_global():
+    snap = RuleSnapshot.build(1, [
+        {'id': 'g', 'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 12}, 'action': 'run g'},
+        {'id': 's', 'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 12}, 'action': 'run s',
+         'scope': 'app', 'app': 'Safari', 'bundle_id': 'com.apple.Safari'},
+        {'id': 'tg', 'type': 'trackpad', 'gesture': 'Тап тремя пальцами', 'action': 'run tg'},
+        {'id': 'ts', 'type': 'trackpad', 'gesture': 'Тап тремя пальцами', 'action': 'run ts',
+         'scope': 'app', 'app': 'Safari'},
+    ])
+    cmd = parse_mods(['Cmd'])
+    assert [r.id for r in snap.table_for(None).keyboard.lookup(12, cmd, True)] == ['g']
+    safari = snap.table_for(AppInfo('Safari', 'com.apple.Safari', 1))
+    assert [r.id for r in safari.keyboard.lookup(12, cmd, True)] == ['s', 'g']
+    assert [r.id for r in safari.gestures['Тап тремя пальцами']] == ['ts']
+    other = snap.table_for(AppInfo('Terminal', 'com.apple.Terminal', 2))
+    assert other is snap.global_table
+    # Таблица кэшируется: повторная активация не пересобирает индекс
+    assert snap.table_for(AppInfo('Safari', 'com.apple.Safari', 3)) is safari
+
+def test_engine_switches_table_on_app_activation(reload_engine):
+    eng = reload_engine()
+    eng.save_hotkeys([
+        {'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 1}, 'action': 'run 1', 'scope': 'app',
+         'app': 'Terminal', 'bundle_id': 'com.apple.Terminal'},
+    ])
+    cmd = parse_mods(['Cmd'])
+    eng._on_frontmost_app_changed(AppInfo('Safari', 'com.apple.Safari', 1))
+    assert eng._active_table.keyboard.lookup(1, cmd, False) == ()
+    eng._on_frontmost_app_changed(AppInfo('Terminal', 'com.apple.Terminal', 2))
+    assert [r.action for r in eng._active_table.keyboard.lookup(1, cmd, False)] == ['run 1']
+    # Новый снимок сразу публикует таблицу для текущего приложения
+    eng.save_hotkeys([])
+    assert eng._active_table.keyboard.lookup(1, cmd, False) == ()
+
+def _table_state(table):
+    ids = lambda buckets: {k: tuple(r.id for r in v) for k, v in buckets.items()}
+    kb = table.keyboard
+    return (ids(kb._strict), ids(kb._loose), kb._extra, kb.size, ids(table.gestures),
+            [r.id for r in table.sequences.rules], [r.id for r in table.app_rules])
+
+def _random_rule(rng, rule_id):
+    mods = rng.sample(['Cmd', 'Shift', 'Alt', 'Ctrl', 'Fn'], rng.randint(0, 3))
+    if rng.random() < 0.2:
+        d = {'id': rule_id, 'type': 'trackpad', 'gesture': rng.choice(['Тап', 'Свайп']), 'action': f'run {rule_id}'}
+    elif rng.random() < 0.2:
+        d = {'id': rule_id, 'type': 'keyboard', 'action': f'run {rule_id}',
+             'sequence': [{'mods': mods, 'vk': rng.randint(0, 3)} for _ in range(2)]}
+    else:
+        d = {'id': rule_id, 'type': 'keyboard', 'combo': {'mods': mods, 'vk': rng.randint(0, 3)},
+             'action': f'run {rule_id}'}
+    if rng.random() < 0.3:
+        d.update(scope='app', app=rng.choice(['Safari', 'Terminal']))
+    if rng.random() < 0.2:
+        d['enabled'] = False
+    return d
+
+def test_patched_snapshot_matches_full_build():
+    import random
+    rng = random.Random(7)
+    current = [_random_rule(rng, f'r{i}') for i in range(60)]
+    snap = RuleSnapshot.build(1, current)
+    apps = [AppInfo('Safari', 'com.apple.Safari', 1), AppInfo('Terminal', 'com.apple.Terminal', 2), None]
+    for step in range(60):
+        ids = [d['id'] for d in current]
+        deletes = rng.sample(ids, rng.randint(0, 2))
+        # Правки на месте, новые правила и повторное добавление удалённого id
+        upserts = [_random_rule(rng, i) for i in rng.sample(ids, rng.randint(0, 3))]
+        upserts += [_random_rule(rng, f'n{step}_{k}') for k in range(rng.randint(0, 2))]
+        if deletes and rng.random() < 0.3:
+            upserts.append(_random_rule(rng, deletes[0]))
+        current = [d for d in current if d['id'] not in deletes]
+        for d in upserts:
+            pos = next((i for i, c in enumerate(current) if c['id'] == d['id']), None)
+            if pos is None:
+                current.append(d)
+            else:
+                current[pos] = d
+        snap = snap.patched(snap.generation + 1, [Rule.from_dict(d) for d in upserts], deletes)
+        full = RuleSnapshot.build(snap.generation, current)
+        assert [r.id for r in snap.rules] == [r.id for r in full.rules]
+        assert snap.positions == full.positions and set(snap.by_id) == set(full.by_id)
+        assert [r.id for r in snap.app_rules] == [r.id for r in full.app_rules]
+        assert _table_state(snap.global_table) == _table_state(full.global_table)
+        global_rules = tuple(r for r in full.rules if not r.is_app_scoped)
+        for app in apps:
+            assert _table_state(snap.table_for(app)) == _table_state(full.table_for(app))
+            if app is not None:
+                matched = tuple(r for r in full.app_rules if r.matches_app(app))
+                assert _table_state(snap.table_for(app)) == _table_state(RuleTable.build(global_rules, matched))
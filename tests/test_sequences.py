@@ -0,0 +1,98 @@
+import random
+
+from rules import RuleSnapshot
+from modifiers import parse_mods
+from hotkey_sequences import SequenceMatcher, NONE, PENDING, FIRED
+
+CMD = parse_mods(['Cmd'])
+SHIFT = parse_mods(['Shift'])
+
+def seq(rule_id, *strokes, timeout=1.0, **extra):
+    d = {'id': rule_id, 'type': 'keyboard', 'action': f'run {rule_id}', 'sequence_timeout': timeout,
+         'sequence': [{'mods': mods, 'vk': vk, 'disp': f'{"+".join(mods)} {vk}'} for mods, vk in strokes]}
+    d.update(extra)
+    return d
+
+def test_sequence_fires_and_times_out():
+    snap = RuleSnapshot.build(1, [
+        seq('kc', (['Cmd'], 40), (['Cmd'], 8)),
+        seq('kkx', (['Cmd'], 40), (['Cmd'], 40), ([], 7), timeout=0.5),
+    ])
+    trie = snap.global_table.sequences
+    assert trie.size == 2
+    m = SequenceMatcher()
+    assert m.feed(trie, 40, CMD, True, 0.0) == (PENDING, None)
+    state, rule = m.feed(trie, 8, CMD, True, 0.3)
+    assert state == FIRED and rule.id == 'kc' and not m.pending
+    # Пауза больше таймаута — набор сброшен, второй удар сам по себе ничего не значит
+    assert m.feed(trie, 40, CMD, True, 1.0)[0] == PENDING
+    assert m.feed(trie, 8, CMD, True, 2.5) == (NONE, None)
+    # Три удара; у второго шага таймаут своего правила
+    assert m.feed(trie, 40, CMD, True, 3.0)[0] == PENDING
+    assert m.feed(trie, 40, CMD, True, 3.2)[0] == PENDING
+    assert m.feed(trie, 7, 0, True, 3.8) == (NONE, None)
+    m.feed(trie, 40, CMD, True, 4.0); m.feed(trie, 40, CMD, True, 4.1)
+    assert m.feed(trie, 7, 0, True, 4.3)[1].id == 'kkx'
+
+def test_sequence_mismatch_restarts_and_autorepeat_is_ignored():
+    trie = RuleSnapshot.build(1, [seq('kc', (['Cmd'], 40), (['Cmd'], 8))]).global_table.sequences
+    m = SequenceMatcher()
+    assert m.feed(trie, 40, CMD, True, 0.0)[0] == PENDING
+    # Удержание первого удара не сбивает набор
+    assert m.feed(trie, 40, CMD, True, 0.1, autorepeat=True) == (PENDING, None)
+    # Чужое нажатие сбрасывает набор, но само может начать новый
+    assert m.feed(trie, 9, 0, True, 0.2) == (NONE, None)
+    assert m.feed(trie, 8, CMD, True, 0.3) == (NONE, None)
+    assert m.feed(trie, 40, CMD, True, 0.4)[0] == PENDING
+    assert m.feed(trie, 40, CMD, True, 0.5)[0] == PENDING
+    assert m.feed(trie, 8, CMD, True, 0.6)[1].id == 'kc'
+    # Нестрогий режим: лишний Shift допускается, строгий — нет
+    assert m.feed(trie, 40, CMD | SHIFT, True, 1.0) == (NONE, None)
+    assert m.feed(trie, 40, CMD | SHIFT, False, 1.1)[0] == PENDING
+    assert m.feed(trie, 8, CMD, False, 1.2)[1].id == 'kc'
+    # Смена таблицы (другое приложение, новый конфиг) сбрасывает набор
+    m.feed(trie, 40, CMD, True, 2.0)
+    other = RuleSnapshot.build(2, [seq('kc', (['Cmd'], 40), (['Cmd'], 8))]).global_table.sequences
+    assert m.feed(other, 8, CMD, True, 2.1) == (NONE, None)
+
+def test_prefix_conflicts(reload_engine):
+    eng = reload_engine()
+    single = {'id': 's', 'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 40}, 'scope': 'global'}
+    chord = seq('kc', (['Cmd'], 40), (['Cmd'], 8), scope='global')
+    longer = seq('kcx', (['Cmd'], 40), (['Cmd'], 8), ([], 7), scope='global')
+    other = seq('kd', (['Cmd'], 40), (['Cmd'], 2), scope='global')
+    assert eng.hotkey_conflicts(chord, [single], strict=True) is single
+    assert eng.hotkey_conflicts(longer, [chord], strict=True) is chord
+    assert eng.hotkey_conflicts(other, [chord], strict=True) is None
+    wide = seq('kcs', (['Cmd', 'Shift'], 40), (['Cmd'], 8), scope='global')
+    assert eng.hotkey_conflicts(wide, [chord], strict=True) is None
+    assert eng.hotkey_conflicts(wide, [chord], strict=False) is chord
+    # Строгий режим: LCmd+K и Fn+Cmd+K перекрывают одиночный Cmd+K — оба срабатывают на LCmd+K
+    for mods in (['LCmd'], ['Cmd', 'Fn']):
+        side = seq('lkc', (mods, 40), (['Cmd'], 8), scope='global')
+        assert eng.hotkey_conflicts(side, [single], strict=True) is single
+        assert eng.hotkey_conflicts(single, [side], strict=True) is side
+
+def test_analyzer_matches_reference_with_sequences(reload_engine):
+    from conflict_analyzer import analyze_conflicts
+    eng = reload_engine()
+    rnd = random.Random(13)
+    names = ['Cmd', 'Shift', 'Alt']
+    pack = []
+    for i in range(90):
+        scope = 'global' if rnd.random() < 0.4 else 'app'
+        extra = {'scope': scope, 'app': rnd.choice(['Safari', 'Xcode']) if scope == 'app' else ''}
+        strokes = [([m for m in names if rnd.random() < 0.3], rnd.randrange(3)) for _ in range(rnd.randrange(1, 4))]
+        if len(strokes) == 1:
+            mods, vk = strokes[0]
+            pack.append(dict(extra, id=str(i), type='keyboard', combo={'mods': mods, 'vk': vk}))
+        else:
+            pack.append(seq(str(i), *strokes, **extra))
+    for strict in (True, False):
+        report = analyze_conflicts(pack, strict=strict)
+        expected = {(i, j) for j in range(len(pack)) for i in range(j)
+                    if eng.hotkey_conflicts(pack[j], [pack[i]], strict=strict) is not None}
+        assert set(report.pairs) == expected and len(report.pairs) == len(expected)
+        group_of = {i: n for n, g in enumerate(report.groups) for i in g.members}
+        assert all(group_of[i] == group_of[j] for i, j in expected)
+        assert set(group_of) == {i for pair in expected for i in pair}
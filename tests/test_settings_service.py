@@ -0,0 +1,103 @@
+import os
+import json
+import time
+
+import settings_service
+from settings_service import SettingsService
+
+def write_settings(path, data):
+    tmp = str(path) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def wait_for(cond, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.01)
+    return cond()
+
+def test_cached_reads_and_typed_accessors(tmp_path):
+    path = tmp_path / 'settings.json'
+    write_settings(path, {'strict_mod_match': True, 'gesture_debounce': 0.4, 'gesture_release_gap': 7,
+                          'hotkeys_storage': 'bogus', 'window_size': [800, 600]})
+    svc = SettingsService(str(path))
+    reads = []
+    orig = svc._read_file
+    svc._read_file = lambda: reads.append(1) or orig()
+    for _ in range(100):
+        assert svc.get_bool('strict_mod_match') is True
+        assert svc.get_float('gesture_debounce', 0.6, 0, 3) == 0.4
+    assert len(reads) == 1
+    assert svc.get_float('gesture_release_gap', 0.05, 0, 0.5) == 0.05
+    assert svc.get_str('hotkeys_storage', choices=('json', 'journal')) == 'json'
+    assert svc.get_size('window_size') == (800, 600)
+    assert svc.get_bool('autostart') is False and svc.get('missing', 3) == 3
+    # Без изменения файла reload его не читает
+    assert svc.reload() == {} and len(reads) == 1
+
+def test_writes_are_coalesced_and_keep_foreign_keys(tmp_path):
+    path = tmp_path / 'settings.json'
+    write_settings(path, {'hotkeys_storage': 'journal'})
+    svc = SettingsService(str(path), write_delay=0.1)
+    try:
+        for i in range(300):  # перетаскивание края окна
+            svc.set('window_size', [400 + i, 300])
+        assert svc.get_size('window_size') == (699, 300) and svc.pending
+        # Ключ, изменённый в файле извне до записи, не затирается
+        write_settings(path, {'hotkeys_storage': 'sqlite', 'other': 1})
+        assert wait_for(lambda: not svc.pending)
+        assert svc.writes == 1
+        with open(path, 'r', encoding='utf-8') as f:
+            assert json.load(f) == {'hotkeys_storage': 'sqlite', 'other': 1, 'window_size': [699, 300]}
+        assert not svc.set('window_size', [699, 300])  # без изменений — без записи
+        svc.set('autostart', True)
+    finally:
+        svc.close()
+    assert svc.writes == 2
+    with open(path, 'r', encoding='utf-8') as f:
+        assert json.load(f)['autostart'] is True
+
+def test_subscriptions_receive_local_and_external_changes(tmp_path):
+    path = tmp_path / 'settings.json'
+    svc = SettingsService(str(path), write_delay=60.0)
+    got, everything = [], []
+    unsubscribe = svc.subscribe(got.append, keys=('strict_mod_match',))
+    svc.subscribe(everything.append)
+    svc.update(strict_mod_match=True, window_size=[1, 2])
+    assert got == [{'strict_mod_match': True}]
+    assert everything == [{'strict_mod_match': True, 'window_size': [1, 2]}]
+    svc.set('window_size', [3, 4])
+    assert len(got) == 1
+    svc.close()
+
+    write_settings(path, {'strict_mod_match': False, 'window_size': [3, 4]})
+    assert svc.reload() == {'strict_mod_match': False}
+    assert got[-1] == {'strict_mod_match': False}
+    unsubscribe()
+    write_settings(path, {'strict_mod_match': True})
+    svc.reload()
+    assert got[-1] == {'strict_mod_match': False}
+
+def test_engine_gets_changes_pushed_without_file_reads(reload_engine, tmp_path):
+    eng = reload_engine()
+    eng.SETTINGS_PATH = str(tmp_path / 'settings.json')
+    write_settings(eng.SETTINGS_PATH, {'strict_mod_match': False})
+    assert eng.get_strict_mods() is False
+    settings = settings_service.get_settings(eng.SETTINGS_PATH)
+    settings.write_delay = 60.0
+    settings.set('strict_mod_match', True)
+    # Движок получил значение подпиской; файл ещё не переписан
+    assert eng._strict_mods is True
+    with open(eng.SETTINGS_PATH, 'r', encoding='utf-8') as f:
+        assert json.load(f) == {'strict_mod_match': False}
+    settings.set('hotkeys_storage', 'journal')
+    assert eng._journal is not None
+    settings.set('hotkeys_storage', 'json')
+    assert eng._journal is None
+    settings.close()
+    with open(eng.SETTINGS_PATH, 'r', encoding='utf-8') as f:
+        assert json.load(f) == {'strict_mod_match': True, 'hotkeys_storage': 'json'}
+    eng._settings_unsubscribe()
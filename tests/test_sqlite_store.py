@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import importlib
+
+import sqlite_rule_store
+from rules import Rule
+from sqlite_rule_store import SqliteRuleStore
+
+def sqlite_engine(reload_engine, hotkeys=()):
+    eng = reload_engine(hotkeys)
+    eng.SETTINGS_PATH = os.path.join(os.path.dirname(eng.HOTKEYS_FILE), 'settings.json')
+    with open(eng.SETTINGS_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'hotkeys_storage': 'sqlite'}, f)
+    eng.get_snapshot()
+    return eng
+
+def restart(eng):
+    """Новый процесс поверх тех же файлов."""
+    eng._settings_unsubscribe()  # старый «процесс» больше не получает изменения настроек
+    sys.modules.pop('hotkey_engine', None)
+    import hotkey_engine
+    importlib.reload(hotkey_engine)
+    hotkey_engine.SETTINGS_PATH = eng.SETTINGS_PATH
+    return hotkey_engine
+
+HOTKEYS = [{'id': f'h{i}', 'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': i}, 'action': f'run {i}'}
+           for i in range(20)] + [
+    {'id': 'g1', 'type': 'trackpad', 'gesture': 'swipe_left', 'action': 'a', 'scope': 'app', 'app': 'Safari'},
+    {'id': 'k1', 'type': 'keyboard', 'combo': {'mods': ['Cmd', 'Shift'], 'vk': 3}, 'action': 'b',
+     'scope': 'app', 'app': 'Safari', 'enabled': False},
+]
+
+def test_store_crud_and_indexed_queries(tmp_path):
+    store = SqliteRuleStore(str(tmp_path / 'rules.sqlite'))
+    store.replace_all(HOTKEYS)
+    assert len(store) == len(HOTKEYS)
+    assert store.load_all() == HOTKEYS
+    assert store.get('h5') == HOTKEYS[5]
+    assert store.get('nope') is None
+    assert [hk['id'] for hk in store.list('trackpad')] == ['g1']
+    assert [hk['id'] for hk in store.find_keyboard(3)] == ['h3', 'k1']
+    mask = Rule.from_dict(HOTKEYS[3]).mods
+    assert [hk['id'] for hk in store.find_keyboard(3, mask)] == ['h3']
+    assert [hk['id'] for hk in store.find_gesture('swipe_left')] == ['g1']
+    assert [hk['id'] for hk in store.for_app('Safari')] == ['g1', 'k1']
+
+    # Изменение сохраняет позицию, новое правило — в конец
+    store.upsert({**HOTKEYS[0], 'action': 'changed'})
+    store.upsert({'id': 'new', 'type': 'keyboard', 'combo': {'mods': [], 'vk': 99}, 'action': 'c'})
+    store.set_enabled('h1', False)
+    store.delete('h2')
+    ids = [hk['id'] for hk in store.load_all()]
+    assert ids[0] == 'h0' and ids[-1] == 'new' and 'h2' not in ids
+    assert store.get('h0')['action'] == 'changed'
+    assert store.get('h1')['enabled'] is False
+    store.close()
+
+    # Данные переживают повторное открытие
+    store = SqliteRuleStore(str(tmp_path / 'rules.sqlite'))
+    assert [hk['id'] for hk in store.load_all()] == ids
+    store.close()
+
+def test_cli_import_export_roundtrip(tmp_path, capsys):
+    src = tmp_path / 'hotkeys.json'
+    src.write_text(json.dumps(HOTKEYS + [{'type': 'keyboard', 'action': 'без id'}]), encoding='utf-8')
+    db = str(tmp_path / 'rules.sqlite')
+    assert sqlite_rule_store.main(['import', str(src), db]) == 0
+    out = tmp_path / 'out.json'
+    assert sqlite_rule_store.main(['export', db, str(out)]) == 0
+    exported = json.loads(out.read_text(encoding='utf-8'))
+    # Правило без id не теряется — ему назначается новый
+    assert exported[:-1] == HOTKEYS and exported[-1]['action'] == 'без id' and len(exported[-1]['id']) == 32
+    bad = tmp_path / 'bad.json'
+    bad.write_text(json.dumps(HOTKEYS + [1, 'x']), encoding='utf-8')
+    assert sqlite_rule_store.main(['import', str(bad), db]) == 2
+    assert '2 записей' in capsys.readouterr().err
+    assert sqlite_rule_store.main(['export', db, str(out)]) == 0
+    assert json.loads(out.read_text(encoding='utf-8')) == exported
+    assert sqlite_rule_store.main(['export', str(tmp_path / 'missing.sqlite'), str(out)]) == 2
+    assert not os.path.exists(tmp_path / 'missing.sqlite')
+
+def test_engine_sqlite_mode_updates_single_rows(reload_engine):
+    eng = sqlite_engine(reload_engine, HOTKEYS)
+    db_path = sqlite_rule_store.sqlite_path_for(eng.HOTKEYS_FILE)
+    assert eng._sqlite_store is not None and eng._sqlite_store.path == db_path
+    json_before = open(eng.HOTKEYS_FILE, 'rb').read()
+
+    repo = eng.get_rule_repository()
+    assert repo.get('h4') == HOTKEYS[4]
+    assert repo.set_enabled('h4', False)
+    repo.add({'id': 'added', 'type': 'trackpad', 'gesture': 'tap', 'action': 'x'})
+    # JSON не переписывается, снимок и база согласованы
+    assert open(eng.HOTKEYS_FILE, 'rb').read() == json_before
+    assert eng.get_snapshot().by_id['h4'].enabled is False
+    assert eng.load_hotkeys() == eng._sqlite_store.load_all()
+    assert [hk['id'] for hk in repo.list('trackpad')] == ['g1', 'added']
+    expected = eng.load_hotkeys()
+
+    # Перезапуск: правила берутся из базы, а не из устаревшего JSON
+    eng = restart(eng)
+    assert eng.load_hotkeys() == expected
+    assert eng._sqlite_store is not None
+
+    # Обратно в JSON: экспорт, база удаляется
+    with open(eng.SETTINGS_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'hotkeys_storage': 'json'}, f)
+    eng._load_general_settings(force=True)
+    assert eng._sqlite_store is None
+    assert not os.path.exists(db_path)
+    with open(eng.HOTKEYS_FILE, 'r', encoding='utf-8') as f:
+        assert json.load(f) == expected
+    assert eng.load_hotkeys() == expected
+
+def test_engine_reloads_after_external_import(reload_engine, tmp_path):
+    eng = sqlite_engine(reload_engine, HOTKEYS[:3])
+    db_path = eng._sqlite_store.path
+    other = tmp_path / 'team.json'
+    other.write_text(json.dumps(HOTKEYS), encoding='utf-8')
+    assert sqlite_rule_store.main(['import', str(other), db_path]) == 0
+    eng.refresh_hotkeys_cache(force=True)
+    assert [r.id for r in eng.get_snapshot().rules] == [hk['id'] for hk in HOTKEYS]
+
+def test_storage_benchmark_compares_backends():
+    from benchmarks import storage_bench
+    report = storage_bench.run_benchmark([50], repeat=3, lookups=20)
+    rows = report['results']
+    assert {(r['op'], r['backend']) for r in rows} == (
+        {(op, b) for op in storage_bench.OPS if op != 'update' for b in storage_bench.BACKENDS}
+        | {('update', m) for m in storage_bench.STORAGE_MODES})
+    for r in rows:
+        assert r['rules'] == 50 and 0 < r['p50_us'] <= r['max_us']
+    json.dumps(report)
+    assert 'p50' in storage_bench.format_table(report, report)
@@ -0,0 +1,130 @@
+import json
+import pytest
+
+import rule_journal
+
+HOTKEYS = [{'id': f'h{i}', 'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': i}, 'action': f'run {i}'}
+           for i in range(20)]
+
+def count_writes(eng, monkeypatch):
+    writes = []
+    real = eng._atomic_write_bytes
+    monkeypatch.setattr(eng, '_atomic_write_bytes', lambda path, blob: writes.append(path) or real(path, blob))
+    return writes
+
+def test_batch_commits_once(reload_engine, monkeypatch):
+    eng = reload_engine(HOTKEYS)
+    gen = eng.get_snapshot().generation
+    writes = count_writes(eng, monkeypatch)
+    with eng.transaction() as tx:
+        for i in range(0, 20, 2):
+            tx.set_enabled(f'h{i}', False)
+        tx.update('h1', action='run updated')
+        tx.delete('h3')
+        new_ids = [tx.add({'type': 'keyboard', 'combo': {'mods': ['Alt'], 'vk': 50 + i}, 'action': 'x'})
+                   for i in range(100)]
+        assert tx.get('h1')['action'] == 'run updated' and 'h3' not in tx
+        assert writes == []
+    assert len(writes) == 1
+    snap = eng.get_snapshot()
+    assert snap.generation == gen + 1 and tx.snapshot is snap
+    assert len(snap.rules) == 119 and [r.id for r in snap.rules][-100:] == new_ids
+    assert snap.by_id['h0'].enabled is False and snap.by_id['h1'].action == 'run updated'
+    assert [r.id for r in snap.rules][:3] == ['h0', 'h1', 'h2']
+    with open(eng.HOTKEYS_FILE, 'r', encoding='utf-8') as f:
+        assert len(json.load(f)) == 119
+
+def test_rollback_and_validation_write_nothing(reload_engine, monkeypatch):
+    eng = reload_engine(HOTKEYS)
+    gen = eng.get_snapshot().generation
+    writes = count_writes(eng, monkeypatch)
+    with pytest.raises(RuntimeError):
+        with eng.transaction() as tx:
+            tx.delete('h0')
+            raise RuntimeError('отмена')
+    with pytest.raises(KeyError):
+        eng.transaction().update('missing', action='x')
+    tx = eng.transaction()
+    tx.add({'type': 'mouse', 'action': 'x'})
+    with pytest.raises(ValueError):
+        tx.commit()
+    with pytest.raises(ValueError):
+        eng.transaction().replace_all([{'type': 'keyboard'}, 'bad'])
+    assert writes == [] and eng.get_snapshot().generation == gen
+    # Пустая транзакция ничего не пишет
+    with eng.transaction():
+        pass
+    assert writes == []
+
+def test_commit_replays_onto_concurrent_change(reload_engine):
+    eng = reload_engine(HOTKEYS)
+    tx = eng.transaction()
+    tx.set_enabled('h5', False)
+    tx.delete('h6')
+    # Пока транзакция открыта, конфиг меняет другой писатель
+    other = eng.load_hotkeys()
+    other[7]['action'] = 'run external'
+    del other[6]
+    eng.save_hotkeys(other)
+    snap = tx.commit()
+    assert snap.by_id['h7'].action == 'run external'
+    assert snap.by_id['h5'].enabled is False and 'h6' not in snap.by_id
+    with pytest.raises(RuntimeError):
+        tx.commit()
+
+def test_repository_addresses_rules_by_id(reload_engine, monkeypatch):
+    twin = {'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 1}, 'action': 'run same'}
+    eng = reload_engine([dict(twin, id='a'), dict(twin, id='b'),
+                                   {'id': 'g', 'type': 'trackpad', 'gesture': 'Тап', 'action': 'run g'}])
+    repo = eng.get_rule_repository()
+    assert repo.ids() == ['a', 'b', 'g'] and len(repo) == 3 and 'b' in repo
+    assert [h['id'] for h in repo.list('trackpad')] == ['g']
+    writes = count_writes(eng, monkeypatch)
+    # Одинаковые по содержимому правила различаются по id
+    assert repo.set_enabled('b', False) is True
+    assert repo.get('a').get('enabled', True) and repo.get('b')['enabled'] is False
+    assert repo.set_enabled('b', False) is False  # без изменений — без записи
+    assert len(writes) == 1
+    repo.update('a', {'action': 'run a'}, note='kept')
+    assert repo.get('a')['action'] == 'run a' and repo.get('a')['combo']['vk'] == 1
+    new_id = repo.add({'type': 'keyboard', 'combo': {'mods': [], 'vk': 9}, 'action': 'run new'})
+    repo.delete('a')
+    assert repo.ids() == ['b', 'g', new_id]
+    assert repo.get('a') is None
+    with pytest.raises(KeyError):
+        repo.delete('a')
+
+@pytest.mark.parametrize('mode', ['json', 'journal', 'sqlite'])
+def test_single_rule_edit_patches_snapshot(reload_engine, tmp_path, monkeypatch, mode):
+    eng = reload_engine(HOTKEYS)
+    eng.SETTINGS_PATH = str(tmp_path / 'settings.json')
+    with open(eng.SETTINGS_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'hotkeys_storage': mode}, f)
+    eng._load_general_settings(force=True)
+    eng.get_snapshot()
+    # Правка одного правила не пересобирает снимок и не сравнивает весь набор
+    monkeypatch.setattr(eng.RuleSnapshot, 'build', lambda *a, **k: pytest.fail('полная сборка снимка'))
+    monkeypatch.setattr(rule_journal, 'diff_hotkeys', lambda *a, **k: pytest.fail('сравнение всего набора'))
+    records = []
+    if mode == 'sqlite':
+        real = eng._sqlite_store.apply_records
+        monkeypatch.setattr(eng._sqlite_store, 'apply_records', lambda recs: records.extend(recs) or real(recs))
+    repo = eng.get_rule_repository()
+    assert repo.set_enabled('h3', False)
+    repo.update('h5', action='run five')
+    with eng.transaction() as tx:
+        tx.delete('h7')
+        tx.add({'id': 'h7', 'type': 'keyboard', 'combo': {'mods': ['Cmd'], 'vk': 7}, 'action': 'run again'})
+    if mode == 'sqlite':
+        assert [r['op'] for r in records] == ['enable', 'upsert', 'delete', 'upsert']
+    monkeypatch.undo()
+    snap = eng.get_snapshot()
+    assert [r.id for r in snap.rules][-1] == 'h7' and snap.by_id['h3'].enabled is False
+    assert snap.keyboard.lookup(5, snap.by_id['h5'].mods, True)[0].action == 'run five'
+    assert not snap.keyboard.lookup(3, snap.by_id['h3'].mods, True)
+    eng.refresh_hotkeys_cache(force=True)
+    assert eng.load_hotkeys() == [r.to_dict() for r in snap.rules]
+    if mode == 'json':
+        # Запись по фрагментам правил даёт те же байты, что json.dumps всего набора
+        with open(eng.HOTKEYS_FILE, 'rb') as f:
+            assert f.read() == json.dumps(eng.load_hotkeys(), ensure_ascii=False, indent=2).encode('utf-8')
@@ -2,13 +2,10 @@ import ctypes
 import threading
 import time
 from ctypes.util import find_library
-from Quartz import (
-    CGEventCreateKeyboardEvent, CGEventSetFlags,
-    CGEventPost, kCGHIDEventTap, kCGEventFlagMaskCommand,
-)
 import os
 import subprocess
 import sys
+from settings_service import get_settings
 
 # ---
 # АНТИ-ФАНТОМНАЯ ФИЛЬТРАЦИЯ 3/4-FINGER TAP (PHANTOM TAP FILTER)
@@ -46,23 +43,33 @@ def load_multitouch():
             return ctypes.CDLL(lib)
     raise FileNotFoundError("MultitouchSupport.framework not found")
 
-MT = load_multitouch()
-CF = ctypes.CDLL("/System/Library/Frameworks/CoreFoundation.framework/CoreFoundation")
 CFArrayRef = ctypes.c_void_p
 CFIndex = ctypes.c_long
-CF.CFArrayGetCount.argtypes = [CFArrayRef]
-CF.CFArrayGetCount.restype = CFIndex
-CF.CFArrayGetValueAtIndex.argtypes = [CFArrayRef, CFIndex]
-CF.CFArrayGetValueAtIndex.restype = ctypes.c_void_p
-
 CB_TYPE = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.POINTER(ctypes.c_void_p), ctypes.c_int, ctypes.c_double, ctypes.c_int)
-MT.MTDeviceCreateList.restype = CFArrayRef
-MT.MTRegisterContactFrameCallback.argtypes = [ctypes.c_void_p, CB_TYPE]
-MT.MTDeviceStart.argtypes = [ctypes.c_void_p, ctypes.c_int]
-try:
-    MT.MTDeviceStop.argtypes = [ctypes.c_void_p]
-except Exception:
-    pass
+
+# Фреймворки загружаются при первом запуске движка (load_frameworks), а не при импорте модуля:
+# процесс успевает запустить слушатель клавиатуры раньше, чем дойдёт до трекпада
+MT = None
+CF = None
+
+def load_frameworks():
+    global MT, CF
+    if MT is None:
+        mt = load_multitouch()
+        cf = ctypes.CDLL("/System/Library/Frameworks/CoreFoundation.framework/CoreFoundation")
+        cf.CFArrayGetCount.argtypes = [CFArrayRef]
+        cf.CFArrayGetCount.restype = CFIndex
+        cf.CFArrayGetValueAtIndex.argtypes = [CFArrayRef, CFIndex]
+        cf.CFArrayGetValueAtIndex.restype = ctypes.c_void_p
+        mt.MTDeviceCreateList.restype = CFArrayRef
+        mt.MTRegisterContactFrameCallback.argtypes = [ctypes.c_void_p, CB_TYPE]
+        mt.MTDeviceStart.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        try:
+            mt.MTDeviceStop.argtypes = [ctypes.c_void_p]
+        except Exception:
+            pass
+        MT, CF = mt, cf
+    return MT, CF
 
 class MTPoint(ctypes.Structure):
     _fields_ = [("x", ctypes.c_float), ("y", ctypes.c_float)]
@@ -85,11 +92,10 @@ SYNC_ANGLE_THRESHOLD = 20  # градусы, допустимое расхожд
 GESTURE_RELEASE_GAP = 0.02  # минимальная пауза (сек) пустого трекпада (ускорено для быстрого повторного тапа)
 
 class TrackpadGestureEngine:
-    def __init__(self, get_gesture_actions, run_action_func, get_active_app_name_func=None):
-            # Основные колбэки и зависимости
-            self.get_gesture_actions = get_gesture_actions
+    def __init__(self, get_rule_table, run_action_func):
+            # Основные колбэки и зависимости (get_rule_table -> rules.RuleTable активного приложения)
+            self.get_rule_table = get_rule_table
             self.run_action = run_action_func
-            self.get_active_app_name = get_active_app_name_func
 
             # Служебные структуры состояния жеста
             self._active = {}               # active fingers: fid -> (x,y,ts_down)
@@ -131,6 +137,7 @@ class TrackpadGestureEngine:
                 return
             
             logger.info("Запуск trackpad engine...")
+            load_frameworks()
             
             # Получаем список устройств
             dev_array = MT.MTDeviceCreateList()
@@ -501,50 +508,31 @@ class TrackpadGestureEngine:
             return
         self._gesture_last_fire[gesture_name] = now
         
-        actions = self.get_gesture_actions()
-        logger.debug(f"[GESTURE] Found {len(actions)} total actions")
-        
-        matching_actions = [hk for hk in actions if hk.get('type') == 'trackpad' and hk.get('gesture') == gesture_name]
-        logger.debug(f"[GESTURE] Found {len(matching_actions)} matching trackpad actions for '{gesture_name}'")
+        # Таблица активного приложения: app-правила уже наложены на глобальные, область не проверяется
+        matching = self.get_rule_table().gestures.get(gesture_name, ())
+        logger.debug(f"[GESTURE] Found {len(matching)} matching trackpad actions for '{gesture_name}'")
         
-        for hk in actions:
-            if hk.get('type') == 'trackpad' and hk.get('gesture') == gesture_name:
-                logger.debug(f"[GESTURE] Processing action: {hk}")
-                scope = hk.get('scope', 'global')
-                app = hk.get('app', '')
-                if scope == 'app' and app and self.get_active_app_name:
-                    active_app = self.get_active_app_name()
-                    logger.debug(f"[GESTURE] App scope check: need={app}, active={active_app}")
-                    if not active_app or app not in active_app:
-                        logger.debug(f"[GESTURE] Skipping action - app mismatch")
-                        continue
-                logger.debug(f"[GESTURE] Executing action: {hk.get('action')}")
-                self.run_action(hk.get('action'))
+        for rule in matching:
+            logger.debug(f"[GESTURE] Executing action: {rule.action}")
+            self.run_action(rule.action)
 
     # --- Settings integration ---
     def _load_gesture_settings(self):
-        """Пытаемся загрузить gesture настройки из settings.json (не критично). Формат:
+        """Gesture-настройки из общего сервиса settings.json (не критично). Формат:
         {
           "gesture_debounce": 0.5,
           "gesture_release_gap": 0.03
         }
+        Изменения из окна настроек приходят подпиской, без повторного чтения файла.
         """
         try:
-            import json, os
-            # Используем единый путь с hotkey_engine/ui (Application Support)
-            settings_path = os.path.join(os.path.expanduser('~'), 'Library', 'Application Support', 'HotkeyMaster', 'settings.json')
-            if not os.path.exists(settings_path):
-                return
-            st = os.stat(settings_path)
-            if not hasattr(self, '_settings_mtime') or self._settings_mtime != st.st_mtime:
-                with open(settings_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                gd = data.get('gesture_debounce')
-                if isinstance(gd, (int, float)) and gd >= 0:
-                    self._gesture_debounce = float(gd)
-                rg = data.get('gesture_release_gap')
-                if isinstance(rg, (int, float)) and 0 <= rg <= 0.5:
-                    self._release_gap = float(rg)
-                self._settings_mtime = st.st_mtime
+            settings = get_settings()
+            self._apply_gesture_settings()
+            settings.subscribe(self._apply_gesture_settings, keys=('gesture_debounce', 'gesture_release_gap'))
         except Exception:
-            pass
\ No newline at end of file
+            pass
+
+    def _apply_gesture_settings(self, _changes=None):
+        settings = get_settings()
+        self._gesture_debounce = settings.get_float('gesture_debounce', self._gesture_debounce, min_value=0)
+        self._release_gap = settings.get_float('gesture_release_gap', self._release_gap, 0, 0.5)
\ No newline at end of file
@@ -1,6 +1,10 @@
 """Настройки HotkeyMaster — стабильная переработанная версия UI."""
 from PyQt5 import QtWidgets, QtCore, QtGui
 import sys, os, json, logging
+import modifiers
+from modifiers import Mod
+from frontmost_app import bundle_id_for_app_name
+from settings_service import get_settings
 
 logger = logging.getLogger('hotkeymaster.ui')
 
@@ -29,25 +33,30 @@ def _qt_to_vk(k):
 
 
 class HotkeyInput(QtWidgets.QLineEdit):
-    ORDER = ['ctrl', 'alt', 'shift', 'cmd']
     def __init__(self, parent=None, callback=None):
         super().__init__(parent)
-        self._mods=set(); self._vk=None; self._disp=''; self._cb=callback
+        self._mask=0; self._vk=None; self._disp=''; self._cb=callback
         self.setReadOnly(True); self.setPlaceholderText('Нажмите комбинацию...')
 
+    def set_combo(self, combo):
+        """Заполнить поле из сохранённого combo ({'mods':[...], 'vk':..., 'disp':...})."""
+        self._mask=modifiers.parse_mods(combo.get('mods',[]), ignore_unknown=True)
+        self._vk=combo.get('vk'); self._disp=combo.get('disp',''); self.setText(self._disp)
+
     def keyPressEvent(self, e: QtGui.QKeyEvent):
         if e.isAutoRepeat(): e.accept(); return
-        self._mods.clear(); m=e.modifiers()
+        mask=0; m=e.modifiers()
         # На некоторых конфигурациях macOS Qt путает Control / Command (Meta) – добавим корректировку
         if sys.platform == 'darwin':
             # Обнаруженный инверс: ControlModifier соответствует фактической Cmd, MetaModifier -> Ctrl
-            if m & QtCore.Qt.ControlModifier: self._mods.add('cmd')
-            if m & QtCore.Qt.MetaModifier: self._mods.add('ctrl')
+            if m & QtCore.Qt.ControlModifier: mask|=Mod.CMD
+            if m & QtCore.Qt.MetaModifier: mask|=Mod.CTRL
         else:
-            if m & QtCore.Qt.ControlModifier: self._mods.add('ctrl')
-            if m & QtCore.Qt.MetaModifier: self._mods.add('cmd')
-        if m & QtCore.Qt.AltModifier: self._mods.add('alt')
-        if m & QtCore.Qt.ShiftModifier: self._mods.add('shift')
+            if m & QtCore.Qt.ControlModifier: mask|=Mod.CTRL
+            if m & QtCore.Qt.MetaModifier: mask|=Mod.CMD
+        if m & QtCore.Qt.AltModifier: mask|=Mod.ALT
+        if m & QtCore.Qt.ShiftModifier: mask|=Mod.SHIFT
+        self._mask=int(mask)
         k=e.key()
         if k not in _MOD_KEYS:
             vk=_qt_to_vk(k)
@@ -57,15 +66,21 @@ class HotkeyInput(QtWidgets.QLineEdit):
             if self._vk in _REV_DIG: key=_REV_DIG[self._vk]
             elif self._vk in _REV_LET: key=_REV_LET[self._vk]
             else: key=_REV_FN.get(self._vk, f'VK_{self._vk}')
-        parts=[m.capitalize() for m in self.ORDER if m in self._mods]
+        parts=modifiers.mask_to_names(self._mask)
         if key: parts.append(key)
         self._disp=' + '.join(parts) or '...'; self.setText(self._disp)
         if self._cb: QtCore.QTimer.singleShot(0, self._cb)
         e.accept()
 
     def keyReleaseEvent(self, e): e.accept()
-    def get_combo(self): return {'mods':sorted(self._mods), 'vk':self._vk, 'disp':(self._disp if self._vk is not None else '')}
+    def get_combo(self): return {'mods':modifiers.mask_to_names(self._mask), 'vk':self._vk, 'disp':(self._disp if self._vk is not None else '')}
+
 
+def _hk_disp(h):
+    """Подпись правила в списке: комбинация, цепочка ударов последовательности или жест."""
+    if h.get('type','keyboard')=='trackpad': return h.get('gesture','')
+    if h.get('sequence'): return ' → '.join(c.get('disp','') for c in h['sequence'] if isinstance(c,dict))
+    return (h.get('combo') or {}).get('disp','')
 
 def get_applications():
     res=[]
@@ -79,10 +94,10 @@ def get_applications():
 
 
 class SettingsWindow(QtWidgets.QDialog):
-    def __init__(self, load_hotkeys, save_hotkeys):
+    def __init__(self, repository):
         super().__init__()
-        self.load_hotkeys = load_hotkeys
-        self.save_hotkeys = save_hotkeys
+        # Правила адресуются по id (hotkey_engine.RuleRepository), без поиска по списку
+        self.repo = repository
         logger.debug('Init SettingsWindow')
         self.setWindowTitle('HotkeyMaster — Настройки')
         self.resize(900, 560)
@@ -198,8 +213,8 @@ class SettingsWindow(QtWidgets.QDialog):
         self._stack.addWidget(self._page_details)
         self.detail_scroll.setWidget(self._stack_container)
 
-        # --- Путь настроек ---
-        self._settings_path = os.path.join(os.path.expanduser('~'), 'Library', 'Application Support', 'HotkeyMaster', 'settings.json')
+        # --- Настройки (общий сервис: кэш, подписки, отложенная запись) ---
+        self.settings = get_settings()
         self._load_general(); self._load_win_size(); self._install_size_saver()
 
         # Сигналы сохранения общих настроек
@@ -220,26 +235,15 @@ class SettingsWindow(QtWidgets.QDialog):
 
     # ---------- window size persistence ----------
     def _load_win_size(self):
-        if not os.path.exists(self._settings_path): return
-        try:
-            with open(self._settings_path,'r',encoding='utf-8') as f: d=json.load(f)
-            s=d.get('window_size')
-            if isinstance(s,list) and len(s)==2: self.resize(*s)
-        except Exception:
-            pass
+        s=self.settings.get_size('window_size')
+        if s: self.resize(*s)
 
     def _install_size_saver(self):
         orig=self.resizeEvent
         def wrap(ev):
-            try:
-                data={}
-                if os.path.exists(self._settings_path):
-                    with open(self._settings_path,'r',encoding='utf-8') as f: data=json.load(f)
-                data['window_size']=[self.width(), self.height()]
-                os.makedirs(os.path.dirname(self._settings_path), exist_ok=True)
-                with open(self._settings_path,'w',encoding='utf-8') as f: json.dump(data,f,ensure_ascii=False,indent=2)
-            except Exception:
-                pass
+            # Только кэш: в файл размер попадёт одной записью после окончания перетаскивания
+            try: self.settings.set('window_size',[self.width(), self.height()])
+            except Exception: pass
             orig(ev)
         self.resizeEvent=wrap
 
@@ -296,9 +300,9 @@ class SettingsWindow(QtWidgets.QDialog):
         t='keyboard' if idx==1 else 'trackpad'
         try: self.hk_list.itemChanged.disconnect(self._toggle)
         except Exception: pass
-        self.hk_list.clear(); all_h=self.load_hotkeys(); self._filtered=[h for h in all_h if h.get('type','keyboard')==t]
+        self.hk_list.clear(); self._filtered=self.repo.list(t)
         for h in self._filtered:
-            disp=h.get('combo',{}).get('disp') if t=='keyboard' else h.get('gesture','')
+            disp=_hk_disp(h)
             act=self._fmt(t,h.get('action',''))
             scope=h.get('scope','global'); app=h.get('app',''); scope_txt='Глобальный' if scope=='global' else f'Только для: {app}'
             it=QtWidgets.QListWidgetItem(f"{disp}\n{act}\n{scope_txt}")
@@ -314,10 +318,10 @@ class SettingsWindow(QtWidgets.QDialog):
     def _toggle(self, item: QtWidgets.QListWidgetItem):
         r=self.hk_list.row(item)
         if r<0 or r>=len(self._filtered): return
-        hk=self._filtered[r]; hs=self.load_hotkeys()
-        for i,h in enumerate(hs):
-            if h==hk: hs[i]['enabled']=(item.checkState()==QtCore.Qt.Checked); break
-        self.save_hotkeys(hs)
+        hk=self._filtered[r]; enabled=(item.checkState()==QtCore.Qt.Checked)
+        try: self.repo.set_enabled(hk['id'], enabled)
+        except KeyError: self._populate(self.sections.currentRow()); return
+        hk['enabled']=enabled
 
     # ---------- details page ----------
     def _clear_details(self):
@@ -331,10 +335,22 @@ class SettingsWindow(QtWidgets.QDialog):
         if row<0 or row>=len(getattr(self,'_filtered',[])):
             self._clear_details(); return
         hk=self._filtered[row]; self._clear_details(); grid=self._details_layout; r=0
-        if hk.get('type')=='keyboard':
+        if hk.get('type')=='keyboard' and hk.get('sequence'):
+            # Последовательность редактируется в hotkeys.json; здесь — только просмотр
+            grid.addWidget(QtWidgets.QLabel('Последовательность:'),r,0); grid.addWidget(QtWidgets.QLabel(_hk_disp(hk)),r,1); r+=1
+        elif hk.get('type')=='keyboard':
             combo=HotkeyInput(self._page_details, callback=lambda: self._save_inline(row))
-            data=hk.get('combo',{}); combo.setText(data.get('disp','')); combo._mods=set(data.get('mods',[])); combo._vk=data.get('vk'); combo._disp=data.get('disp','')
+            combo.set_combo(hk.get('combo') or {})
             grid.addWidget(QtWidgets.QLabel('Комбинация:'),r,0); grid.addWidget(combo,r,1); r+=1
+            # Поведение при удержании клавиши (repeat_gate): один раз / на каждый автоповтор / не чаще N в секунду
+            repeat_box=QtWidgets.QComboBox(self._page_details); repeat_box.addItems(['Один раз','Повторять при удержании','Не чаще N раз в секунду'])
+            repeat_box.setCurrentIndex({'once':0,'repeat':1,'throttle':2}.get(hk.get('repeat','once'),0))
+            repeat_rate=QtWidgets.QDoubleSpinBox(self._page_details); repeat_rate.setRange(0.5,50.0); repeat_rate.setSingleStep(0.5)
+            repeat_rate.setValue(float(hk.get('repeat_rate') or 5.0)); repeat_rate.setVisible(repeat_box.currentIndex()==2)
+            repeat_box.currentIndexChanged.connect(lambda i: (repeat_rate.setVisible(i==2), self._save_inline(row)))
+            repeat_rate.valueChanged.connect(lambda _ : self._save_inline(row))
+            rep_row=QtWidgets.QHBoxLayout(); rep_row.addWidget(repeat_box); rep_row.addWidget(repeat_rate)
+            grid.addWidget(QtWidgets.QLabel('При удержании:'),r,0); grid.addLayout(rep_row,r,1); r+=1
         else:
             gesture=QtWidgets.QComboBox(self._page_details)
             gesture.addItems(['Тап одним пальцем','Тап двумя пальцами','Тап тремя пальцами','Тап четырьмя пальцами'])
@@ -379,7 +395,7 @@ class SettingsWindow(QtWidgets.QDialog):
         hk_act=HotkeyInput(act_group, callback=lambda: self._save_inline(row))
         if act.startswith('hotkey:'):
             try:
-                c=json.loads(act[7:]); hk_act.setText(c.get('disp','')); hk_act._mods=set(c.get('mods',[])); hk_act._vk=c.get('vk'); hk_act._disp=c.get('disp','')
+                hk_act.set_combo(json.loads(act[7:]))
             except Exception: pass
         bright=QtWidgets.QSpinBox(act_group); bright.setRange(1,100); bright.setValue(85)
         if act.startswith('brightness_set '):
@@ -398,7 +414,7 @@ class SettingsWindow(QtWidgets.QDialog):
         act_type.currentIndexChanged.connect(lambda i: (_adj(i), self._save_inline(row)))
         line.editingFinished.connect(lambda: self._save_inline(row)); bright.valueChanged.connect(lambda _ : self._save_inline(row))
         _adj(act_type.currentIndex())
-        self._page_details._w={'combo':locals().get('combo'),'gesture':locals().get('gesture'),'scope':scope_box,'app':app_box,'atype':act_type,'line':line,'hk_act':hk_act,'bright':bright,'app_action':app_action_box}
+        self._page_details._w={'combo':locals().get('combo'),'gesture':locals().get('gesture'),'repeat':locals().get('repeat_box'),'repeat_rate':locals().get('repeat_rate'),'scope':scope_box,'app':app_box,'atype':act_type,'line':line,'hk_act':hk_act,'bright':bright,'app_action':app_action_box}
         self._cur=row
 
     def _save_inline(self,row):
@@ -407,8 +423,17 @@ class SettingsWindow(QtWidgets.QDialog):
         hk=self._filtered[row]; w=self._page_details._w
         new={'type':hk.get('type','keyboard'),'enabled':hk.get('enabled',True)}
         scope_box=w['scope']; app_box=w['app']; scope='global' if scope_box.currentIndex()==0 else 'app'; new['scope']=scope; new['app']=app_box.currentText() if scope=='app' else ''
+        # Bundle ID точнее имени: правило не сработает в приложении с похожим названием
+        new['bundle_id']=bundle_id_for_app_name(new['app']) if scope=='app' else ''
         if new['type']=='keyboard':
-            combo=w['combo']; new['combo']=combo.get_combo() if combo else {'mods':[], 'vk':None,'disp':''}; new['gesture']=''
+            if hk.get('sequence'):
+                new['sequence']=hk['sequence']; new['combo']=None; new['gesture']=''
+                if 'sequence_timeout' in hk: new['sequence_timeout']=hk['sequence_timeout']
+            else:
+                combo=w['combo']; new['combo']=combo.get_combo() if combo else {'mods':[], 'vk':None,'disp':''}; new['gesture']=''
+            if w.get('repeat') is not None:
+                new['repeat']=('once','repeat','throttle')[w['repeat'].currentIndex()]
+                if new['repeat']=='throttle': new['repeat_rate']=w['repeat_rate'].value()
         else:
             gest=w['gesture']; new['gesture']=gest.currentText() if gest else ''; new['combo']=None
         at=w['atype'].currentIndex(); old_action=hk.get('action','')
@@ -434,56 +459,49 @@ class SettingsWindow(QtWidgets.QDialog):
             new['action']='brightness_up'
         elif at==6:
             new['action']='brightness_down'
-        hs=self.load_hotkeys()
-        for i,h in enumerate(hs):
-            if h==hk and h!=new:
-                logger.debug('Updating hotkey row=%d old_action=%r new_action=%r', row, hk.get('action'), new.get('action'))
-                hs[i]=new; self.save_hotkeys(hs); self._filtered[row]=new
-                disp=new.get('combo',{}).get('disp') if new['type']=='keyboard' else new.get('gesture','')
-                act=self._fmt(new['type'], new.get('action',''))
-                scope_txt='Глобальный' if new['scope']=='global' else f"Только для: {new.get('app','')}"
-                it=self.hk_list.item(row)
-                if it: it.setText(f"{disp}\n{act}\n{scope_txt}")
-                break
+        # Поля, которых нет в форме (id, sequence, неизвестные ключи), сохраняются
+        try: changed=self.repo.update(hk['id'], new)
+        except KeyError: self._populate(self.sections.currentRow()); return
+        if not changed: return
+        logger.debug('Updating hotkey row=%d old_action=%r new_action=%r', row, hk.get('action'), new.get('action'))
+        new={**hk, **new}; self._filtered[row]=new
+        disp=_hk_disp(new)
+        act=self._fmt(new['type'], new.get('action',''))
+        scope_txt='Глобальный' if new['scope']=='global' else f"Только для: {new.get('app','')}"
+        it=self.hk_list.item(row)
+        if it: it.setText(f"{disp}\n{act}\n{scope_txt}")
 
     # ---------- add/delete ----------
     def _add(self):
         idx=self.sections.currentRow(); t='keyboard' if idx==1 else 'trackpad'
         if t=='keyboard': new={'type':'keyboard','combo':{'mods':[], 'vk':None,'disp':''},'action':'open https://','scope':'global','app':'','enabled':True,'gesture':''}
         else: new={'type':'trackpad','gesture':'Тап двумя пальцами','action':'open https://','scope':'global','app':'','enabled':True,'combo':None}
-        hs=self.load_hotkeys(); hs.append(new); self.save_hotkeys(hs); self._populate(idx); self.hk_list.setCurrentRow(self.hk_list.count()-1)
+        self.repo.add(new); self._populate(idx); self.hk_list.setCurrentRow(self.hk_list.count()-1)
 
     def _del(self):
         idx=self.sections.currentRow(); row=self.hk_list.currentRow()
         if idx==0 or row<0 or row>=len(self._filtered): return
-        tgt=self._filtered[row]; hs=self.load_hotkeys()
-        for i,h in enumerate(hs):
-            if h==tgt: del hs[i]; break
-        self.save_hotkeys(hs); self._populate(idx)
+        try: self.repo.delete(self._filtered[row]['id'])
+        except KeyError: pass
+        self._populate(idx)
 
     # ---------- general settings ----------
     def _load_general(self):
-        data={}
-        try:
-            with open(self._settings_path,'r',encoding='utf-8') as f: data=json.load(f)
-        except Exception: pass
+        st=self.settings
         actual=False
         try:
             from autolaunch import AutoLaunchManager
             actual=AutoLaunchManager.is_autolaunch_enabled()
         except Exception: pass
         self.cb_autostart.setChecked(actual)
-        self.cb_strict.setChecked(bool(data.get('strict_mod_match',False)))
-        gd=data.get('gesture_debounce'); rg=data.get('gesture_release_gap')
-        if isinstance(gd,(int,float)) and 0<=gd<=3: self.sb_debounce.setValue(float(gd))
-        if isinstance(rg,(int,float)) and 0<=rg<=0.5: self.sb_release.setValue(float(rg))
+        self.cb_strict.setChecked(st.get_bool('strict_mod_match'))
+        self.sb_debounce.setValue(st.get_float('gesture_debounce',self.sb_debounce.value(),0,3))
+        self.sb_release.setValue(st.get_float('gesture_release_gap',self.sb_release.value(),0,0.5))
 
     def _save_general(self):
+        # Меняются только ключи окна; движки получают новые значения подпиской, файл пишется позже
         data={'autostart':self.cb_autostart.isChecked(),'strict_mod_match':self.cb_strict.isChecked(),'gesture_debounce':round(self.sb_debounce.value(),2),'gesture_release_gap':round(self.sb_release.value(),3)}
-        try:
-            os.makedirs(os.path.dirname(self._settings_path),exist_ok=True)
-            with open(self._settings_path,'w',encoding='utf-8') as f: json.dump(data,f,ensure_ascii=False,indent=2)
-        except Exception: pass
+        self.settings.update(data)
         try:
             from autolaunch import AutoLaunchManager
             if data['autostart']: AutoLaunchManager.enable_autostart()
@@ -493,7 +511,7 @@ class SettingsWindow(QtWidgets.QDialog):
 
 _settings_window_ref = None
 
-def show_settings_window(load_hotkeys, save_hotkeys):
+def show_settings_window(repository):
     """Открыть окно настроек (гарантируя один экземпляр)."""
     global _settings_window_ref
     logger.debug('Open settings window request')
@@ -502,7 +520,7 @@ def show_settings_window(load_hotkeys, save_hotkeys):
     if _settings_window_ref and _settings_window_ref.isVisible():
         logger.debug('Settings window already open, focusing')
         _settings_window_ref.raise_(); _settings_window_ref.activateWindow(); return
-    win = SettingsWindow(load_hotkeys, save_hotkeys)
+    win = SettingsWindow(repository)
     _settings_window_ref = win
     win.setWindowModality(QtCore.Qt.ApplicationModal)
     win.setAttribute(QtCore.Qt.WA_DeleteOnClose, True)